@@ -2,12 +2,47 @@ import django
 from django.core.management import color
 from django.db import connection as default_connection
 from django.db.backends.util import truncate_name
+from django.utils.datastructures import SortedDict
 import copy
+import re
+
+
+COLUMN_TYPE_RE = re.compile(r'^\s*([a-z][a-z ]*?)\s*(?:\(\s*(\d+)[^)]*\))?\s*$')
+
+CHAR_COLUMN_TYPES = ('char', 'character', 'varchar', 'character varying')
+
+
+class CommitSQL(object):
+    """
+    A point in a list of SQL statements at which the statements executed so
+    far are committed, releasing the locks they hold.
+
+    This is a commit boundary, so the commit is made by the code executing
+    the statements, which records the evolution's progress along with it.
+    """
+    commit_boundary = True
+
+    def __unicode__(self):
+        return u'-- Commit the changes made so far'
+
+    def __call__(self, cursor, throttle=None):
+        pass
 
 
 class BaseEvolutionOperations(object):
     connection = None
 
+    # Whether the schema of several tables can be introspected at once from
+    # separate connections.
+    supports_parallel_introspection = True
+
+    # Whether several tables can be dropped by a single DROP TABLE.
+    supports_multi_table_drop = True
+
+    # Whether DROP TABLE takes CASCADE, to drop the constraints in other
+    # tables that reference the tables being dropped.
+    supports_drop_cascade = False
+
     def __init__(self, connection = default_connection):
         self.connection = connection
         
@@ -75,6 +110,29 @@ class BaseEvolutionOperations(object):
         qn = self.connection.ops.quote_name
         return ['DROP TABLE %s;' % qn(table_name)]
 
+    def delete_tables(self, table_names):
+        """
+        Returns the SQL for dropping several tables, with as few statements
+        as possible. The tables are dropped in the order given, so tables
+        should come before the tables they reference.
+        """
+        qn = self.connection.ops.quote_name
+
+        if not table_names:
+            return []
+
+        if not self.supports_multi_table_drop:
+            return ['DROP TABLE %s;' % qn(table_name)
+                    for table_name in table_names]
+
+        sql = 'DROP TABLE %s' % ', '.join([qn(table_name)
+                                           for table_name in table_names])
+
+        if self.supports_drop_cascade:
+            sql += ' CASCADE'
+
+        return [sql + ';']
+
     def add_m2m_table(self, model, f):
         style = color.no_style()
         creation = self.connection.creation
@@ -135,12 +193,16 @@ class BaseEvolutionOperations(object):
 
                 if not f.null:
                     # Only put this sql statement if the column cannot be null.
-                    output.append(self.set_field_null(model, f, f.null))
+                    output.extend(self.get_change_null_sql(model, f, f.null))
             else:
                 params = (qn(model._meta.db_table), qn(f.column), f.db_type(),' '.join([null_constraints, unique_constraints]))
                 output = ['ALTER TABLE %s ADD COLUMN %s %s %s;' % params]
         return output
 
+    def get_change_null_sql(self, model, f, null):
+        "Returns the SQL statements for changing whether a column is null"
+        return [self.set_field_null(model, f, null)]
+
     def set_field_null(self, model, f, null):
         qn = self.connection.ops.quote_name
         params = (qn(model._meta.db_table), qn(f.column),)
@@ -179,7 +241,7 @@ class BaseEvolutionOperations(object):
             # Setting null to True
             opts = model._meta
             params = (qn(opts.db_table), qn(f.column),)
-            output.append(self.set_field_null(model, f, new_null_attr))
+            output.extend(self.get_change_null_sql(model, f, new_null_attr))
         else:
             if initial is not None:
                 output = []
@@ -189,7 +251,7 @@ class BaseEvolutionOperations(object):
                 else:
                     params = (qn(opts.db_table), qn(f.column), qn(f.column))
                     output.append(('UPDATE %s SET %s = %%s WHERE %s IS NULL;' % params, (initial,)))
-            output.append(self.set_field_null(model, f, new_null_attr))
+            output.extend(self.get_change_null_sql(model, f, new_null_attr))
 
         return output
 
@@ -219,12 +281,15 @@ class BaseEvolutionOperations(object):
         else:
             return self.drop_index(model, f)
 
+    def get_unique_constraint_name(self, model, f):
+        return truncate_name('%s_%s_key' % (model._meta.db_table, f.column),
+                             self.connection.ops.max_name_length())
+
     def change_unique(self, model, field_name, new_unique_value, initial=None):
         qn = self.connection.ops.quote_name
         opts = model._meta
         f = opts.get_field(field_name)
-        constraint_name = truncate_name('%s_%s_key' % (opts.db_table, f.column),
-                                        self.connection.ops.max_name_length())
+        constraint_name = self.get_unique_constraint_name(model, f)
 
         if new_unique_value:
             params = (qn(opts.db_table), constraint_name, qn(f.column),)
@@ -232,3 +297,118 @@ class BaseEvolutionOperations(object):
         else:
             params = (qn(opts.db_table), constraint_name,)
             return ['ALTER TABLE %s DROP CONSTRAINT %s;' % params]
+
+    def introspect_tables(self, cursor, table_names):
+        """
+        Returns the live schema of the given tables.
+
+        The result maps the name of each table that exists to a dictionary
+        containing 'columns' (a SortedDict mapping column names to a
+        dictionary of 'type', 'null' and 'max_length') and 'indexes' (a
+        list of dictionaries of 'columns', 'unique' and 'primary_key').
+
+        This generic version uses Django's introspection one table at a
+        time. Backends override it to fetch many tables in bulk.
+        """
+        introspection = self.connection.introspection
+        existing_tables = set(introspection.get_table_list(cursor))
+        schemas = {}
+
+        for table_name in table_names:
+            if table_name not in existing_tables:
+                continue
+
+            columns = SortedDict()
+
+            for row in introspection.get_table_description(cursor,
+                                                           table_name):
+                columns[row[0]] = {
+                    'type': None,
+                    'null': bool(row[6]),
+                    'max_length': None,
+                }
+
+            indexes = [
+                {
+                    'columns': [column_name],
+                    'unique': info['unique'],
+                    'primary_key': info['primary_key'],
+                }
+                for column_name, info in
+                introspection.get_indexes(cursor, table_name).items()
+            ]
+
+            schemas[table_name] = {
+                'columns': columns,
+                'indexes': indexes,
+            }
+
+        return schemas
+
+    def build_table_schemas(self, column_rows, index_rows):
+        """
+        Builds the result of introspect_tables() from catalog query rows.
+
+        column_rows contains (table_name, column_name, data_type, null,
+        max_length) tuples, in column order. index_rows contains
+        (table_name, index_name, column_name, unique, primary_key) tuples,
+        in index column order.
+        """
+        schemas = {}
+
+        for table_name, column_name, data_type, null, max_length in \
+            column_rows:
+            schema = schemas.setdefault(table_name, {
+                'columns': SortedDict(),
+                'indexes': [],
+            })
+
+            if data_type.lower() not in CHAR_COLUMN_TYPES:
+                max_length = None
+            elif max_length is not None:
+                max_length = int(max_length)
+
+            schema['columns'][column_name] = {
+                'type': data_type.lower(),
+                'null': bool(null),
+                'max_length': max_length,
+            }
+
+        indexes = SortedDict()
+
+        for table_name, index_name, column_name, unique, primary_key in \
+            index_rows:
+            if table_name not in schemas:
+                continue
+
+            key = (table_name, index_name)
+
+            if key not in indexes:
+                indexes[key] = {
+                    'columns': [],
+                    'unique': bool(unique),
+                    'primary_key': bool(primary_key),
+                }
+
+                schemas[table_name]['indexes'].append(indexes[key])
+
+            indexes[key]['columns'].append(column_name)
+
+        return schemas
+
+    def parse_column_type(self, column_type):
+        """
+        Splits a declared column type, such as "varchar(20)", into the type
+        name and maximum length.
+        """
+        m = COLUMN_TYPE_RE.match(column_type.lower())
+
+        if not m:
+            return column_type.lower(), None
+
+        data_type, length = m.groups()
+
+        if length is None or data_type not in CHAR_COLUMN_TYPES:
+            return data_type, None
+
+        return data_type, int(length)
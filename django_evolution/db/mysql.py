@@ -1,8 +1,559 @@
+import re
+import sys
+
+from django.conf import settings
 from django.core.management import color
+from django.db import transaction
+from django.db.backends.util import truncate_name
 
+from django_evolution import EvolutionException, is_multi_db
 from common import BaseEvolutionOperations
 
+
+# The online DDL hints to try, from the least to the most blocking. A
+# statement that's rejected with one hint is retried with the next, and then
+# with no hint at all.
+ONLINE_DDL_LEVELS = [
+    'ALGORITHM=INSTANT',
+    'ALGORITHM=INPLACE, LOCK=NONE',
+    'ALGORITHM=INPLACE, LOCK=SHARED',
+    'ALGORITHM=COPY, LOCK=SHARED',
+]
+
+# The hints that don't block writes.
+NON_BLOCKING_ONLINE_DDL_LEVELS = ONLINE_DDL_LEVELS[:2]
+
+# The errors MySQL raises when a statement can't be run with the requested
+# algorithm or lock. A server that doesn't understand a hint at all rejects
+# it as a syntax error. If the statement itself is at fault, the same error
+# is raised when it's run without a hint.
+ONLINE_DDL_ERRORS = (
+    1064, # ER_PARSE_ERROR
+    1845, # ER_ALTER_OPERATION_NOT_SUPPORTED
+    1846, # ER_ALTER_OPERATION_NOT_SUPPORTED_REASON
+)
+
+# MariaDB's version, which it reports after any MySQL version it claims to be
+# compatible with (for instance, "5.5.5-10.2.31-MariaDB").
+MARIADB_VERSION_RE = re.compile(r'(\d{1,2})\.(\d{1,2})\.(\d{1,2})-MariaDB')
+
+ALTER_TABLE_RE = re.compile(r'^ALTER TABLE `([^`]+)` (.*);$', re.S)
+CHANGE_COLUMN_RE = re.compile(r'CHANGE COLUMN `([^`]+)` `([^`]+)`')
+CONSTRAINT_RE = re.compile(r'CONSTRAINT `([^`]+)`')
+FOREIGN_KEY_RE = re.compile(r'^\s*CONSTRAINT `([^`]+)` (FOREIGN KEY .*?),?$',
+                            re.M)
+
+
+class OnlineDDLSQL(object):
+    """
+    An ALTER TABLE, CREATE INDEX or DROP INDEX statement in a list of SQL
+    statements, run with the least blocking algorithm and lock that the
+    server accepts.
+
+    The statement is tried with each hint in turn. MySQL checks a hint
+    before doing any work, so a rejected hint costs nothing. If a
+    ShadowTableCopy is given, it's used in place of the hints that block
+    writes. Whether the table can be copied is only checked when the
+    statement runs, so that earlier changes in the evolution (such as a
+    foreign key referencing the table) are taken into account. If it
+    can't, the hints that block writes are used after all. Once the
+    statement has run, execution_note records how.
+
+    MySQL commits schema changes as they're made, so this is a commit
+    boundary: the evolution's progress is recorded before and after it.
+    """
+    commit_boundary = True
+
+    def __init__(self, sql, levels, shadow_table_copy=None):
+        self.sql = sql
+        self.shadow_table_copy = shadow_table_copy
+        self.execution_note = None
+
+        if shadow_table_copy:
+            self.levels = [
+                level
+                for level in levels
+                if level in NON_BLOCKING_ONLINE_DDL_LEVELS
+            ]
+            self.fallback_levels = [
+                level
+                for level in levels
+                if level not in NON_BLOCKING_ONLINE_DDL_LEVELS
+            ]
+        else:
+            self.levels = levels
+            self.fallback_levels = []
+
+    def get_sql(self, level):
+        "Returns the statement with the given hint"
+        if not level:
+            return self.sql
+
+        sql = self.sql.rstrip(';').rstrip()
+
+        if sql.startswith('ALTER TABLE'):
+            return '%s, %s;' % (sql, level)
+        else:
+            return '%s %s;' % (sql, level.replace(',', ''))
+
+    def __unicode__(self):
+        # The hint is only chosen when the statement runs, so the statement
+        # is shown without one.
+        if self.shadow_table_copy:
+            return u'\n'.join([
+                u'-- Copied through a shadow table if the change would '
+                u'block writes',
+                self.sql,
+            ])
+
+        return self.sql
+
+    def __call__(self, cursor, throttle=None):
+        levels = self.levels
+        shadow_table_copy = self.shadow_table_copy
+        note_suffix = ''
+
+        if shadow_table_copy:
+            reason = shadow_table_copy.get_ineligible_reason(cursor)
+
+            if reason:
+                levels = levels + self.fallback_levels
+                shadow_table_copy = None
+                note_suffix = ' (not copied through a shadow table: %s)' \
+                              % reason
+
+        for level in levels:
+            try:
+                cursor.execute(self.get_sql(level))
+            except Exception, e:
+                if not e.args or e.args[0] not in ONLINE_DDL_ERRORS:
+                    raise
+            else:
+                self.execution_note = '%s -- %s%s' % (self.sql, level,
+                                                      note_suffix)
+                return
+
+        if shadow_table_copy:
+            shadow_table_copy(cursor, throttle)
+            self.execution_note = '%s -- copied through a shadow table' \
+                                  % self.sql
+        else:
+            cursor.execute(self.sql)
+            self.execution_note = '%s -- no online DDL hint was accepted%s' \
+                                  % (self.sql, note_suffix)
+
+
+class ShadowTableCopy(object):
+    """
+    Runs an ALTER TABLE without blocking writes to the table, by copying
+    it, in the way pt-online-schema-change does.
+
+    A shadow table is created with the new schema, and triggers mirror the
+    writes made to the table into it. The existing rows are copied in
+    chunks, in primary key order, committing and checking the throttle
+    after each chunk. The tables are then swapped with a single RENAME
+    TABLE, so writes are only blocked while the swap is made.
+
+    Each chunk is committed, so this is a commit boundary, and must be run
+    under transaction management, as data mutations are.
+
+    The table must have a single-column primary key, no triggers of its
+    own, and no foreign keys referencing it. get_ineligible_reason() checks
+    this. The shadow table's foreign keys are given temporary names, since
+    the names are unique to a database, and are given their original names
+    back once the old table has been dropped.
+    """
+    commit_boundary = True
+
+    def __init__(self, table_name, alter_sql, connection, chunk_size=1000):
+        self.table_name = table_name
+        self.alter_sql = alter_sql
+        self.connection = connection
+        self.chunk_size = chunk_size
+
+        max_length = connection.ops.max_name_length()
+        self.shadow_table_name = truncate_name('_%s_new' % table_name,
+                                               max_length)
+        self.old_table_name = truncate_name('_%s_old' % table_name,
+                                            max_length)
+        self.trigger_names = [
+            truncate_name('%s_osc_%s' % (table_name, event), max_length)
+            for event in ('ins', 'upd', 'del')
+        ]
+
+        # The original names of the shadow table's constraints.
+        self.constraint_names = {}
+
+    def __call__(self, cursor, throttle=None):
+        self._check_table(cursor)
+        self._create_shadow_table(cursor)
+
+        try:
+            columns = self._get_copied_columns(cursor)
+            pk_column = self._get_pk_column(cursor)
+            self._create_triggers(cursor, columns, pk_column)
+            self._copy_rows(cursor, throttle, columns, pk_column)
+            self._execute(cursor,
+                          'RENAME TABLE %(table)s TO %(old_table)s,'
+                          ' %(shadow_table)s TO %(table)s;')
+        except:
+            exc_info = sys.exc_info()
+            self._drop_triggers(cursor)
+            self._execute(cursor, 'DROP TABLE IF EXISTS %(shadow_table)s;')
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+        self._drop_triggers(cursor)
+        self._execute(cursor, 'DROP TABLE %(old_table)s;')
+        self._restore_constraint_names(cursor)
+
+    def get_ineligible_reason(self, cursor):
+        """
+        Returns the reason the table can't be copied through a shadow
+        table, or None if it can.
+        """
+        cursor.execute(
+            'SELECT COUNT(*)'
+            '  FROM information_schema.triggers'
+            ' WHERE event_object_schema = DATABASE()'
+            '   AND event_object_table = %s',
+            [self.table_name])
+
+        if cursor.fetchone()[0]:
+            return 'the table has triggers'
+
+        cursor.execute(
+            'SELECT COUNT(*)'
+            '  FROM information_schema.key_column_usage'
+            ' WHERE referenced_table_schema = DATABASE()'
+            '   AND referenced_table_name = %s',
+            [self.table_name])
+
+        if cursor.fetchone()[0]:
+            return 'foreign keys reference the table'
+
+        if len(self._get_pk_columns(cursor)) != 1:
+            return 'the table needs a single-column primary key'
+
+        return None
+
+    def _execute(self, cursor, sql, params=None):
+        qn = self.connection.ops.quote_name
+        sql = sql % {
+            'table': qn(self.table_name),
+            'shadow_table': qn(self.shadow_table_name),
+            'old_table': qn(self.old_table_name),
+        }
+
+        if params is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, params)
+
+    def check_leftover_tables(self, cursor):
+        """
+        Raises an EvolutionException if an interrupted copy left a shadow
+        table behind.
+        """
+        cursor.execute(
+            'SELECT table_name'
+            '  FROM information_schema.tables'
+            ' WHERE table_schema = DATABASE()'
+            '   AND table_name IN (%s, %s)',
+            [self.shadow_table_name, self.old_table_name])
+        row = cursor.fetchone()
+
+        if row:
+            raise EvolutionException(
+                'Cannot copy %s through a shadow table: %s already exists. '
+                'It was probably left behind by an interrupted copy, and '
+                'needs to be dropped.' % (self.table_name, row[0]))
+
+    def _check_table(self, cursor):
+        self.check_leftover_tables(cursor)
+        reason = self.get_ineligible_reason(cursor)
+
+        if reason:
+            raise EvolutionException(
+                'Cannot copy %s through a shadow table: %s.'
+                % (self.table_name, reason))
+
+    def _create_shadow_table(self, cursor):
+        qn = self.connection.ops.quote_name
+        max_length = self.connection.ops.max_name_length()
+
+        # CREATE TABLE ... LIKE doesn't copy foreign keys, so the shadow
+        # table is created from the table's definition. Constraint names
+        # are unique to a database, so the shadow table's are prefixed.
+        self._execute(cursor, 'SHOW CREATE TABLE %(table)s;')
+        create_sql = cursor.fetchone()[1]
+        create_sql = create_sql.replace(
+            'CREATE TABLE %s' % qn(self.table_name),
+            'CREATE TABLE %s' % qn(self.shadow_table_name), 1)
+
+        def rename_constraint(m):
+            name = truncate_name('_%s' % m.group(1), max_length)
+            self.constraint_names[name] = m.group(1)
+
+            return 'CONSTRAINT %s' % qn(name)
+
+        create_sql = CONSTRAINT_RE.sub(rename_constraint, create_sql)
+
+        cursor.execute(create_sql)
+
+        try:
+            self._execute(cursor,
+                          'ALTER TABLE %%(shadow_table)s %s;'
+                          % self.alter_sql.replace('%', '%%'))
+        except:
+            exc_info = sys.exc_info()
+            self._execute(cursor, 'DROP TABLE %(shadow_table)s;')
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _get_columns(self, cursor, table_name):
+        cursor.execute(
+            'SELECT column_name'
+            '  FROM information_schema.columns'
+            ' WHERE table_schema = DATABASE()'
+            '   AND table_name = %s'
+            ' ORDER BY ordinal_position',
+            [table_name])
+
+        return [row[0] for row in cursor.fetchall()]
+
+    def _get_copied_columns(self, cursor):
+        """
+        Returns a list of (column, shadow_column) pairs for the columns
+        whose values are copied to the shadow table.
+        """
+        renamed_columns = dict(CHANGE_COLUMN_RE.findall(self.alter_sql))
+        shadow_columns = self._get_columns(cursor, self.shadow_table_name)
+
+        return [
+            (column, renamed_columns.get(column, column))
+            for column in self._get_columns(cursor, self.table_name)
+            if renamed_columns.get(column, column) in shadow_columns
+        ]
+
+    def _get_pk_columns(self, cursor):
+        cursor.execute(
+            'SELECT column_name'
+            '  FROM information_schema.key_column_usage'
+            ' WHERE table_schema = DATABASE()'
+            '   AND table_name = %s'
+            "   AND constraint_name = 'PRIMARY'",
+            [self.table_name])
+
+        return [row[0] for row in cursor.fetchall()]
+
+    def _get_pk_column(self, cursor):
+        pk_columns = self._get_pk_columns(cursor)
+
+        if len(pk_columns) != 1:
+            raise EvolutionException(
+                'Cannot copy %s through a shadow table: the table needs a '
+                'single-column primary key.' % self.table_name)
+
+        return pk_columns[0]
+
+    def _restore_constraint_names(self, cursor):
+        """
+        Gives the foreign keys copied to the shadow table their original
+        names back, now that the old table has been dropped.
+
+        Foreign keys can't be renamed, so each is dropped and added again
+        in a single ALTER TABLE. With foreign_key_checks off, that's done
+        in place, without checking the rows again.
+        """
+        qn = self.connection.ops.quote_name
+        self._execute(cursor, 'SHOW CREATE TABLE %(table)s;')
+        changes = []
+
+        for name, definition in FOREIGN_KEY_RE.findall(cursor.fetchone()[1]):
+            if name in self.constraint_names:
+                changes += [
+                    'DROP FOREIGN KEY %s' % qn(name),
+                    'ADD CONSTRAINT %s %s'
+                    % (qn(self.constraint_names[name]), definition),
+                ]
+
+        if not changes:
+            return
+
+        cursor.execute('SELECT @@foreign_key_checks;')
+        foreign_key_checks = cursor.fetchone()[0]
+        cursor.execute('SET foreign_key_checks = 0;')
+
+        try:
+            self._execute(cursor, 'ALTER TABLE %%(table)s %s;'
+                                  % ', '.join(changes).replace('%', '%%'))
+        finally:
+            cursor.execute('SET foreign_key_checks = %d;'
+                           % int(foreign_key_checks))
+
+    def _create_triggers(self, cursor, columns, pk_column):
+        qn = self.connection.ops.quote_name
+        params = {
+            'columns': ', '.join([
+                qn(shadow_column)
+                for column, shadow_column in columns
+            ]),
+            'values': ', '.join([
+                'NEW.%s' % qn(column)
+                for column, shadow_column in columns
+            ]),
+            'pk': qn(pk_column),
+        }
+        replace_sql = 'REPLACE INTO %%(shadow_table)s (%(columns)s)' \
+                      ' VALUES (%(values)s)' % params
+        delete_sql = 'DELETE IGNORE FROM %%(shadow_table)s' \
+                     ' WHERE %(pk)s <=> OLD.%(pk)s' % params
+
+        for trigger_name, event, sql in (
+            (self.trigger_names[0], 'INSERT', replace_sql),
+            (self.trigger_names[1], 'UPDATE',
+             'BEGIN %s; %s; END' % (delete_sql, replace_sql)),
+            (self.trigger_names[2], 'DELETE', delete_sql)):
+            self._execute(cursor,
+                          'CREATE TRIGGER %s AFTER %s ON %%(table)s'
+                          ' FOR EACH ROW %s'
+                          % (qn(trigger_name), event, sql))
+
+    def _drop_triggers(self, cursor):
+        qn = self.connection.ops.quote_name
+
+        for trigger_name in self.trigger_names:
+            cursor.execute('DROP TRIGGER IF EXISTS %s;' % qn(trigger_name))
+
+    def _copy_rows(self, cursor, throttle, columns, pk_column):
+        qn = self.connection.ops.quote_name
+        using_args = {}
+
+        if is_multi_db():
+            using_args['using'] = self.connection.alias
+
+        params = {
+            'columns': ', '.join([qn(column) for column, shadow_column
+                                  in columns]),
+            'shadow_columns': ', '.join([qn(shadow_column)
+                                         for column, shadow_column
+                                         in columns]),
+            'pk': qn(pk_column),
+            'offset': self.chunk_size - 1,
+        }
+
+        self._execute(cursor,
+                      'SELECT MIN(%(pk)s), MAX(%(pk)s) FROM %%(table)s;'
+                      % params)
+        start_pk, max_pk = cursor.fetchone()
+
+        if start_pk is None:
+            return
+
+        params['start'] = '>='
+
+        while True:
+            # Rows already mirrored by the triggers are newer than the
+            # rows being copied, so they're kept.
+            self._execute(cursor,
+                          'SELECT %(pk)s FROM %%(table)s'
+                          ' WHERE %(pk)s %(start)s %%%%s AND %(pk)s <= %%%%s'
+                          ' ORDER BY %(pk)s LIMIT 1 OFFSET %(offset)d;'
+                          % params,
+                          [start_pk, max_pk])
+            row = cursor.fetchone()
+
+            if row is None:
+                end_pk = max_pk
+            else:
+                end_pk = row[0]
+
+            self._execute(cursor,
+                          'INSERT LOW_PRIORITY IGNORE INTO %%(shadow_table)s'
+                          ' (%(shadow_columns)s)'
+                          ' SELECT %(columns)s FROM %%(table)s'
+                          ' WHERE %(pk)s %(start)s %%%%s AND %(pk)s <= %%%%s'
+                          ' LOCK IN SHARE MODE;' % params,
+                          [start_pk, end_pk])
+            transaction.commit(**using_args)
+
+            if row is None or end_pk == max_pk:
+                break
+
+            start_pk = end_pk
+            params['start'] = '>'
+
+            if throttle is not None:
+                throttle.wait(getattr(self.connection, 'alias', None))
+
+
 class EvolutionOperations(BaseEvolutionOperations):
+    def get_online_ddl_sql(self, sql):
+        """
+        Returns a list of SQL statements with the schema changes set to run
+        with online DDL hints, based on the server version.
+
+        If DJANGO_EVOLUTION_MYSQL_SHADOW_TABLES is set, ALTER TABLE
+        statements that would block writes are run through a shadow table
+        instead, if the table can be copied when they're run. Otherwise,
+        they fall back on the hints that block writes. The tables aren't
+        inspected here, so generating the SQL (for instance, for --hint or
+        --sql) doesn't query them.
+        """
+        levels = self.get_online_ddl_levels()
+        shadow_tables = getattr(settings,
+                                'DJANGO_EVOLUTION_MYSQL_SHADOW_TABLES', False)
+
+        if not levels and not shadow_tables:
+            return sql
+
+        output = []
+
+        for statement in sql:
+            if not isinstance(statement, basestring):
+                output.append(statement)
+            elif statement.startswith('ALTER TABLE'):
+                m = ALTER_TABLE_RE.match(statement)
+                shadow_table_copy = None
+
+                if shadow_tables and m:
+                    shadow_table_copy = ShadowTableCopy(m.group(1),
+                                                        m.group(2),
+                                                        self.connection)
+
+                if levels or shadow_table_copy:
+                    output.append(OnlineDDLSQL(statement, levels,
+                                               shadow_table_copy))
+                else:
+                    output.append(statement)
+            elif (levels and
+                  (statement.startswith('CREATE INDEX') or
+                   statement.startswith('CREATE UNIQUE INDEX') or
+                   statement.startswith('DROP INDEX'))):
+                # Indexes are never added or dropped instantly.
+                output.append(OnlineDDLSQL(statement,
+                                           ONLINE_DDL_LEVELS[1:]))
+            else:
+                output.append(statement)
+
+        return output
+
+    def add_column(self, model, f, initial):
+        return self.get_online_ddl_sql(
+            super(EvolutionOperations, self).add_column(model, f, initial))
+
+    def delete_column(self, model, f):
+        return self.get_online_ddl_sql(
+            super(EvolutionOperations, self).delete_column(model, f))
+
+    def create_index(self, model, f):
+        return self.get_online_ddl_sql(
+            super(EvolutionOperations, self).create_index(model, f))
+
+    def get_change_null_sql(self, model, f, null):
+        return self.get_online_ddl_sql(
+            super(EvolutionOperations, self).get_change_null_sql(model, f,
+                                                                 null))
+
     def rename_column(self, opts, old_field, f):
         if old_field.column == f.column:
             # No Operation
@@ -38,11 +589,69 @@ class EvolutionOperations(BaseEvolutionOperations):
             )
 
         params = (qn(opts.db_table), qn(old_field.column), ' '.join(field_output))
-        return ['ALTER TABLE %s CHANGE COLUMN %s %s;' % params]
+        return self.get_online_ddl_sql(
+            ['ALTER TABLE %s CHANGE COLUMN %s %s;' % params])
+
+    def get_server_version(self):
+        "Returns the (major, minor, release) version of the MySQL server"
+        return self.connection.get_server_version()
+
+    def get_mariadb_version(self):
+        """
+        Returns the (major, minor, release) version of the server if it's
+        MariaDB, or None if it's MySQL.
+        """
+        # This connects to the server, if needed.
+        self.get_server_version()
+
+        m = MARIADB_VERSION_RE.search(
+            self.connection.connection.get_server_info())
+
+        if m:
+            return tuple([int(x) for x in m.groups()])
+
+        return None
+
+    def get_online_ddl_levels(self):
+        """
+        Returns the online DDL hints the server understands.
+
+        MariaDB's versions don't line up with MySQL's. It understands
+        ALGORITHM and LOCK from 10.0, and ALGORITHM=INSTANT from 10.3.2.
+        """
+        mariadb_version = self.get_mariadb_version()
+
+        if mariadb_version:
+            if mariadb_version >= (10, 3, 2):
+                return ONLINE_DDL_LEVELS
+            elif mariadb_version >= (10, 0):
+                return ONLINE_DDL_LEVELS[1:]
+        else:
+            version = self.get_server_version()
+
+            if version >= (8, 0, 12):
+                return ONLINE_DDL_LEVELS
+            elif version >= (5, 6):
+                return ONLINE_DDL_LEVELS[1:]
+
+        return []
+
+    def change_null(self, model, field_name, new_null_attr, initial=None):
+        output = super(EvolutionOperations, self).change_null(
+            model, field_name, new_null_attr, initial)
+
+        # MODIFY COLUMN restates the whole column, so later changes made to
+        # the field by the same ChangeField need to know whether it's null.
+        # Like change_max_length(), this records the change on the field of
+        # the mutation's mock model.
+        model._meta.get_field(field_name).null = new_null_attr
+
+        return output
 
     def set_field_null(self, model, f, null):
         qn = self.connection.ops.quote_name
         params = (qn(model._meta.db_table), qn(f.column), f.db_type())
+
         if null:
             return 'ALTER TABLE %s MODIFY COLUMN %s %s DEFAULT NULL;' % params
         else:
@@ -52,20 +661,31 @@ class EvolutionOperations(BaseEvolutionOperations):
         qn = self.connection.ops.quote_name
         opts = model._meta
         f = opts.get_field(field_name)
+        old_max_length = f.max_length
         f.max_length = new_max_length
         params = {
             'table': qn(opts.db_table),
             'column': qn(f.column),
             'length': f.max_length,
-            'type': f.db_type()
+            'type': f.db_type(),
+            'null': '%sNULL' % (not f.null and 'NOT ' or ''),
         }
-        return ['UPDATE %(table)s SET %(column)s=LEFT(%(column)s,%(length)d);' % params,
-                'ALTER TABLE %(table)s MODIFY COLUMN %(column)s %(type)s;' % params]
+
+        sql = ['ALTER TABLE %(table)s MODIFY COLUMN %(column)s %(type)s'
+               ' %(null)s;' % params]
+
+        if old_max_length is None or new_max_length < old_max_length:
+            # Only the values that are too long need to be truncated.
+            sql.insert(0, 'UPDATE %(table)s SET %(column)s=LEFT(%(column)s,'
+                          '%(length)d) WHERE CHAR_LENGTH(%(column)s) >'
+                          ' %(length)d;' % params)
+
+        return self.get_online_ddl_sql(sql)
 
     def drop_index(self, model, f):
         qn = self.connection.ops.quote_name
         params = (qn(self.get_index_name(model, f)), qn(model._meta.db_table))
-        return ['DROP INDEX %s ON %s;' % params]
+        return self.get_online_ddl_sql(['DROP INDEX %s ON %s;' % params])
 
     def change_unique(self, model, field_name, new_unique_value, initial=None):
         qn = self.connection.ops.quote_name
@@ -74,10 +694,12 @@ class EvolutionOperations(BaseEvolutionOperations):
         constraint_name = '%s' % (f.column,)
         if new_unique_value:
             params = (constraint_name, qn(opts.db_table), qn(f.column),)
-            return ['CREATE UNIQUE INDEX %s ON %s(%s);' % params]
+            sql = ['CREATE UNIQUE INDEX %s ON %s(%s);' % params]
         else:
             params = (constraint_name, qn(opts.db_table))
-            return ['DROP INDEX %s ON %s;' % params]
+            sql = ['DROP INDEX %s ON %s;' % params]
+
+        return self.get_online_ddl_sql(sql)
 
     def rename_table(self, model, old_db_tablename, db_tablename):
         if old_db_tablename == db_tablename:
@@ -86,3 +708,31 @@ class EvolutionOperations(BaseEvolutionOperations):
         qn = self.connection.ops.quote_name
         params = (qn(old_db_tablename), qn(db_tablename))
         return ['RENAME TABLE %s TO %s;' % params]
+
+    def introspect_tables(self, cursor, table_names):
+        if not table_names:
+            return {}
+
+        placeholders = ', '.join(['%s'] * len(table_names))
+
+        cursor.execute(
+            'SELECT table_name, column_name, data_type,'
+            "       is_nullable = 'YES', character_maximum_length"
+            '  FROM information_schema.columns'
+            ' WHERE table_schema = DATABASE()'
+            '   AND table_name IN (%s)'
+            ' ORDER BY table_name, ordinal_position' % placeholders,
+            table_names)
+        column_rows = cursor.fetchall()
+
+        cursor.execute(
+            'SELECT table_name, index_name, column_name,'
+            "       non_unique = 0, index_name = 'PRIMARY'"
+            '  FROM information_schema.statistics'
+            ' WHERE table_schema = DATABASE()'
+            '   AND table_name IN (%s)'
+            ' ORDER BY table_name, index_name, seq_in_index' % placeholders,
+            table_names)
+        index_rows = cursor.fetchall()
+
+        return self.build_table_schemas(column_rows, index_rows)
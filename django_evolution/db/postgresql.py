@@ -1,10 +1,268 @@
+import django
 from django.core.management import color
 from django.db.backends.util import truncate_name
 
-from common import BaseEvolutionOperations
+from django_evolution import EvolutionException
+from common import BaseEvolutionOperations, CommitSQL
+
+
+class ConcurrentIndexSQL(object):
+    """
+    A CREATE INDEX CONCURRENTLY statement in a list of SQL statements.
+
+    PostgreSQL can't build an index concurrently inside a transaction, so
+    this is a commit boundary. The statements run before it are committed,
+    along with the evolution's progress, and the index is built in
+    autocommit mode. A constraint can then be added using the index.
+
+    If the index can't be built (for instance, because a unique index finds
+    duplicate values), the invalid index that's left behind is dropped. If
+    the constraint can't be added, the index is dropped. Either way, the
+    evolution stops before it's recorded, and running it again resumes
+    with this step. An index or constraint already added by an attempt
+    that was interrupted before recording its progress is kept.
+    """
+    commit_boundary = True
+
+    def __init__(self, sql, index_name, constraint_sql=None):
+        self.sql = sql
+        self.index_name = index_name
+        self.constraint_sql = constraint_sql
+
+    def __unicode__(self):
+        lines = [
+            u'-- Run outside of a transaction, once the changes made so far '
+            u'are committed',
+            self.sql,
+        ]
+
+        if self.constraint_sql:
+            lines.append(self.constraint_sql)
+
+        return u'\n'.join(lines)
+
+    def __call__(self, cursor, throttle=None):
+        db_connection = cursor.connection
+
+        # Both psycopg and psycopg2 use isolation level 0 for autocommit.
+        # Django leaves psycopg connections at level 1.
+        old_isolation_level = getattr(db_connection, 'isolation_level', 1)
+        db_connection.set_isolation_level(0)
+
+        try:
+            self._drop_invalid_index(cursor)
+
+            if not self._has_row(cursor, self.INDEX_EXISTS_SQL):
+                try:
+                    cursor.execute(self.sql)
+                except Exception, e:
+                    self._drop_invalid_index(cursor)
+                    raise EvolutionException(
+                        'Unable to create the index %s: %s'
+                        % (self.index_name, str(e).strip()))
+
+            if (self.constraint_sql and
+                not self._has_row(cursor, self.CONSTRAINT_EXISTS_SQL)):
+                try:
+                    cursor.execute(self.constraint_sql)
+                except Exception, e:
+                    cursor.execute('DROP INDEX IF EXISTS %s;'
+                                   % self.index_name)
+                    raise EvolutionException(
+                        'Unable to add a constraint using the index %s: %s'
+                        % (self.index_name, str(e).strip()))
+        finally:
+            db_connection.set_isolation_level(old_isolation_level)
+
+    INDEX_EXISTS_SQL = (
+        'SELECT 1'
+        '  FROM pg_catalog.pg_class i'
+        ' WHERE i.relname = %s'
+        "   AND i.relkind = 'i'"
+        '   AND pg_catalog.pg_table_is_visible(i.oid)')
+
+    CONSTRAINT_EXISTS_SQL = (
+        'SELECT 1'
+        '  FROM pg_catalog.pg_constraint c'
+        ' INNER JOIN pg_catalog.pg_class i ON i.oid = c.conindid'
+        ' WHERE i.relname = %s'
+        '   AND pg_catalog.pg_table_is_visible(i.oid)')
+
+    def _has_row(self, cursor, sql):
+        cursor.execute(sql, [self.index_name])
+
+        return cursor.fetchone() is not None
+
+    def _drop_invalid_index(self, cursor):
+        cursor.execute(
+            'SELECT 1'
+            '  FROM pg_catalog.pg_index ix'
+            ' INNER JOIN pg_catalog.pg_class i ON i.oid = ix.indexrelid'
+            ' WHERE i.relname = %s'
+            '   AND NOT ix.indisvalid'
+            '   AND pg_catalog.pg_table_is_visible(i.oid)',
+            [self.index_name])
+
+        if cursor.fetchone():
+            cursor.execute('DROP INDEX %s;' % self.index_name)
 
 
 class EvolutionOperations(BaseEvolutionOperations):
+    supports_drop_cascade = True
+
+    def get_server_version(self):
+        "Returns the (major, minor) version of the PostgreSQL server"
+        return self.connection.ops.postgres_version[:2]
+
+    def add_column(self, model, f, initial):
+        """
+        Returns the SQL for adding a column.
+
+        On PostgreSQL 9.1 and higher, foreign keys on columns backfilled
+        with an initial value aren't created inline. The column is added
+        and backfilled first, and the constraint is then added as NOT
+        VALID, which doesn't check the existing rows. Once that's
+        committed, the constraint is validated, which doesn't block writes
+        to either table. A column without an initial value is all NULL,
+        so its constraint has nothing to check, and is created inline.
+
+        The commit means the change isn't atomic. The evolution's progress
+        is recorded with the commit, so that it can be resumed from the
+        validation if that fails. Everything before the commit is rolled
+        back together, so no constraint is left behind to be dropped.
+        """
+        if (not f.rel or initial is None or
+            self.get_server_version() < (9, 1)):
+            return super(EvolutionOperations, self).add_column(model, f,
+                                                               initial)
+
+        qn = self.connection.ops.quote_name
+        table_name = qn(model._meta.db_table)
+        related_model = f.rel.to
+        constraint_name = qn(self.get_foreign_key_name(model, f))
+
+        if f.unique or f.primary_key:
+            unique_constraints = 'UNIQUE'
+        else:
+            unique_constraints = ''
+
+        params = (table_name, qn(f.column), f.db_type(), unique_constraints)
+        output = ['ALTER TABLE %s ADD COLUMN %s %s %s;' % params]
+
+        if callable(initial):
+            params = (table_name, qn(f.column), initial(), qn(f.column))
+            output.append('UPDATE %s SET %s = %s WHERE %s IS NULL;' % params)
+        else:
+            params = (table_name, qn(f.column), qn(f.column))
+            output.append(('UPDATE %s SET %s = %%s WHERE %s IS NULL;'
+                           % params, (initial,)))
+
+        output += [
+            'ALTER TABLE %s ADD CONSTRAINT %s FOREIGN KEY (%s) '
+            'REFERENCES %s (%s)%s NOT VALID;'
+            % (table_name, constraint_name, qn(f.column),
+               qn(related_model._meta.db_table),
+               qn(related_model._meta.pk.column),
+               self.connection.ops.deferrable_sql()),
+            CommitSQL(),
+            'ALTER TABLE %s VALIDATE CONSTRAINT %s;'
+            % (table_name, constraint_name),
+        ]
+
+        if not f.null:
+            output.extend(self.get_change_null_sql(model, f, f.null))
+
+        return output
+
+    def get_foreign_key_name(self, model, f):
+        """
+        Returns the name of the foreign key constraint added for a field.
+
+        This is the name Django gives the foreign keys it adds to existing
+        tables, which other evolutions expect to find. It can't clash with
+        the names PostgreSQL gives foreign keys created inline, which stay
+        the same when the column is later renamed.
+        """
+        related_model = f.rel.to
+        table_name = model._meta.db_table
+        related_table_name = related_model._meta.db_table
+
+        if django.VERSION >= (1, 2):
+            digest = self.connection.creation._digest(table_name,
+                                                      related_table_name)
+        else:
+            digest = '%x' % abs(hash((table_name, related_table_name)))
+
+        return truncate_name(
+            '%s_refs_%s_%s' % (f.column, related_model._meta.pk.column,
+                               digest),
+            self.connection.ops.max_name_length())
+
+    def get_change_null_sql(self, model, f, null):
+        """
+        Returns the SQL for changing whether a column is null.
+
+        On PostgreSQL 12 and higher, columns are made NOT NULL without
+        scanning the table while it's locked. A NOT VALID check constraint
+        is added, and committed. Validating it only needs a SHARE UPDATE
+        EXCLUSIVE lock, and SET NOT NULL then uses the validated check
+        instead of scanning the table, after which the check is dropped.
+
+        The commit means the change isn't atomic. The evolution's progress
+        is recorded with the commit, so that it can be resumed from the
+        validation if that fails, and a check left behind by an earlier
+        attempt is dropped before it's added again.
+        """
+        if null or self.get_server_version() < (12, 0):
+            return super(EvolutionOperations, self).get_change_null_sql(
+                model, f, null)
+
+        qn = self.connection.ops.quote_name
+        table_name = qn(model._meta.db_table)
+        constraint_name = truncate_name(
+            '%s_%s_notnull' % (model._meta.db_table, f.column),
+            self.connection.ops.max_name_length())
+
+        return [
+            'ALTER TABLE %s DROP CONSTRAINT IF EXISTS %s;'
+            % (table_name, constraint_name),
+            'ALTER TABLE %s ADD CONSTRAINT %s CHECK (%s IS NOT NULL) '
+            'NOT VALID;' % (table_name, constraint_name, qn(f.column)),
+            CommitSQL(),
+            'ALTER TABLE %s VALIDATE CONSTRAINT %s;'
+            % (table_name, constraint_name),
+            self.set_field_null(model, f, null),
+            'ALTER TABLE %s DROP CONSTRAINT %s;'
+            % (table_name, constraint_name),
+        ]
+
+    def change_unique(self, model, field_name, new_unique_value, initial=None):
+        """
+        Adds unique constraints without locking the table while the index is
+        built.
+
+        On PostgreSQL 9.1 and higher, the unique index is built concurrently
+        first, and the constraint is then added using the index. This runs
+        outside of a transaction, once the changes made so far are committed.
+        """
+        if not new_unique_value or self.get_server_version() < (9, 1):
+            return super(EvolutionOperations, self).change_unique(
+                model, field_name, new_unique_value, initial)
+
+        qn = self.connection.ops.quote_name
+        opts = model._meta
+        f = opts.get_field(field_name)
+        constraint_name = self.get_unique_constraint_name(model, f)
+
+        return [
+            ConcurrentIndexSQL(
+                'CREATE UNIQUE INDEX CONCURRENTLY %s ON %s (%s);'
+                % (constraint_name, qn(opts.db_table), qn(f.column)),
+                constraint_name,
+                'ALTER TABLE %s ADD CONSTRAINT %s UNIQUE USING INDEX %s;'
+                % (qn(opts.db_table), constraint_name, constraint_name)),
+        ]
+
     def rename_column(self, opts, old_field, new_field):
         if old_field.column == new_field.column:
             # No Operation
@@ -60,3 +318,37 @@ class EvolutionOperations(BaseEvolutionOperations):
         # By default, Django 1.2 will use a digest hash for the column name.
         # The PostgreSQL support, however, uses the column name itself.
         return '%s_%s' % (model._meta.db_table, f.column)
+
+    def introspect_tables(self, cursor, table_names):
+        if not table_names:
+            return {}
+
+        placeholders = ', '.join(['%s'] * len(table_names))
+
+        cursor.execute(
+            'SELECT table_name, column_name, data_type,'
+            "       is_nullable = 'YES', character_maximum_length"
+            '  FROM information_schema.columns'
+            ' WHERE table_schema = current_schema()'
+            '   AND table_name IN (%s)'
+            ' ORDER BY table_name, ordinal_position' % placeholders,
+            table_names)
+        column_rows = cursor.fetchall()
+
+        cursor.execute(
+            'SELECT t.relname, i.relname, a.attname,'
+            '       ix.indisunique, ix.indisprimary'
+            '  FROM (SELECT indrelid, indexrelid, indisunique, indisprimary,'
+            '               indkey, generate_subscripts(indkey, 1) AS k'
+            '          FROM pg_catalog.pg_index) ix'
+            ' INNER JOIN pg_catalog.pg_class t ON t.oid = ix.indrelid'
+            ' INNER JOIN pg_catalog.pg_class i ON i.oid = ix.indexrelid'
+            ' INNER JOIN pg_catalog.pg_attribute a'
+            '         ON a.attrelid = t.oid AND a.attnum = ix.indkey[ix.k]'
+            ' WHERE t.relname IN (%s)'
+            '   AND pg_catalog.pg_table_is_visible(t.oid)'
+            ' ORDER BY t.relname, i.relname, ix.k' % placeholders,
+            table_names)
+        index_rows = cursor.fetchall()
+
+        return self.build_table_schemas(column_rows, index_rows)
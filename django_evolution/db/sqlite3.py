@@ -1,11 +1,19 @@
 from django.core.management import color
 from django.db import models
+from django.utils.datastructures import SortedDict
 
 from common import BaseEvolutionOperations
 
 TEMP_TABLE_NAME = 'TEMP_TABLE'
 
 class EvolutionOperations(BaseEvolutionOperations):
+    # Test databases may live in memory, where a new connection would see
+    # an empty database.
+    supports_parallel_introspection = False
+
+    # SQLite drops one table per statement.
+    supports_multi_table_drop = False
+
     def delete_column(self, model, f):
         output = []
 
@@ -180,6 +188,11 @@ class EvolutionOperations(BaseEvolutionOperations):
         output.extend(self.create_table(table_name, new_fields, create_index=False))
         output.extend(self.copy_from_temp_table(table_name, new_fields))
         output.extend(self.delete_table(TEMP_TABLE_NAME))
+
+        # Dropping the table also dropped the indexes on the existing
+        # fields. The new field's index is created by the mutation.
+        output.extend(self.create_indexes_for_table(table_name,
+                                                    original_fields))
         return output
 
     def change_null(self, model, field_name, new_null_attr, initial=None):
@@ -206,3 +219,60 @@ class EvolutionOperations(BaseEvolutionOperations):
         output.extend(self.copy_from_temp_table(table_name, fields))
         output.extend(self.delete_table(TEMP_TABLE_NAME))
         return output
+
+    def introspect_tables(self, cursor, table_names):
+        qn = self.connection.ops.quote_name
+        schemas = {}
+
+        # SQLite has no catalog to query in bulk, but the PRAGMAs are local
+        # reads, so a handful of statements per table is cheap.
+        for table_name in table_names:
+            cursor.execute('PRAGMA table_info(%s)' % qn(table_name))
+            rows = cursor.fetchall()
+
+            if not rows:
+                continue
+
+            columns = SortedDict()
+            pk_columns = []
+
+            # cid, name, type, notnull, dflt_value, pk
+            for row in rows:
+                data_type, max_length = self.parse_column_type(row[2])
+                columns[row[1]] = {
+                    'type': data_type,
+                    'null': not row[3] and not row[5],
+                    'max_length': max_length,
+                }
+
+                if row[5]:
+                    pk_columns.append(row[1])
+
+            indexes = []
+
+            if pk_columns:
+                indexes.append({
+                    'columns': pk_columns,
+                    'unique': True,
+                    'primary_key': True,
+                })
+
+            cursor.execute('PRAGMA index_list(%s)' % qn(table_name))
+
+            # seq, name, unique
+            for row in cursor.fetchall():
+                cursor.execute('PRAGMA index_info(%s)' % qn(row[1]))
+
+                # seqno, cid, name
+                indexes.append({
+                    'columns': [info[2] for info in cursor.fetchall()],
+                    'unique': bool(row[2]),
+                    'primary_key': False,
+                })
+
+            schemas[table_name] = {
+                'columns': columns,
+                'indexes': indexes,
+            }
+
+        return schemas
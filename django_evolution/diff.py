@@ -3,7 +3,8 @@ from django.db.models.fields.related import *
 
 from django_evolution import EvolutionException
 from django_evolution.mutations import DeleteField, AddField, DeleteModel, ChangeField
-from django_evolution.signature import ATTRIBUTE_DEFAULTS
+from django_evolution.signals import run_operation
+from django_evolution.signature import ATTRIBUTE_DEFAULTS, SignatureOverlay
 
 try:
     set
@@ -27,16 +28,56 @@ class NullFieldInitialCallback(object):
             % (self.model, self.field, self.app))
 
 
-def get_initial_value(app_label, model_name, field_name):
+# The internal types of field classes, keyed by class. Finding these
+# requires constructing a field, so they're shared between all diffs.
+_field_internal_types = {}
+
+
+def get_field_internal_type(field_type):
+    """Return the internal type of a field class.
+
+    None is returned if the field can't be constructed without arguments.
+    """
+    try:
+        return _field_internal_types[field_type]
+    except KeyError:
+        try:
+            internal_type = field_type().get_internal_type()
+        except TypeError:
+            internal_type = None
+
+        _field_internal_types[field_type] = internal_type
+
+        return internal_type
+
+
+def get_initial_value(app_label, model_name, field_name, model_fields=None):
     """Derive an initial value for a field.
 
     If a default has been provided on the field definition or the field allows
     for an empty string, that value will be used. Otherwise, a placeholder
     callable will be used. This callable cannot actually be used in an
     evolution, but will indicate that user input is required.
+
+    model_fields is an optional dictionary used to cache the fields of each
+    model by name, so that models are only looked up once.
     """
-    model = models.get_model(app_label, model_name)
-    field = model._meta.get_field(field_name)
+    if model_fields is None:
+        model_fields = {}
+
+    key = (app_label, model_name)
+
+    try:
+        fields = model_fields[key]
+    except KeyError:
+        opts = models.get_model(app_label, model_name)._meta
+        fields = dict([
+            (f.name, f)
+            for f in opts.fields + opts.many_to_many
+        ])
+        model_fields[key] = fields
+
+    field = fields.get(field_name, None)
 
     if field and (field.has_default() or
                   (field.empty_strings_allowed and field.blank)):
@@ -45,6 +86,36 @@ def get_initial_value(app_label, model_name, field_name):
     return NullFieldInitialCallback(app_label, model_name, field_name)
 
 
+def get_changed_keys(old, new):
+    """Return the keys that may differ between two signature dictionaries.
+
+    This can only be worked out quickly if one is an overlay of the other,
+    or both are overlays of the same base. Otherwise, None is returned, and
+    every key must be compared.
+    """
+    changed = None
+
+    if isinstance(old, SignatureOverlay):
+        if old.base is new:
+            changed = set(old.get_changed_keys())
+        elif isinstance(new, SignatureOverlay) and new.base is old.base:
+            changed = set(old.get_changed_keys())
+            changed.update(new.get_changed_keys())
+
+    if (changed is None and isinstance(new, SignatureOverlay) and
+        new.base is old):
+        changed = set(new.get_changed_keys())
+
+    if changed is None:
+        return None
+
+    # Sort the keys, so that the diff comes out the same every time.
+    changed = list(changed)
+    changed.sort()
+
+    return changed
+
+
 class Diff(object):
     """
     A diff between two model signatures.
@@ -67,8 +138,14 @@ class Diff(object):
     self.deleted = {
         app_label: [ list of models in deleted app ]
     }
+
+    If app_labels is provided, only those applications are compared. Only
+    their signatures will be built when diffing lazy project signatures.
+
+    Comparing a SignatureOverlay against its base (or two overlays of the
+    same base) only compares the entries the overlays have changed.
     """
-    def __init__(self, original, current):
+    def __init__(self, original, current, app_labels=None):
         self.original_sig = original
         self.current_sig = current
 
@@ -85,11 +162,34 @@ class Diff(object):
                 "Unknown version identifier in target signature: %s",
                 self.current_sig['__version__'])
 
-        for app_name, old_app_sig in original.items():
+        if app_labels is None:
+            app_labels = original.keys()
+
+        run_operation('diff', {}, self._diff_apps, app_labels)
+
+    def _diff_apps(self, app_labels):
+        "Compare the signatures of the given applications"
+        original = self.original_sig
+        changed_app_labels = get_changed_keys(original, self.current_sig)
+
+        if changed_app_labels is not None:
+            app_labels = [
+                app_name
+                for app_name in app_labels
+                if app_name in changed_app_labels
+            ]
+
+        for app_name in app_labels:
             if app_name == '__version__':
                 # Ignore the __version__ tag
                 continue
 
+            old_app_sig = original.get(app_name, None)
+
+            if old_app_sig is None:
+                # App has been added
+                continue
+
             new_app_sig = self.current_sig.get(app_name, None)
 
             if new_app_sig is None:
@@ -97,7 +197,18 @@ class Diff(object):
                 self.deleted[app_name] = old_app_sig.keys()
                 continue
 
-            for model_name, old_model_sig in old_app_sig.items():
+            model_names = get_changed_keys(old_app_sig, new_app_sig)
+
+            if model_names is None:
+                model_names = old_app_sig.keys()
+
+            for model_name in model_names:
+                old_model_sig = old_app_sig.get(model_name, None)
+
+                if old_model_sig is None:
+                    # Model has been added
+                    continue
+
                 new_model_sig = new_app_sig.get(model_name, None)
 
                 if new_model_sig is None:
@@ -107,59 +218,75 @@ class Diff(object):
                         []).append(model_name)
                     continue
 
-                old_fields = old_model_sig['fields']
-                new_fields = new_model_sig['fields']
-
-                # Look for deleted or modified fields
-                for field_name, old_field_data in old_fields.items():
-                    new_field_data = new_fields.get(field_name, None)
-
-                    if new_field_data is None:
-                        # Field has been deleted
-                        self.changed.setdefault(app_name,
-                            {}).setdefault('changed',
-                            {}).setdefault(model_name,
-                            {}).setdefault('deleted',
-                            []).append(field_name)
-                        continue
-
-                    properties = set(old_field_data.keys())
-                    properties.update(new_field_data.keys())
-
-                    for prop in properties:
-                        old_value = old_field_data.get(prop,
-                            ATTRIBUTE_DEFAULTS.get(prop, None))
-                        new_value = new_field_data.get(prop,
-                            ATTRIBUTE_DEFAULTS.get(prop, None))
-
-                        if old_value != new_value:
-                            try:
-                                if (prop == 'field_type' and
-                                    (old_value().get_internal_type() ==
-                                     new_value().get_internal_type())):
-                                    continue
-                            except TypeError:
-                                pass
-
-                            # Field has been changed
-                            self.changed.setdefault(app_name,
-                                {}).setdefault('changed',
-                                {}).setdefault(model_name,
-                                {}).setdefault('changed',
-                                {}).setdefault(field_name,[]).append(prop)
-
-                # Look for added fields
-                new_fields = new_model_sig['fields']
-
-                for field_name, new_field_data in new_fields.items():
-                    old_field_data = old_fields.get(field_name, None)
-
-                    if old_field_data is None:
-                        self.changed.setdefault(app_name,
-                            {}).setdefault('changed',
-                            {}).setdefault(model_name,
-                            {}).setdefault('added',
-                            []).append(field_name)
+                self._diff_fields(app_name, model_name,
+                                  old_model_sig['fields'],
+                                  new_model_sig['fields'])
+
+    def _diff_fields(self, app_name, model_name, old_fields, new_fields):
+        "Compare the fields of a model"
+        field_names = get_changed_keys(old_fields, new_fields)
+
+        if field_names is None:
+            old_field_names = old_fields.keys()
+            new_field_names = new_fields.keys()
+        else:
+            old_field_names = [
+                field_name
+                for field_name in field_names
+                if field_name in old_fields
+            ]
+            new_field_names = [
+                field_name
+                for field_name in field_names
+                if field_name in new_fields
+            ]
+
+        # Look for deleted or modified fields
+        for field_name in old_field_names:
+            old_field_data = old_fields[field_name]
+            new_field_data = new_fields.get(field_name, None)
+
+            if new_field_data is None:
+                # Field has been deleted
+                self.changed.setdefault(app_name,
+                    {}).setdefault('changed',
+                    {}).setdefault(model_name,
+                    {}).setdefault('deleted',
+                    []).append(field_name)
+                continue
+
+            properties = set(old_field_data.keys())
+            properties.update(new_field_data.keys())
+
+            for prop in properties:
+                old_value = old_field_data.get(prop,
+                    ATTRIBUTE_DEFAULTS.get(prop, None))
+                new_value = new_field_data.get(prop,
+                    ATTRIBUTE_DEFAULTS.get(prop, None))
+
+                if old_value != new_value:
+                    if prop == 'field_type':
+                        old_type = get_field_internal_type(old_value)
+
+                        if (old_type is not None and
+                            old_type == get_field_internal_type(new_value)):
+                            continue
+
+                    # Field has been changed
+                    self.changed.setdefault(app_name,
+                        {}).setdefault('changed',
+                        {}).setdefault(model_name,
+                        {}).setdefault('changed',
+                        {}).setdefault(field_name,[]).append(prop)
+
+        # Look for added fields
+        for field_name in new_field_names:
+            if field_name not in old_fields:
+                self.changed.setdefault(app_name,
+                    {}).setdefault('changed',
+                    {}).setdefault(model_name,
+                    {}).setdefault('added',
+                    []).append(field_name)
 
     def is_empty(self, ignore_apps=True):
         """Is this an empty diff? i.e., is the source and target the same?
@@ -205,6 +332,7 @@ class Diff(object):
     def evolution(self):
         "Generate an evolution that would neutralize the diff"
         mutations = {}
+        model_fields = {}
 
         for app_label, app_changes in self.changed.items():
             for model_name, change in app_changes.get('changed', {}).items():
@@ -220,7 +348,7 @@ class Diff(object):
                         add_params.append(
                             ('initial',
                              get_initial_value(app_label, model_name,
-                                               field_name)))
+                                               field_name, model_fields)))
 
                     if 'related_model' in field_sig:
                         add_params.append(('related_model',
@@ -251,7 +379,8 @@ class Diff(object):
                         not current_field_sig.get('null',
                                                   ATTRIBUTE_DEFAULTS['null'])):
                         changed_attrs['initial'] = \
-                            get_initial_value(app_label, model_name, field_name)
+                            get_initial_value(app_label, model_name, field_name,
+                                              model_fields)
 
                     mutations.setdefault(app_label,[]).append(
                         ChangeField(model_name, field_name, **changed_attrs))
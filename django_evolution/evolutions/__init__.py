@@ -0,0 +1,5 @@
+SEQUENCE = [
+    'version_when_db_index',
+    'evolution_app_label_label_index',
+    'version_signature_hash',
+]
@@ -0,0 +1,15 @@
+from django_evolution.mutations import SQLMutation
+
+
+# Composite indexes aren't part of the project signature, so there's
+# nothing to update when simulating.
+def update_signature(app_label, proj_sig):
+    pass
+
+
+MUTATIONS = [
+    SQLMutation('evolution_app_label_label_index', [
+        'CREATE INDEX django_evolution_app_label_label'
+        ' ON django_evolution (app_label, label);',
+    ], update_signature)
+]
@@ -0,0 +1,9 @@
+from django.db import models
+
+from django_evolution.mutations import AddField
+
+
+MUTATIONS = [
+    AddField('Version', 'signature_hash', models.CharField, initial='',
+             max_length=40)
+]
@@ -0,0 +1,6 @@
+from django_evolution.mutations import ChangeField
+
+
+MUTATIONS = [
+    ChangeField('Version', 'when', initial=None, db_index=True)
+]
@@ -1,9 +1,29 @@
 import os
+import re
+import stat
+import tempfile
 
 from django_evolution import EvolutionException, is_multi_db
 from django_evolution.builtin_evolutions import BUILTIN_SEQUENCES
-from django_evolution.models import Evolution
+from django_evolution.diff import Diff, NullFieldInitialCallback
+from django_evolution.models import Evolution, Version
 from django_evolution.mutations import SQLMutation
+from django_evolution.signature import create_project_sig, \
+                                      create_signature_hash
+
+
+# Matches the SEQUENCE list in an evolutions package.
+SEQUENCE_RE = re.compile(r'^SEQUENCE\s*=\s*\[(?P<body>[^\]]*)\]',
+                         re.MULTILINE)
+
+# The maximum length of a generated evolution label, before any suffix
+# needed to make it unique.
+MAX_HINTED_LABEL_LENGTH = 50
+
+# The hashes of the current project signatures, keyed by database.
+# Models don't change while the process is running, so these only need
+# to be computed once.
+_current_signature_hashes = {}
 
 
 def get_evolution_sequence(app):
@@ -30,9 +50,65 @@ def get_unapplied_evolutions(app, database):
     if is_multi_db():
         evolutions = evolutions.using(database)
 
-    applied = [evo.label for evo in evolutions]
+    applied = set([evo.label for evo in evolutions])
+    unapplied = []
+
+    for label in sequence:
+        unapplied.extend(_get_unapplied_labels(app, label, applied))
+
+    return unapplied
+
+
+def _get_unapplied_labels(app, label, applied):
+    """
+    Return the labels that must be applied for an evolution.
+
+    A squashed evolution counts as applied when the evolutions it replaces
+    have all been applied. If only some of them have been applied, the rest
+    are applied individually instead of the squashed evolution.
+    """
+    if label in applied:
+        return []
+
+    replaced = get_replaced_evolutions(app, label)
+
+    if not replaced or not _is_partially_applied(app, label, applied):
+        return [label]
+
+    unapplied = []
+
+    for replaced_label in replaced:
+        unapplied.extend(_get_unapplied_labels(app, replaced_label, applied))
+
+    return unapplied
+
 
-    return [seq for seq in sequence if seq not in applied]
+def _is_partially_applied(app, label, applied):
+    "Return whether an evolution, or any that it replaces, has been applied"
+    if label in applied:
+        return True
+
+    for replaced_label in get_replaced_evolutions(app, label):
+        if _is_partially_applied(app, replaced_label, applied):
+            return True
+
+    return False
+
+
+def get_replaced_evolutions(app, label):
+    "Obtain the labels of the evolutions replaced by a squashed evolution"
+    app_name = '.'.join(app.__name__.split('.')[:-1])
+
+    if app_name in BUILTIN_SEQUENCES:
+        return []
+
+    try:
+        module = __import__('%s.evolutions.%s' % (app_name, label),
+                            {}, {}, [''])
+    except ImportError:
+        return []
+
+    return getattr(module, 'REPLACES', [])
 
 
 def get_mutations(app, evolution_labels, database):
@@ -91,3 +167,320 @@ def get_mutations(app, evolution_labels, database):
                     % label)
 
     return mutations
+
+
+def get_current_signature_hash(database):
+    "Obtain the hash of the current project signature for a database"
+    if database not in _current_signature_hashes:
+        _current_signature_hashes[database] = \
+            create_signature_hash(create_project_sig(database))
+
+    return _current_signature_hashes[database]
+
+
+def is_evolution_required(database=None):
+    """
+    Determine whether the models have changed since the signature was last
+    stored in the database.
+
+    This is cheap enough to call at startup or from health checks. The hash
+    of the current project signature is compared against the hash stored
+    with the latest version, and only if they differ are the signatures
+    loaded and compared in full.
+
+    Evolutions that don't affect the signature (such as SQL mutations) are
+    not considered. Use get_unapplied_evolutions() to check for those.
+    """
+    if database is None and is_multi_db():
+        from django.db.utils import DEFAULT_DB_ALIAS
+        database = DEFAULT_DB_ALIAS
+
+    try:
+        latest_version = Version.objects.current_version(database)
+    except Version.DoesNotExist:
+        # There's no baseline yet, so the database must be synchronized.
+        return True
+
+    if (Version.objects.supports_signature_hash(database) and
+        latest_version.signature_hash and
+        latest_version.signature_hash == get_current_signature_hash(database)):
+        return False
+
+    diff = Diff(latest_version.get_signature(),
+                create_project_sig(database))
+
+    return not diff.is_empty()
+
+
+def get_evolution_source(mutations, replaces=None):
+    """
+    Generate the source code for an evolution module.
+
+    If replaces is given, the module is a squashed evolution replacing the
+    evolutions with those labels.
+    """
+    lines = [
+        'from django_evolution.mutations import *',
+        'from django.db import models',
+        '',
+    ]
+
+    if replaces:
+        lines.append('REPLACES = [')
+        lines.extend(["    '%s'," % label for label in replaces])
+        lines.extend([']', ''])
+
+    if mutations:
+        lines.append('MUTATIONS = [')
+        lines.append('    %s' % ',\n    '.join([unicode(m)
+                                                 for m in mutations]))
+        lines.append(']')
+    else:
+        lines.append('MUTATIONS = []')
+
+    return '\n'.join(lines) + '\n'
+
+
+def get_hinted_evolution_label(app, mutations):
+    """
+    Generate a label for a hinted evolution, based on its mutations.
+
+    The label is unique among the application's existing evolutions.
+    """
+    parts = []
+
+    for mutation in mutations:
+        part = re.sub(r'([a-z])([A-Z])', r'\1_\2',
+                      mutation.__class__.__name__).lower()
+
+        for attr in ('model_name', 'field_name'):
+            value = getattr(mutation, attr, None)
+
+            if value:
+                part += '_%s' % value.lower()
+
+        if part not in parts:
+            parts.append(part)
+
+    label = parts[0]
+
+    for part in parts[1:]:
+        if len(label) + len(part) + 1 > MAX_HINTED_LABEL_LENGTH:
+            label += '_and_more'
+            break
+
+        label += '_%s' % part
+
+    evolutions_dir = get_evolutions_dir(app)
+    sequence = get_evolution_sequence(app)
+    unique_label = label
+    i = 2
+
+    while (unique_label in sequence or
+           os.path.exists(os.path.join(evolutions_dir,
+                                       unique_label + '.py'))):
+        unique_label = '%s_%d' % (label, i)
+        i += 1
+
+    return unique_label
+
+
+def get_evolutions_dir(app):
+    "Return the directory of an application's evolutions package"
+    app_name = '.'.join(app.__name__.split('.')[:-1])
+
+    if app_name in BUILTIN_SEQUENCES:
+        raise EvolutionException(
+            'The evolutions for %s are provided by Django Evolution, and '
+            'cannot be written to.' % app_name)
+
+    app_module = __import__(app_name, {}, {}, [''])
+
+    return os.path.join(os.path.dirname(app_module.__file__), 'evolutions')
+
+
+def replace_sequence(source, labels):
+    """
+    Replace the contents of the SEQUENCE list in the source of an
+    evolutions package. Returns None if the list can't be found.
+    """
+    m = SEQUENCE_RE.search(source)
+
+    if not m:
+        return None
+
+    body = ''.join(["\n    '%s'," % label for label in labels]) + '\n'
+
+    return source[:m.start('body')] + body + source[m.end('body'):]
+
+
+def add_to_sequence(source, label):
+    """
+    Add a label to the end of the SEQUENCE list in the source of an
+    evolutions package. Returns None if the list can't be found.
+    """
+    m = SEQUENCE_RE.search(source)
+
+    if not m:
+        return None
+
+    body = m.group('body').rstrip()
+
+    if not body.strip():
+        body = "\n    '%s',\n" % label
+    elif '\n' in body:
+        if not body.endswith(','):
+            body += ','
+
+        body = "%s\n    '%s',\n" % (body, label)
+    elif body.endswith(','):
+        body = "%s '%s'" % (body, label)
+    else:
+        body = "%s, '%s'" % (body, label)
+
+    return source[:m.start('body')] + body + source[m.end('body'):]
+
+
+def _write_file_atomic(filename, data):
+    """
+    Write a file by writing a temporary file and renaming it into place, so
+    that the file is never left partially written.
+
+    The file keeps the permissions of the file it replaces. New files get
+    the permissions allowed by the umask, as with open().
+    """
+    fd, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                         prefix='.tmp-')
+
+    try:
+        temp_file = os.fdopen(fd, 'w')
+
+        try:
+            temp_file.write(data)
+        finally:
+            temp_file.close()
+
+        # mkstemp() creates files that only the owner can read.
+        if os.path.exists(filename):
+            mode = stat.S_IMODE(os.stat(filename).st_mode)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0666 & ~umask
+
+        os.chmod(temp_filename, mode)
+
+        if os.name == 'nt' and os.path.exists(filename):
+            # Windows can't rename over an existing file.
+            os.remove(filename)
+
+        os.rename(temp_filename, filename)
+    except:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+
+        raise
+
+
+def write_hinted_evolution(app, mutations):
+    """
+    Write hinted mutations as a new evolution for an application.
+
+    The evolution module is created in the application's evolutions
+    package (which is created if needed), and its label is appended to the
+    package's SEQUENCE. Returns the new label and the module's filename.
+    """
+    app_label = app.__name__.split('.')[-2]
+
+    for mutation in mutations:
+        if isinstance(getattr(mutation, 'initial', None),
+                      NullFieldInitialCallback):
+            raise EvolutionException(
+                'The evolution for %s requires a user-specified initial '
+                'value, and must be written by hand.' % app_label)
+
+    evolutions_dir = get_evolutions_dir(app)
+    label = get_hinted_evolution_label(app, mutations)
+    init_filename = os.path.join(evolutions_dir, '__init__.py')
+
+    if os.path.exists(init_filename):
+        new_init_source = add_to_sequence(_read_file(init_filename), label)
+
+        if new_init_source is None:
+            raise EvolutionException(
+                'Could not find the SEQUENCE list in %s. Add the %s '
+                'evolution to it by hand.' % (init_filename, label))
+    else:
+        new_init_source = "SEQUENCE = [\n    '%s',\n]\n" % label
+
+        if not os.path.exists(evolutions_dir):
+            os.mkdir(evolutions_dir)
+
+    module_filename = _write_evolution(evolutions_dir, label,
+                                       get_evolution_source(mutations),
+                                       new_init_source)
+
+    return label, module_filename
+
+
+def write_squashed_evolution(app, label, mutations, replaces):
+    """
+    Write a squashed evolution for an application.
+
+    The evolution module is created in the application's evolutions
+    package, and the replaced labels are swapped for the new label in the
+    package's SEQUENCE. The modules of the replaced evolutions are left in
+    place, for databases that have only applied some of them. Returns the
+    module's filename.
+    """
+    evolutions_dir = get_evolutions_dir(app)
+    init_filename = os.path.join(evolutions_dir, '__init__.py')
+
+    if os.path.exists(os.path.join(evolutions_dir, label + '.py')):
+        raise EvolutionException('An evolution named %s already exists.'
+                                 % label)
+
+    sequence = get_evolution_sequence(app)
+
+    if sequence[:len(replaces)] != list(replaces):
+        raise EvolutionException(
+            'Only evolutions at the start of the sequence can be squashed.')
+
+    new_init_source = replace_sequence(_read_file(init_filename),
+                                       [label] + sequence[len(replaces):])
+
+    if new_init_source is None:
+        raise EvolutionException(
+            'Could not find the SEQUENCE list in %s.' % init_filename)
+
+    return _write_evolution(evolutions_dir, label,
+                            get_evolution_source(mutations, replaces),
+                            new_init_source)
+
+
+def _read_file(filename):
+    "Return the contents of a file"
+    f = open(filename, 'r')
+
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def _write_evolution(evolutions_dir, label, source, init_source):
+    """
+    Write an evolution module and the new source of the evolutions package.
+    Returns the module's filename.
+    """
+    module_filename = os.path.join(evolutions_dir, label + '.py')
+    _write_file_atomic(module_filename, source.encode('utf-8'))
+
+    try:
+        _write_file_atomic(os.path.join(evolutions_dir, '__init__.py'),
+                           init_source)
+    except:
+        os.remove(module_filename)
+        raise
+
+    return module_filename
@@ -0,0 +1,405 @@
+"""
+Builds project signatures from the live schema of a database.
+
+The signatures describe the tables and columns that actually exist, rather
+than what the models say should exist. Comparing them against the stored or
+current signatures reveals changes made outside of Django Evolution.
+"""
+import threading
+from Queue import Queue, Empty
+
+from django.db import models
+from django.db.backends.util import truncate_name
+from django.utils.datastructures import SortedDict
+
+from django_evolution.db import EvolutionOperationsMulti
+
+
+# The maximum number of tables fetched by each batch of catalog queries.
+TABLE_BATCH_SIZE = 100
+
+# The default number of connections used to introspect tables in parallel.
+DEFAULT_WORKERS = 4
+
+# Field signature attributes that are read from the database.
+INTROSPECTED_ATTRIBUTES = ('primary_key', 'null', 'max_length', 'unique',
+                           'db_index')
+
+# Column type names that differ from the names used in Django's data types.
+COLUMN_TYPE_ALIASES = {
+    'character varying': 'varchar',
+    'character': 'char',
+    'int': 'integer',
+}
+
+# The field types preferred when several match an unknown column's type.
+PREFERRED_FIELD_TYPES = [
+    'CharField', 'IntegerField', 'TextField', 'BooleanField',
+    'DateTimeField', 'DateField', 'TimeField', 'DecimalField', 'FloatField',
+]
+
+
+def introspect_project_sig(database, base_sig, workers=DEFAULT_WORKERS):
+    """
+    Create a project signature describing the live schema of a database.
+
+    base_sig is the signature (stored or current) used to map tables and
+    columns back to apps, models and fields. Tables that don't exist are
+    left out of the signature, and columns that don't correspond to any
+    field are included as fields named after the column.
+    """
+    proj_sig = {
+        '__version__': base_sig.get('__version__', 1),
+    }
+
+    for app_label, model_name, model_sig in \
+        iter_introspected_model_sigs(database, base_sig, workers):
+        app_sig = proj_sig.setdefault(app_label, SortedDict())
+
+        if model_sig is not None:
+            app_sig[model_name] = model_sig
+
+    return proj_sig
+
+
+def iter_introspected_model_sigs(database, base_sig, workers=DEFAULT_WORKERS):
+    """
+    Yield (app_label, model_name, model_sig) for each model in base_sig.
+
+    model_sig describes the model's live table, or is None if the table
+    doesn't exist. Tables are fetched in batches of catalog queries, which
+    are spread across up to 'workers' connections when the backend
+    supports it. Only a few batches are held in memory at a time.
+    """
+    evolver = EvolutionOperationsMulti(database).get_evolver()
+    max_name_length = evolver.connection.ops.max_name_length()
+    batches = []
+    batch = []
+    table_names = []
+
+    for app_label, app_sig in base_sig.items():
+        if app_label == '__version__':
+            continue
+
+        for model_name, model_sig in app_sig.items():
+            model_tables = get_model_table_names(base_sig, app_label,
+                                                 model_sig, max_name_length)
+
+            if batch and len(table_names) + len(model_tables) > \
+               TABLE_BATCH_SIZE:
+                batches.append((batch, table_names))
+                batch = []
+                table_names = []
+
+            batch.append((app_label, model_name, model_sig))
+            table_names.extend(model_tables)
+
+    if batch:
+        batches.append((batch, table_names))
+
+    if not evolver.supports_parallel_introspection:
+        workers = 1
+
+    for batch, schemas in _fetch_schemas(evolver, batches, workers):
+        for app_label, model_name, model_sig in batch:
+            yield (app_label, model_name,
+                   _introspect_model_sig(base_sig, app_label, model_sig,
+                                         schemas, evolver.connection,
+                                         max_name_length))
+
+
+def get_model_table_names(proj_sig, app_label, model_sig, max_name_length):
+    "Return the names of the tables that store a model's data"
+    table_names = [model_sig['meta']['db_table']]
+
+    for field_name, field_sig in model_sig['fields'].items():
+        if field_sig['field_type'] == models.ManyToManyField:
+            table_names.append(_get_m2m_table_name(field_name, field_sig,
+                                                   model_sig,
+                                                   max_name_length))
+
+            through_table = _get_through_table_name(proj_sig, app_label,
+                                                    model_sig, field_sig)
+
+            if through_table:
+                table_names.append(through_table)
+
+    return table_names
+
+
+def _fetch_schemas(evolver, batches, workers):
+    """
+    Yield (batch, schemas) for each batch, in order.
+
+    When using more than one worker, each worker thread opens its own
+    connection and works through the batches in turn. Workers stay at most
+    a couple of batches ahead of the consumer, and stop (closing their
+    connections) if the consumer stops early.
+    """
+    if workers <= 1 or len(batches) <= 1:
+        cursor = evolver.connection.cursor()
+
+        for batch, table_names in batches:
+            yield batch, evolver.introspect_tables(cursor, table_names)
+
+        return
+
+    jobs = Queue()
+    results = {}
+    state = {'consumed': 0, 'stopped': False}
+    condition = threading.Condition()
+    max_pending = workers * 2
+
+    for i, (batch, table_names) in enumerate(batches):
+        jobs.put((i, table_names))
+
+    def worker():
+        cursor = None
+
+        try:
+            while True:
+                try:
+                    i, table_names = jobs.get_nowait()
+                except Empty:
+                    break
+
+                condition.acquire()
+
+                while (not state['stopped'] and
+                       i >= state['consumed'] + max_pending):
+                    condition.wait()
+
+                stopped = state['stopped']
+                condition.release()
+
+                if stopped:
+                    break
+
+                try:
+                    if cursor is None:
+                        cursor = evolver.connection.cursor()
+
+                    result = evolver.introspect_tables(cursor, table_names)
+                except Exception, e:
+                    result = e
+
+                condition.acquire()
+                results[i] = result
+                condition.notifyAll()
+                condition.release()
+        finally:
+            # Connections are per-thread, so this only closes this worker's.
+            evolver.connection.close()
+
+    for i in range(min(workers, len(batches))):
+        thread = threading.Thread(target=worker)
+        thread.setDaemon(True)
+        thread.start()
+
+    try:
+        for i, (batch, table_names) in enumerate(batches):
+            condition.acquire()
+
+            while i not in results:
+                condition.wait()
+
+            result = results.pop(i)
+            state['consumed'] = i + 1
+            condition.notifyAll()
+            condition.release()
+
+            if isinstance(result, Exception):
+                raise result
+
+            yield batch, result
+    finally:
+        # Stop any workers still waiting to get ahead, if the consumer
+        # stopped early or a batch failed.
+        condition.acquire()
+        state['stopped'] = True
+        condition.notifyAll()
+        condition.release()
+
+
+def _introspect_model_sig(proj_sig, app_label, model_sig, schemas,
+                          connection, max_name_length):
+    "Create a model signature from the live schema of its tables"
+    meta = model_sig['meta']
+    schema = schemas.get(meta['db_table'])
+
+    if schema is None:
+        return None
+
+    columns = schema['columns']
+    column_indexes = {}
+    column_fields = {}
+    multi_column_indexes = []
+
+    for index in schema['indexes']:
+        if len(index['columns']) == 1:
+            info = column_indexes.setdefault(index['columns'][0], {
+                'primary_key': False,
+                'unique': False,
+                'db_index': False,
+            })
+
+            if index['primary_key']:
+                info['primary_key'] = True
+            elif index['unique']:
+                info['unique'] = True
+            else:
+                info['db_index'] = True
+        elif index['unique'] and not index['primary_key']:
+            multi_column_indexes.append(index['columns'])
+
+    fields = SortedDict()
+
+    for field_name, field_sig in model_sig['fields'].items():
+        if field_sig['field_type'] == models.ManyToManyField:
+            table_names = [
+                _get_m2m_table_name(field_name, field_sig, model_sig,
+                                    max_name_length),
+                _get_through_table_name(proj_sig, app_label, model_sig,
+                                        field_sig),
+            ]
+
+            for table_name in table_names:
+                if table_name in schemas:
+                    fields[field_name] = field_sig.copy()
+                    break
+
+            continue
+
+        column_name = _get_column_name(field_name, field_sig)
+
+        if column_name in columns:
+            column_fields[column_name] = field_name
+            fields[field_name] = _introspect_field_sig(
+                field_sig, columns[column_name],
+                column_indexes.get(column_name, {}))
+
+    for column_name, column in columns.items():
+        if column_name not in column_fields:
+            field_sig = {
+                'field_type': _guess_field_type(connection, column),
+            }
+            field_sig.update(_introspect_field_sig(
+                field_sig, column, column_indexes.get(column_name, {})))
+            column_fields[column_name] = column_name
+            fields[column_name] = field_sig
+
+    new_meta = meta.copy()
+    new_meta['unique_together'] = [
+        tuple([column_fields[column_name] for column_name in column_names])
+        for column_names in multi_column_indexes
+    ]
+
+    return {
+        'meta': new_meta,
+        'fields': fields,
+    }
+
+
+def _introspect_field_sig(field_sig, column, index_info):
+    "Create a field signature from a column and the indexes on it"
+    new_sig = {}
+
+    for key, value in field_sig.items():
+        if key not in INTROSPECTED_ATTRIBUTES:
+            new_sig[key] = value
+
+    if index_info.get('primary_key') or index_info.get('unique'):
+        # The index backing a primary key or unique constraint says nothing
+        # about whether a separate index was requested.
+        if 'db_index' in field_sig:
+            new_sig['db_index'] = field_sig['db_index']
+
+        if index_info.get('primary_key'):
+            new_sig['primary_key'] = True
+
+            if 'unique' in field_sig:
+                new_sig['unique'] = field_sig['unique']
+        else:
+            new_sig['unique'] = True
+    elif bool(index_info.get('db_index')) != ('related_model' in field_sig):
+        # Only store non-default values. Foreign keys are indexed by default.
+        new_sig['db_index'] = bool(index_info.get('db_index'))
+
+    if column['null'] and not index_info.get('primary_key'):
+        new_sig['null'] = True
+
+    if column['max_length'] is not None:
+        new_sig['max_length'] = column['max_length']
+
+    return new_sig
+
+
+def _guess_field_type(connection, column):
+    "Guess the field type for a column that doesn't belong to any field"
+    data_type = COLUMN_TYPE_ALIASES.get(column['type'], column['type'])
+    candidates = []
+
+    if data_type:
+        for internal_type, db_type in connection.creation.data_types.items():
+            if db_type.split('(')[0].strip().lower() == data_type:
+                candidates.append(internal_type)
+
+    for internal_type in PREFERRED_FIELD_TYPES:
+        if internal_type in candidates:
+            return getattr(models, internal_type)
+
+    candidates.sort()
+
+    for internal_type in candidates:
+        if hasattr(models, internal_type):
+            return getattr(models, internal_type)
+
+    return models.Field
+
+
+def _get_column_name(field_name, field_sig):
+    "Return the name of the column storing a field"
+    if field_sig.get('db_column'):
+        return field_sig['db_column']
+    elif 'related_model' in field_sig:
+        return '%s_id' % field_name
+    else:
+        return field_name
+
+
+def _get_m2m_table_name(field_name, field_sig, model_sig, max_name_length):
+    "Return the name of the automatically created table for a M2M field"
+    if field_sig.get('db_table'):
+        return field_sig['db_table']
+
+    return truncate_name('%s_%s' % (model_sig['meta']['db_table'], field_name),
+                         max_name_length)
+
+
+def _get_through_table_name(proj_sig, app_label, model_sig, field_sig):
+    """
+    Return the table of the intermediary model for a M2M field, if any.
+
+    Signatures don't record intermediary models, so this looks for a model
+    in the app with foreign keys to both sides of the relation.
+    """
+    app_sig = proj_sig.get(app_label, {})
+    model_names = set([
+        '%s.%s' % (app_label, model_name)
+        for model_name, other_model_sig in app_sig.items()
+        if other_model_sig is model_sig
+    ])
+    model_names.add(field_sig.get('related_model'))
+
+    for other_model_sig in app_sig.values():
+        related_models = set([
+            other_field_sig.get('related_model')
+            for other_field_sig in other_model_sig['fields'].values()
+            if other_field_sig['field_type'] != models.ManyToManyField
+        ])
+
+        if (other_model_sig is not model_sig and
+            model_names.issubset(related_models)):
+            return other_model_sig['meta']['db_table']
+
+    return None
@@ -1,14 +1,10 @@
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle as pickle
-
 from django.core.management.color import color_style
 from django.db.models import signals, get_apps
 
 from django_evolution import is_multi_db, models as django_evolution
 from django_evolution.evolve import get_evolution_sequence, get_unapplied_evolutions
-from django_evolution.signature import create_project_sig
+from django_evolution.signature import create_project_sig, \
+                                      create_signature_hash
 from django_evolution.diff import Diff
 
 style = color_style()
@@ -25,7 +21,7 @@ def evolution(app, created_models, verbosity=1, **kwargs):
 
     db = kwargs.get('db', default_db)
     proj_sig = create_project_sig(db)
-    signature = pickle.dumps(proj_sig)
+    signature_hash = create_signature_hash(proj_sig)
 
     using_args = {}
 
@@ -33,17 +29,14 @@ def evolution(app, created_models, verbosity=1, **kwargs):
         using_args['using'] = db
 
     try:
-        if is_multi_db():
-            latest_version = \
-                django_evolution.Version.objects.using(db).latest('when')
-        else:
-            latest_version = django_evolution.Version.objects.latest('when')
+        latest_version = django_evolution.Version.objects.current_version(db)
     except django_evolution.Version.DoesNotExist:
         # We need to create a baseline version.
         if verbosity > 0:
             print "Installing baseline version"
 
-        latest_version = django_evolution.Version(signature=signature)
+        latest_version = django_evolution.Version()
+        latest_version.set_signature(proj_sig)
         latest_version.save(**using_args)
 
         for a in get_apps():
@@ -70,7 +63,15 @@ def evolution(app, created_models, verbosity=1, **kwargs):
     # Evolutions are checked over the entire project, so we only need to check
     # once. We do this check when Django Evolutions itself is synchronized.
     if app == django_evolution:
-        old_proj_sig = pickle.loads(str(latest_version.signature))
+        supports_signature_hash = \
+            django_evolution.Version.objects.supports_signature_hash(db)
+
+        if (supports_signature_hash and
+            latest_version.signature_hash == signature_hash):
+            # Nothing has changed since the signature was stored.
+            return
+
+        old_proj_sig = latest_version.get_signature()
 
         # If any models have been added, a baseline must be set
         # for those new models
@@ -98,25 +99,21 @@ def evolution(app, created_models, verbosity=1, **kwargs):
                         proj_sig[app_name][model_name]
                     changed = True
 
-        if changed:
+        if changed and not supports_signature_hash:
+            # The Version table can't be written to until django_evolution's
+            # own evolutions have been applied. The new models will be
+            # included in the signature stored by that evolution.
+            if verbosity > 0:
+                print ("Skipping the baseline for new models until the "
+                       "evolutions for django_evolution are applied")
+        elif changed:
             if verbosity > 0:
                 print "Adding baseline version for new models"
 
-            latest_version = \
-                django_evolution.Version(signature=pickle.dumps(old_proj_sig))
+            latest_version = django_evolution.Version()
+            latest_version.set_signature(old_proj_sig)
             latest_version.save(**using_args)
 
-        # TODO: Model introspection step goes here.
-        # # If the current database state doesn't match the last
-        # # saved signature (as reported by latest_version),
-        # # then we need to update the Evolution table.
-        # actual_sig = introspect_project_sig()
-        # acutal = pickle.dumps(actual_sig)
-        # if actual != latest_version.signature:
-        #     nudge = Version(signature=actual)
-        #     nudge.save()
-        #     latest_version = nudge
-
         diff = Diff(old_proj_sig, proj_sig)
 
         if not diff.is_empty():
@@ -124,7 +121,7 @@ def evolution(app, created_models, verbosity=1, **kwargs):
                 'Project signature has changed - an evolution is required')
 
             if verbosity > 1:
-                old_proj_sig = pickle.loads(str(latest_version.signature))
+                old_proj_sig = latest_version.get_signature()
                 print diff
 
 signals.post_syncdb.connect(evolution)
@@ -0,0 +1,115 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from django_evolution import is_multi_db
+from django_evolution.models import SignatureBlob, Version
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--noinput', action='store_false', dest='interactive', default=True,
+            help='Tells Django to NOT prompt the user for input of any kind.'),
+        make_option(
+            '--keep', action='store', dest='keep', type='int', default=10,
+            help='The number of most recent versions whose signatures '
+                 'should be kept (default 10).'),
+        make_option(
+            '--database', action='store', dest='database',
+            help='Nominates a database to compact.'),
+    )
+
+    if '--verbosity' not in [opt.get_opt_string()
+                             for opt in BaseCommand.option_list]:
+        option_list += make_option('-v', '--verbosity', action='store',
+                                   dest='verbosity', default='1',
+            type='choice', choices=['0', '1', '2'],
+            help='Verbosity level; 0=minimal output, 1=normal output, '
+                 '2=all output'),
+
+    help = ('Compacts the stored evolution history, replacing the signatures '
+            'of old versions with lightweight stubs.')
+
+    requires_model_validation = False
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        interactive = options['interactive']
+        keep = options['keep']
+        database = options.get('database')
+
+        if args:
+            raise CommandError('compact_evolution_history does not take any '
+                               'arguments.')
+
+        if keep < 1:
+            raise CommandError('At least one version signature must be kept.')
+
+        if not database and is_multi_db():
+            from django.db.utils import DEFAULT_DB_ALIAS
+            database = DEFAULT_DB_ALIAS
+
+        using_args = {}
+        versions = Version.objects.all()
+
+        if is_multi_db():
+            using_args['using'] = database
+            versions = versions.using(database)
+
+        # Versions sharing a timestamp with the oldest kept version are
+        # kept as well, so that the cutoff can be applied in a single
+        # UPDATE without building a list of IDs.
+        try:
+            cutoff = versions.order_by('-when').values_list('when',
+                                                            flat=True)[keep - 1]
+        except IndexError:
+            if verbosity > 0:
+                print 'There are no versions to compact.'
+
+            return
+
+        stale_versions = versions.filter(when__lt=cutoff).exclude(signature='')
+        count = stale_versions.count()
+
+        if not count:
+            if verbosity > 0:
+                print 'There are no versions to compact.'
+
+            return
+
+        if interactive:
+            confirm = raw_input("""
+You have requested to compact the evolution history in the %r database.
+The signatures stored for %d old version(s) will be permanently removed.
+The applied evolutions will be preserved.
+
+Type 'yes' to continue, or 'no' to cancel: """ % (database, count))
+        else:
+            confirm = 'yes'
+
+        if confirm.lower() != 'yes':
+            print self.style.ERROR('Compaction cancelled.')
+            return
+
+        transaction.enter_transaction_management(**using_args)
+        transaction.managed(flag=True, **using_args)
+
+        try:
+            stale_versions.update(signature='')
+
+            if SignatureBlob.objects.is_supported(database):
+                SignatureBlob.objects.delete_unreferenced(database)
+
+            transaction.commit(**using_args)
+        except Exception, e:
+            transaction.rollback(**using_args)
+            transaction.leave_transaction_management(**using_args)
+            raise CommandError('Error compacting the evolution history: %s'
+                               % e)
+
+        transaction.leave_transaction_management(**using_args)
+
+        if verbosity > 0:
+            print 'Compacted %d version(s).' % count
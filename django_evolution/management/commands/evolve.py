@@ -1,22 +1,28 @@
 from optparse import make_option
 import sys
-try:
-    import cPickle as pickle
-except ImportError:
-    import pickle as pickle
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.core.management.base import BaseCommand, CommandError
 from django.db.models import get_apps, get_app
 from django.db import connection, transaction
+from django.utils.hashcompat import sha_constructor
 
 from django_evolution import CannotSimulate, EvolutionException, is_multi_db
 from django_evolution.diff import Diff
-from django_evolution.evolve import get_unapplied_evolutions, get_mutations
-from django_evolution.models import Version, Evolution
+from django_evolution.evolve import get_evolution_source, get_mutations, \
+                                   get_unapplied_evolutions, \
+                                   write_hinted_evolution
+from django_evolution.introspection import iter_introspected_model_sigs
+from django_evolution.models import EvolutionProgress, Version, Evolution
 from django_evolution.mutations import DeleteApplication
-from django_evolution.signature import create_project_sig
+from django_evolution.signals import run_mutation_operation, run_operation
+from django_evolution.signature import LazyProjectSig, \
+                                      SignatureOverlay, create_app_sig, \
+                                      create_lazy_project_sig
+from django_evolution.throttle import CombinedBackPressure, \
+                                     FileBackPressure, QueryBackPressure, \
+                                     Throttle, load_back_pressure
 from django_evolution.utils import write_sql, execute_sql
 
 class Command(BaseCommand):
@@ -27,6 +33,10 @@ class Command(BaseCommand):
         make_option(
             '--hint', action='store_true', dest='hint', default=False,
             help='Generate an evolution script that would update the app.'),
+        make_option(
+            '--write', action='store_true', dest='write', default=False,
+            help='Write the hinted evolutions into each app\'s evolutions '
+                 'package. Requires --hint.'),
         make_option(
             '--purge', action='store_true', dest='purge', default=False,
             help='Generate evolutions to delete stale applications.'),
@@ -38,6 +48,30 @@ class Command(BaseCommand):
             '-x', '--execute', action='store_true', dest='execute',
             default=False,
             help='Apply the evolution to the database.'),
+        make_option(
+            '--check-drift', action='store_true', dest='check_drift',
+            default=False,
+            help='Compare the live schema of each database against its '
+                 'stored signature and the current models.'),
+        make_option(
+            '--profile', action='store_true', dest='profile', default=False,
+            help='Print the time spent in each stage of the evolution, and '
+                 'profiling data for the code run by each stage.'),
+        make_option(
+            '--pause-file', action='store', dest='pause_file',
+            help='Pause data mutations while this file exists. If it '
+                 'contains a number, that is the number of seconds to wait '
+                 'before checking again.'),
+        make_option(
+            '--probe-query', action='store', dest='probe_query',
+            help='Pause data mutations while this query (for instance, one '
+                 'returning the replication lag) returns more than '
+                 '--probe-threshold.'),
+        make_option(
+            '--probe-threshold', action='store', dest='probe_threshold',
+            type='float', default=0,
+            help='The largest result of --probe-query that data mutations '
+                 'will run at (default 0).'),
         make_option(
             '--database', action='store', dest='database',
             help='Nominates a database to synchronize.'),
@@ -57,7 +91,24 @@ class Command(BaseCommand):
     requires_model_validation = False
 
     def handle(self, *app_labels, **options):
-        self.evolve(*app_labels, **options)
+        if options.get('profile'):
+            from django_evolution.profiling import EvolutionProfiler
+
+            profiler = EvolutionProfiler()
+            profiler.connect()
+        else:
+            profiler = None
+
+        try:
+            if options.get('check_drift'):
+                self.check_drift(*app_labels, **options)
+            else:
+                self.evolve(*app_labels, **options)
+        finally:
+            if profiler:
+                profiler.disconnect()
+                print
+                profiler.print_report()
 
     def evolve(self, *app_labels, **options):
         verbosity = int(options['verbosity'])
@@ -66,8 +117,18 @@ class Command(BaseCommand):
         compile_sql = options['compile_sql']
         hint = options['hint']
         purge = options['purge']
+        write = options.get('write')
         database = options['database']
 
+        if write and (not hint or compile_sql or execute):
+            raise CommandError('--write requires --hint, and cannot be '
+                               'combined with --sql or --execute.')
+
+        try:
+            throttle = self._get_throttle(options)
+        except EvolutionException, e:
+            raise CommandError(str(e))
+
         if not database and is_multi_db():
             from django.db.utils import DEFAULT_DB_ALIAS
             database = DEFAULT_DB_ALIAS
@@ -93,24 +154,27 @@ class Command(BaseCommand):
         # Iterate over all applications running the mutations
         evolution_required = False
         simulated = True
-        sql = []
+        sql_batches = []
         new_evolutions = []
+        hinted_evolutions = []
 
-        current_proj_sig = create_project_sig(database)
-        current_signature = pickle.dumps(current_proj_sig)
+        # Application signatures are only built as they're needed, so
+        # targeted runs only pay for the applications they touch.
+        current_proj_sig = create_lazy_project_sig(database)
+        diff_app_labels = app_labels or None
 
         try:
-            if is_multi_db():
-                latest_version = Version.objects.using(database).latest('when')
-            else:
-                latest_version = Version.objects.latest('when')
-
-            database_sig = pickle.loads(str(latest_version.signature))
-            diff = Diff(database_sig, current_proj_sig)
-        except Evolution.DoesNotExist:
+            latest_version = Version.objects.current_version(database)
+            stored_sig = latest_version.get_signature()
+            diff = Diff(stored_sig, current_proj_sig, diff_app_labels)
+        except Version.DoesNotExist:
             raise CommandError("Can't evolve yet. Need to set an "
                                "evolution baseline.")
 
+        # The mutations are simulated against an overlay of the stored
+        # signature, so the stored signature itself is left untouched.
+        database_sig = SignatureOverlay(stored_sig)
+
         try:
             for app in app_list:
                 app_label = app.__name__.split('.')[-2]
@@ -124,8 +188,9 @@ class Command(BaseCommand):
 
                 mutations = [
                     mutation for mutation in temp_mutations
-                    if mutation.is_mutable(app_label, database_sig,
-                                           database)
+                    if run_mutation_operation('is_mutable', mutation,
+                                              app_label, database_sig,
+                                              database)
                 ]
 
                 if mutations:
@@ -136,13 +201,17 @@ class Command(BaseCommand):
                         # Only compile SQL if we want to show it
                         if compile_sql or execute:
                             app_sql.extend(
-                                mutation.mutate(app_label, database_sig,
-                                                database))
+                                run_mutation_operation('mutate', mutation,
+                                                       app_label,
+                                                       database_sig,
+                                                       database))
 
                         # Now run the simulation, which will modify the
                         # signatures
                         try:
-                            mutation.simulate(app_label, database_sig, database)
+                            run_mutation_operation('simulate', mutation,
+                                                   app_label, database_sig,
+                                                   database)
                         except CannotSimulate:
                             simulated = False
 
@@ -150,21 +219,19 @@ class Command(BaseCommand):
                         Evolution(app_label=app_label, label=label)
                         for label in evolutions)
 
-                    if not execute:
+                    if write:
+                        # These are written once the hints are known to
+                        # resolve all the changes.
+                        hinted_evolutions.append((app, mutations))
+                    elif not execute:
                         if compile_sql:
                             write_sql(app_sql, database)
                         else:
                             print '#----- Evolution for %s' % app_label
-                            print 'from django_evolution.mutations import *'
-                            print 'from django.db import models'
-                            print
-                            print 'MUTATIONS = ['
-                            print '   ',
-                            print ',\n    '.join(unicode(m) for m in mutations)
-                            print ']'
+                            print get_evolution_source(mutations).rstrip()
                             print '#----------------------'
 
-                    sql.extend(app_sql)
+                    sql_batches.append((app_label, app_sql))
                 else:
                     if verbosity > 1:
                         print 'Application %s is up to date' % app_label
@@ -177,16 +244,26 @@ class Command(BaseCommand):
                     purge_sql = []
 
                     for app_label in diff.deleted:
-                        if delete_app.is_mutable(app_label, database_sig,
-                                                 database):
+                        if run_mutation_operation('is_mutable', delete_app,
+                                                  app_label, database_sig,
+                                                  database):
+                            app_sql = []
+
                             if compile_sql or execute:
-                                purge_sql.append('-- Purge application %s'
-                                                 % app_label)
-                                purge_sql.extend(
-                                    delete_app.mutate(app_label, database_sig,
-                                                      database))
-                            delete_app.simulate(app_label, database_sig,
-                                                database)
+                                app_sql.append('-- Purge application %s'
+                                               % app_label)
+                                app_sql.extend(
+                                    run_mutation_operation('mutate',
+                                                           delete_app,
+                                                           app_label,
+                                                           database_sig,
+                                                           database))
+
+                            run_mutation_operation('simulate', delete_app,
+                                                   app_label, database_sig,
+                                                   database)
+                            purge_sql.extend(app_sql)
+                            sql_batches.append((app_label, app_sql))
 
                     if not execute:
                         if compile_sql:
@@ -199,7 +276,6 @@ class Command(BaseCommand):
 
                             print
 
-                    sql.extend(purge_sql)
                 else:
                     if verbosity > 1:
                         print 'No applications need to be purged.'
@@ -208,7 +284,7 @@ class Command(BaseCommand):
             raise CommandError(str(e))
 
         if simulated:
-            diff = Diff(database_sig, current_proj_sig)
+            diff = Diff(database_sig, current_proj_sig, diff_app_labels)
 
             if not diff.is_empty(not purge):
                 if hint:
@@ -237,7 +313,9 @@ class Command(BaseCommand):
                 'Evolution could not be simulated, possibly due to raw '
                 'SQL mutations')
 
-        if evolution_required:
+        if hinted_evolutions:
+            self._write_hinted_evolutions(hinted_evolutions, verbosity)
+        elif evolution_required:
             if execute:
                 # Now that we've worked out the mutations required,
                 # and we know they simulate OK, run the evolutions
@@ -254,34 +332,75 @@ Type 'yes' to continue, or 'no' to cancel: """ % database)
                 else:
                     confirm = 'yes'
 
-                if is_multi_db():
-                    from django.db import connections
-
                 if confirm.lower() == 'yes':
                     # Begin Transaction
                     transaction.enter_transaction_management(**using_args)
                     transaction.managed(flag=True, **using_args)
 
-                    if is_multi_db():
-                        cursor = connections[database].cursor()
-                    else:
-                        cursor = connection.cursor()
+                    cursor = self._get_cursor(database)
+
+                    # Steps that commit part way through record how far
+                    # the evolution got, so that running it again resumes
+                    # after the changes that were committed.
+                    progress = EvolutionProgress.objects.get_progress(
+                        self._get_plan_hash(latest_version, sql_batches),
+                        database)
+
+                    if progress.completed_steps and verbosity > 0:
+                        print self.style.NOTICE(
+                            'Resuming the evolution after the %d '
+                            'statement(s) committed by an earlier attempt.'
+                            % progress.completed_steps)
+
+                    def record_progress(num_completed):
+                        progress.update(num_completed)
+                        transaction.commit(**using_args)
+
+                    resume_from = progress.completed_steps
 
                     try:
-                        # Perform the SQL
-                        execute_sql(cursor, sql)
+                        # Perform the SQL, one application at a time
+                        num_steps = 0
+
+                        for app_label, app_sql in sql_batches:
+                            run_operation(
+                                'execute_sql', {
+                                    'app_label': app_label,
+                                    'database': database,
+                                    'sql': app_sql,
+                                },
+                                execute_sql, cursor, app_sql, throttle,
+                                resume_from - num_steps,
+                                lambda num_completed, offset=num_steps:
+                                    record_progress(offset + num_completed))
+                            num_steps += len(app_sql)
 
                         # Now update the evolution table
-                        version = Version(signature=current_signature)
+                        version = Version()
+                        version.set_signature(current_proj_sig)
                         version.save(**using_args)
 
                         for evolution in new_evolutions:
                             evolution.version = version
                             evolution.save(**using_args)
 
+                        # The evolution is recorded, so its progress is no
+                        # longer needed.
+                        progress.finish()
+
                         transaction.commit(**using_args)
                     except Exception, ex:
                         transaction.rollback(**using_args)
+
+                        if (progress.completed_steps and
+                            EvolutionProgress.objects.is_supported(database)):
+                            raise CommandError(
+                                'Error applying evolution: %s\n'
+                                'The first %d statement(s) of the evolution '
+                                'were committed. Run evolve --execute '
+                                'again to resume after them.'
+                                % (str(ex), progress.completed_steps))
+
                         raise CommandError('Error applying evolution: %s'
                                            % str(ex))
 
@@ -289,6 +408,24 @@ Type 'yes' to continue, or 'no' to cancel: """ % database)
 
                     if verbosity > 0:
                         print 'Evolution successful.'
+
+                        if throttle and throttle.num_pauses:
+                            print 'Paused %d time(s) for %.1f seconds due ' \
+                                  'to back-pressure.' \
+                                  % (throttle.num_pauses, throttle.total_time)
+
+                        execution_notes = [
+                            statement.execution_note
+                            for app_label, app_sql in sql_batches
+                            for statement in app_sql
+                            if getattr(statement, 'execution_note', None)
+                        ]
+
+                        if execution_notes:
+                            print 'Schema changes were run as follows:'
+
+                            for execution_note in execution_notes:
+                                print '    %s' % execution_note
                 else:
                     print self.style.ERROR('Evolution cancelled.')
             elif not compile_sql:
@@ -298,3 +435,288 @@ Type 'yes' to continue, or 'no' to cancel: """ % database)
                         print "Run './manage.py evolve %s--execute' to apply evolution." % (hint and '--hint ' or '')
         elif verbosity > 0:
             print 'No evolution required.'
+
+    def _get_cursor(self, database):
+        "Return a cursor for the database being evolved"
+        if is_multi_db():
+            from django.db import connections
+
+            return connections[database].cursor()
+        else:
+            return connection.cursor()
+
+    def _get_plan_hash(self, latest_version, sql_batches):
+        """
+        Return a hash identifying the SQL for an evolution of the stored
+        version, under which its progress is recorded.
+        """
+        plan = sha_constructor('%s\n' % latest_version.pk)
+
+        for app_label, app_sql in sql_batches:
+            for statement in app_sql:
+                if isinstance(statement, tuple):
+                    statement = '%s %r' % statement
+
+                plan.update(unicode(statement).encode('utf-8'))
+                plan.update('\n')
+
+        return plan.hexdigest()
+
+    def _get_throttle(self, options):
+        """
+        Return a Throttle for the back-pressure callbacks in the options and
+        settings, or None if there aren't any.
+        """
+        callbacks = []
+        path = getattr(settings, 'DJANGO_EVOLUTION_BACK_PRESSURE', None)
+
+        if path:
+            callbacks.append(load_back_pressure(path))
+
+        if options.get('pause_file'):
+            callbacks.append(FileBackPressure(options['pause_file']))
+
+        if options.get('probe_query'):
+            callbacks.append(QueryBackPressure(
+                options['probe_query'], options.get('probe_threshold') or 0))
+
+        if not callbacks:
+            return None
+        elif len(callbacks) == 1:
+            return Throttle(callbacks[0])
+        else:
+            return Throttle(CombinedBackPressure(callbacks))
+
+    def _write_hinted_evolutions(self, hinted_evolutions, verbosity):
+        """
+        Write each app's hinted mutations as a new evolution.
+
+        Apps whose evolutions can't be written are reported and skipped,
+        and the command fails once the others have been written.
+        """
+        failed = []
+
+        for app, mutations in hinted_evolutions:
+            app_label = app.__name__.split('.')[-2]
+
+            try:
+                label, filename = write_hinted_evolution(app, mutations)
+            except (EvolutionException, IOError, OSError), e:
+                print self.style.ERROR(
+                    'Unable to write the evolution for %s: %s'
+                    % (app_label, e))
+                failed.append(app_label)
+                continue
+
+            if verbosity > 0:
+                print "Wrote evolution '%s' for %s to %s" \
+                      % (label, app_label, filename)
+
+        if failed:
+            raise CommandError('The evolutions for the following '
+                               'application(s) were not written: %s'
+                               % ', '.join(failed))
+
+        if verbosity > 0:
+            print "Run './manage.py evolve --execute' to apply the new " \
+                  "evolutions."
+
+    def check_drift(self, *app_labels, **options):
+        """
+        Report differences between the live schema and the signatures.
+
+        Each database (or the one given by --database) is introspected
+        model by model, and compared against both its stored signature and
+        the current models. The report is printed as each model is checked.
+        If any drift is found, the command fails.
+        """
+        verbosity = int(options['verbosity'])
+        database = options.get('database')
+
+        if options['execute'] or options['hint'] or options['compile_sql']:
+            raise CommandError('--check-drift cannot be combined with '
+                               '--execute, --hint or --sql.')
+
+        for app_label in app_labels:
+            try:
+                get_app(app_label)
+            except (ImproperlyConfigured, ImportError), e:
+                raise CommandError("%s. Are you sure your INSTALLED_APPS "
+                                   "setting is correct?" % e)
+
+        if database:
+            databases = [database]
+        elif is_multi_db():
+            from django.db import connections
+            databases = list(connections)
+        else:
+            databases = [None]
+
+        drifted = []
+
+        for database in databases:
+            if self._check_database_drift(database, app_labels, verbosity):
+                drifted.append(database or 'default')
+
+        if drifted:
+            raise CommandError('The live schema has drifted in the '
+                               'following database(s): %s'
+                               % ', '.join(drifted))
+        elif verbosity > 0:
+            print 'No schema drift found.'
+
+    def _check_database_drift(self, database, app_labels, verbosity):
+        """
+        Print the schema drift in a database, returning whether any was
+        found.
+        """
+        if is_multi_db():
+            from django.db import connections
+            db_connection = connections[database]
+        else:
+            db_connection = connection
+
+        cursor = db_connection.cursor()
+        table_names = db_connection.introspection.get_table_list(cursor)
+
+        if Version._meta.db_table not in table_names:
+            if verbosity > 0:
+                print self.style.NOTICE(
+                    'Skipping the %r database, which has no evolution '
+                    'history.' % (database or 'default'))
+
+            return False
+
+        try:
+            latest_version = Version.objects.current_version(database)
+        except Version.DoesNotExist:
+            if verbosity > 0:
+                print self.style.NOTICE(
+                    'Skipping the %r database, which has no evolution '
+                    'baseline.' % (database or 'default'))
+
+            return False
+
+        stored_sig = latest_version.get_signature()
+        apps = {}
+
+        for app in get_apps():
+            apps[app.__name__.split('.')[-2]] = app
+
+        check_app_labels = [
+            app_label
+            for app_label in stored_sig.keys()
+            if app_label != '__version__'
+        ]
+        check_app_labels += [
+            app_label
+            for app_label in apps.keys()
+            if app_label not in check_app_labels
+        ]
+
+        if app_labels:
+            check_app_labels = [
+                app_label
+                for app_label in check_app_labels
+                if app_label in app_labels
+            ]
+
+        found_drift = False
+
+        # Applications are checked one at a time, so only one application's
+        # stored and current signatures are held in memory at once.
+        for app_label in check_app_labels:
+            if app_label in stored_sig:
+                stored_app_sig = stored_sig[app_label]
+            else:
+                stored_app_sig = {}
+
+            if app_label in apps:
+                current_app_sig = create_app_sig(apps[app_label], database)
+            else:
+                current_app_sig = {}
+
+            if self._check_app_drift(database, app_label, stored_app_sig,
+                                     current_app_sig, found_drift):
+                found_drift = True
+
+            if isinstance(stored_sig, LazyProjectSig):
+                stored_sig.unload(app_label)
+
+        if not found_drift and verbosity > 1:
+            print 'The %r database matches its stored signature and the ' \
+                  'current models.' % (database or 'default')
+
+        return found_drift
+
+    def _check_app_drift(self, database, app_label, stored_app_sig,
+                         current_app_sig, found_drift):
+        """
+        Print the schema drift for an application's models, returning
+        whether any was found.
+
+        found_drift says whether drift has already been reported for other
+        applications in the database.
+        """
+        # Introspect using both signatures, so that every field that
+        # should exist by either account can be mapped to its column.
+        base_app_sig = {}
+
+        for app_sig in (stored_app_sig, current_app_sig):
+            for model_name, model_sig in app_sig.items():
+                if model_name not in base_app_sig:
+                    base_app_sig[model_name] = {
+                        'meta': model_sig['meta'],
+                        'fields': model_sig['fields'].copy(),
+                    }
+                else:
+                    base_fields = base_app_sig[model_name]['fields']
+
+                    for field_name, field_sig in model_sig['fields'].items():
+                        base_fields.setdefault(field_name, field_sig)
+
+        base_sig = {
+            '__version__': 1,
+            app_label: base_app_sig,
+        }
+        app_drifted = False
+
+        for app_label, model_name, live_model_sig in \
+            iter_introspected_model_sigs(database or 'default', base_sig):
+            live_sig = {
+                '__version__': 1,
+                app_label: {},
+            }
+
+            if live_model_sig is not None:
+                live_sig[app_label][model_name] = live_model_sig
+
+            for description, app_sig in (('stored signature', stored_app_sig),
+                                         ('current models', current_app_sig)):
+                model_sig = app_sig.get(model_name)
+
+                if model_sig is None:
+                    continue
+
+                diff = Diff({
+                    '__version__': 1,
+                    app_label: {
+                        model_name: model_sig,
+                    },
+                }, live_sig)
+
+                if not diff.is_empty():
+                    if not found_drift and not app_drifted:
+                        print self.style.ERROR(
+                            'Schema drift in the %r database:'
+                            % (database or 'default'))
+
+                    app_drifted = True
+
+                    print '    The live schema differs from the %s:' \
+                          % description
+
+                    for line in str(diff).splitlines():
+                        print '        %s' % line
+
+        return app_drifted
@@ -0,0 +1,94 @@
+from optparse import make_option
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_app
+
+from django_evolution import EvolutionException
+from django_evolution.evolve import get_evolution_sequence, get_mutations, \
+                                   write_squashed_evolution
+from django_evolution.mutations import SQLMutation
+from django_evolution.squash import squash_mutations
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--label', action='store', dest='label',
+            help='The name of the squashed evolution (default '
+                 '"squashed_through_<last label>").'),
+        make_option(
+            '--through', action='store', dest='through',
+            help='The label of the last evolution to squash (default: the '
+                 'last evolution in the sequence).'),
+    )
+
+    if '--verbosity' not in [opt.get_opt_string()
+                             for opt in BaseCommand.option_list]:
+        option_list += make_option('-v', '--verbosity', action='store',
+                                   dest='verbosity', default='1',
+            type='choice', choices=['0', '1', '2'],
+            help='Verbosity level; 0=minimal output, 1=normal output, '
+                 '2=all output'),
+
+    help = ("Squashes the start of an application's evolution sequence into "
+            "a single, equivalent evolution.")
+    args = '<appname>'
+
+    requires_model_validation = False
+
+    def handle(self, *app_labels, **options):
+        verbosity = int(options['verbosity'])
+        through = options.get('through')
+
+        if len(app_labels) != 1:
+            raise CommandError('squash_evolutions takes exactly one '
+                               'application name.')
+
+        app_label = app_labels[0]
+
+        try:
+            app = get_app(app_label)
+        except (ImproperlyConfigured, ImportError), e:
+            raise CommandError("%s. Are you sure your INSTALLED_APPS "
+                               "setting is correct?" % e)
+
+        sequence = get_evolution_sequence(app)
+
+        if through:
+            if through not in sequence:
+                raise CommandError("There's no evolution named %s in the "
+                                   "sequence for %s." % (through, app_label))
+
+            replaces = sequence[:sequence.index(through) + 1]
+        else:
+            replaces = list(sequence)
+
+        if len(replaces) < 2:
+            raise CommandError('There must be at least two evolutions to '
+                               'squash.')
+
+        label = options.get('label') or 'squashed_through_%s' % replaces[-1]
+
+        try:
+            mutations = get_mutations(app, replaces, None)
+
+            for mutation in mutations:
+                if isinstance(mutation, SQLMutation):
+                    raise EvolutionException(
+                        'Evolutions containing SQL cannot be squashed.')
+
+            squashed = squash_mutations(app_label, mutations)
+            filename = write_squashed_evolution(app, label, squashed,
+                                                replaces)
+        except (EvolutionException, IOError, OSError), e:
+            raise CommandError('Unable to squash the evolutions for %s: %s'
+                               % (app_label, e))
+
+        if verbosity > 0:
+            print "Squashed %d evolution(s) (%d mutation(s)) into '%s' " \
+                  "(%d mutation(s)) at %s" \
+                  % (len(replaces), len(mutations), label, len(squashed),
+                     filename)
+            print 'The replaced evolution modules are still needed by ' \
+                  'databases that have applied only some of them.'
@@ -1,11 +1,267 @@
 from datetime import datetime
 
-from django.db import models
+from django.db import connection, models
+
+from django_evolution import EvolutionException, is_multi_db
+from django_evolution.signature import LazyProjectSig, \
+                                      create_signature_hash, \
+                                      deserialize_app_signature, \
+                                      deserialize_manifest, \
+                                      deserialize_signature, \
+                                      serialize_app_signature, \
+                                      serialize_manifest, \
+                                      serialize_signature
+
+if is_multi_db():
+    from django.db import connections
+    from django.db.utils import DEFAULT_DB_ALIAS
+
+
+# The maximum number of hashes looked up in a single query.
+HASH_LOOKUP_BATCH_SIZE = 500
+
+
+def _get_connection(using):
+    if is_multi_db():
+        return connections[using or DEFAULT_DB_ALIAS]
+    else:
+        return connection
+
+
+def _has_table(db_table, using):
+    db_connection = _get_connection(using)
+    cursor = db_connection.cursor()
+
+    return db_table in db_connection.introspection.get_table_list(cursor)
+
+
+class SignatureBlobManager(models.Manager):
+    def __init__(self):
+        super(SignatureBlobManager, self).__init__()
+        self._blob_support = {}
+
+        # Blobs are addressed by the hash of their contents, so their data
+        # never changes and can be kept for the life of the process.
+        self._data_cache = {}
+
+    def _get_queryset(self, using):
+        queryset = self.all()
+
+        if is_multi_db():
+            queryset = queryset.using(using)
+
+        return queryset
+
+    def _iter_batches(self, hashes):
+        hashes = list(hashes)
+
+        for i in range(0, len(hashes), HASH_LOOKUP_BATCH_SIZE):
+            yield hashes[i:i + HASH_LOOKUP_BATCH_SIZE]
+
+    def is_supported(self, using=None):
+        """Returns whether the database has a table for signature blobs.
+
+        Databases created before the table was introduced won't have it
+        until syncdb is run. The result is only cached once the table
+        exists.
+        """
+        if self._blob_support.get(using):
+            return True
+
+        supported = _has_table(self.model._meta.db_table, using)
+        self._blob_support[using] = supported
+
+        return supported
+
+    def store_project_sig(self, proj_sig, using=None):
+        """Stores each application's signature as a blob.
+
+        Only signatures that aren't already stored are written. Returns
+        the serialized manifest of the blobs making up the project
+        signature.
+        """
+        manifest = {
+            '__version__': proj_sig.get('__version__', 1),
+        }
+        blobs = {}
+
+        for app_label, app_sig in proj_sig.items():
+            if app_label != '__version__':
+                sig_hash, data = serialize_app_signature(app_sig)
+                manifest[app_label] = sig_hash
+                blobs[sig_hash] = data
+
+        queryset = self._get_queryset(using)
+        existing_hashes = set()
+
+        for hashes in self._iter_batches(blobs.keys()):
+            existing_hashes.update(
+                queryset.filter(hash__in=hashes).values_list('hash',
+                                                             flat=True))
+
+        for sig_hash, data in blobs.items():
+            if sig_hash not in existing_hashes:
+                blob = self.model(hash=sig_hash, data=data)
+
+                if is_multi_db():
+                    blob.save(using=using)
+                else:
+                    blob.save()
+
+            self._data_cache[sig_hash] = data
+
+        return serialize_manifest(manifest)
+
+    def load_project_sig(self, manifest, using=None):
+        """Loads the project signature described by a manifest.
+
+        Each application's signature is only deserialized when it's first
+        accessed. The blobs that haven't already been loaded by this
+        process are fetched together, the first time any of them is
+        needed.
+        """
+        app_labels = [
+            app_label
+            for app_label in manifest.keys()
+            if app_label != '__version__'
+        ]
+        app_labels.sort()
+
+        def load_app_sig(app_label):
+            sig_hash = manifest[app_label]
+
+            if sig_hash not in self._data_cache:
+                self._fetch_blobs([
+                    manifest[label]
+                    for label in app_labels
+                    if manifest[label] not in self._data_cache
+                ], using)
+
+            try:
+                data = self._data_cache[sig_hash]
+            except KeyError:
+                raise self.model.DoesNotExist(
+                    'The stored signature for %s (%s) is missing.'
+                    % (app_label, sig_hash))
+
+            return deserialize_app_signature(data)
+
+        return LazyProjectSig(app_labels, load_app_sig,
+                              manifest.get('__version__', 1))
+
+    def _fetch_blobs(self, hashes, using):
+        queryset = self._get_queryset(using)
+
+        for batch in self._iter_batches(hashes):
+            for sig_hash, data in \
+                queryset.filter(hash__in=batch).values_list('hash', 'data'):
+                self._data_cache[sig_hash] = data
+
+    def delete_unreferenced(self, using=None):
+        """Deletes the blobs that no stored version refers to.
+
+        Returns the number of blobs deleted.
+        """
+        versions = Version.objects.exclude(signature='')
+
+        if is_multi_db():
+            versions = versions.using(using)
+
+        referenced_hashes = set()
+
+        for signature in versions.values_list('signature', flat=True):
+            manifest = deserialize_manifest(signature)
+
+            if manifest is not None:
+                referenced_hashes.update([
+                    sig_hash
+                    for app_label, sig_hash in manifest.items()
+                    if app_label != '__version__'
+                ])
+
+        queryset = self._get_queryset(using)
+        stale_ids = [
+            blob_id
+            for blob_id, sig_hash in queryset.values_list('pk', 'hash')
+            if sig_hash not in referenced_hashes
+        ]
+
+        for ids in self._iter_batches(stale_ids):
+            queryset.filter(pk__in=ids).delete()
+
+        return len(stale_ids)
+
+
+class SignatureBlob(models.Model):
+    """The stored signature of a single application.
+
+    Versions refer to one blob per application, so an application's
+    signature is only stored again when it changes.
+    """
+    hash = models.CharField(max_length=40, unique=True)
+    data = models.TextField()
+
+    objects = SignatureBlobManager()
+
+    class Meta:
+        db_table = 'django_evolution_signature_blob'
+
+    def __unicode__(self):
+        return u'Signature blob %s' % self.hash
+
+
+class VersionManager(models.Manager):
+    def __init__(self):
+        super(VersionManager, self).__init__()
+        self._signature_hash_support = {}
+
+    def current_version(self, using=None):
+        """Returns the most recent version stored in the database.
+
+        This is safe to call before django_evolution's own evolutions
+        have been applied to the database.
+        """
+        queryset = self.all()
+
+        if is_multi_db():
+            queryset = queryset.using(using)
+
+        if not self.supports_signature_hash(using):
+            queryset = queryset.defer('signature_hash')
+
+        return queryset.latest('when')
+
+    def supports_signature_hash(self, using=None):
+        """Returns whether the database has a signature_hash column.
+
+        Databases created before the column was introduced won't have it
+        until django_evolution's evolutions are applied. The result is
+        only cached once the column exists.
+        """
+        if self._signature_hash_support.get(using):
+            return True
+
+        db_connection = _get_connection(using)
+        cursor = db_connection.cursor()
+        introspection = db_connection.introspection
+
+        columns = [
+            row[0]
+            for row in introspection.get_table_description(
+                cursor, self.model._meta.db_table)
+        ]
+        supported = 'signature_hash' in columns
+        self._signature_hash_support[using] = supported
+
+        return supported
 
 
 class Version(models.Model):
     signature = models.TextField()
-    when = models.DateTimeField(default=datetime.now)
+    signature_hash = models.CharField(max_length=40, blank=True, default='')
+    when = models.DateTimeField(default=datetime.now, db_index=True)
+
+    objects = VersionManager()
 
     class Meta:
         ordering = ('-when',)
@@ -17,6 +273,69 @@ class Version(models.Model):
 
         return u'Stored version, updated on %s' % self.when
 
+    def is_stub(self):
+        """Returns whether the signature for this version has been compacted.
+
+        Stub versions are left behind by the compact_evolution_history
+        command. They keep their evolutions, but no longer store the
+        project signature.
+        """
+        return not self.signature
+
+    def get_signature(self):
+        """Returns the project signature stored for this version.
+
+        Stub versions no longer have a signature, so an EvolutionException
+        is raised for them.
+        """
+        proj_sig = getattr(self, '_pending_proj_sig', None)
+
+        if proj_sig is not None:
+            return proj_sig
+
+        if self.is_stub():
+            raise EvolutionException(
+                'The signature for the version stored on %s has been '
+                'removed by compact_evolution_history.' % self.when)
+
+        manifest = deserialize_manifest(self.signature)
+
+        if manifest is None:
+            return deserialize_signature(self.signature)
+
+        if is_multi_db():
+            using = self._state.db
+        else:
+            using = None
+
+        return SignatureBlob.objects.load_project_sig(manifest, using)
+
+    def set_signature(self, proj_sig):
+        """Stores a project signature, along with its hash.
+
+        The signature is written when the version is saved. Each
+        application's signature is stored separately, so only those that
+        have changed since a previous version take up more space.
+        """
+        self._pending_proj_sig = proj_sig
+        self.signature_hash = create_signature_hash(proj_sig)
+
+    def save(self, *args, **kwargs):
+        proj_sig = getattr(self, '_pending_proj_sig', None)
+
+        if proj_sig is not None:
+            using = kwargs.get('using')
+
+            if SignatureBlob.objects.is_supported(using):
+                self.signature = \
+                    SignatureBlob.objects.store_project_sig(proj_sig, using)
+            else:
+                self.signature = serialize_signature(proj_sig)
+
+            self._pending_proj_sig = None
+
+        super(Version, self).save(*args, **kwargs)
+
 
 class Evolution(models.Model):
     version = models.ForeignKey(Version, related_name='evolutions')
@@ -28,3 +347,194 @@ class Evolution(models.Model):
 
     def __unicode__(self):
         return u"Evolution %s, applied to %s" % (self.label, self.app_label)
+
+
+class DataMutationCheckpointManager(models.Manager):
+    def __init__(self):
+        super(DataMutationCheckpointManager, self).__init__()
+        self._checkpoint_support = {}
+
+    def is_supported(self, using=None):
+        """Returns whether the database has a table for checkpoints.
+
+        Databases created before the table was introduced won't have it
+        until syncdb is run. The result is only cached once the table
+        exists.
+        """
+        if self._checkpoint_support.get(using):
+            return True
+
+        supported = _has_table(self.model._meta.db_table, using)
+        self._checkpoint_support[using] = supported
+
+        return supported
+
+    def get_checkpoint(self, app_label, tag, using=None):
+        """Returns the checkpoint for a data mutation.
+
+        A new, unsaved checkpoint is returned if the mutation hasn't run
+        before, or if the database doesn't support checkpoints yet.
+        """
+        checkpoint = None
+
+        if self.is_supported(using):
+            queryset = self.all()
+
+            if is_multi_db():
+                queryset = queryset.using(using)
+
+            try:
+                checkpoint = queryset.get(app_label=app_label, tag=tag)
+            except self.model.DoesNotExist:
+                pass
+
+        if checkpoint is None:
+            checkpoint = self.model(app_label=app_label, tag=tag)
+
+        checkpoint.using = using
+
+        return checkpoint
+
+
+class DataMutationCheckpoint(models.Model):
+    """The progress of a DataMutation.
+
+    The primary key of the last row processed is stored after each chunk
+    of rows, so that an interrupted mutation can resume where it left off.
+    """
+    app_label = models.CharField(max_length=100)
+    tag = models.CharField(max_length=100)
+    last_pk = models.CharField(max_length=255, blank=True, default='')
+    completed = models.BooleanField(default=False)
+    updated = models.DateTimeField(default=datetime.now)
+
+    objects = DataMutationCheckpointManager()
+
+    class Meta:
+        db_table = 'django_evolution_data_checkpoint'
+        unique_together = (('app_label', 'tag'),)
+
+    def __unicode__(self):
+        return u'Checkpoint for %s.%s' % (self.app_label, self.tag)
+
+    def get_last_pk(self, model):
+        "Returns the primary key of the last row processed, if any"
+        if not self.last_pk:
+            return None
+
+        return model._meta.pk.to_python(self.last_pk)
+
+    def update(self, last_pk, completed=False):
+        """Records the progress of the mutation.
+
+        Nothing is stored if the database doesn't support checkpoints.
+        """
+        if last_pk is not None:
+            self.last_pk = unicode(last_pk)
+
+        self.completed = completed
+        self.updated = datetime.now()
+
+        if DataMutationCheckpoint.objects.is_supported(self.using):
+            if is_multi_db():
+                self.save(using=self.using)
+            else:
+                self.save()
+
+
+class EvolutionProgressManager(models.Manager):
+    def __init__(self):
+        super(EvolutionProgressManager, self).__init__()
+        self._progress_support = {}
+
+    def _get_queryset(self, using):
+        queryset = self.all()
+
+        if is_multi_db():
+            queryset = queryset.using(using)
+
+        return queryset
+
+    def is_supported(self, using=None):
+        """Returns whether the database has a table for evolution progress.
+
+        Databases created before the table was introduced won't have it
+        until syncdb is run. The result is only cached once the table
+        exists.
+        """
+        if self._progress_support.get(using):
+            return True
+
+        supported = _has_table(self.model._meta.db_table, using)
+        self._progress_support[using] = supported
+
+        return supported
+
+    def get_progress(self, plan_hash, using=None):
+        """Returns the progress recorded for an evolution's SQL.
+
+        A new, unsaved record is returned if no progress has been recorded
+        for the SQL, or if the database doesn't support recording progress
+        yet.
+        """
+        progress = None
+
+        if self.is_supported(using):
+            try:
+                progress = self._get_queryset(using).get(plan_hash=plan_hash)
+            except self.model.DoesNotExist:
+                pass
+
+        if progress is None:
+            progress = self.model(plan_hash=plan_hash)
+
+        progress.using = using
+
+        return progress
+
+
+class EvolutionProgress(models.Model):
+    """The progress of an evolution that commits part way through.
+
+    Evolutions are normally executed in a single transaction. Steps that
+    commit the changes made so far, such as data mutations, record the
+    number of statements completed, so that a failed evolution can resume
+    after them. The record is deleted once the evolution is recorded.
+    """
+    plan_hash = models.CharField(max_length=40, unique=True)
+    completed_steps = models.IntegerField(default=0)
+    updated = models.DateTimeField(default=datetime.now)
+
+    objects = EvolutionProgressManager()
+
+    class Meta:
+        db_table = 'django_evolution_progress'
+
+    def __unicode__(self):
+        return u'Progress of evolution %s' % self.plan_hash
+
+    def _save(self):
+        self.updated = datetime.now()
+
+        if EvolutionProgress.objects.is_supported(self.using):
+            if is_multi_db():
+                self.save(using=self.using)
+            else:
+                self.save()
+
+    def update(self, completed_steps):
+        """Records the number of statements completed.
+
+        Nothing is stored if the database doesn't support recording
+        progress.
+        """
+        self.completed_steps = completed_steps
+        self._save()
+
+    def finish(self):
+        """Deletes the record once the evolution has been recorded."""
+        if self.pk is not None:
+            if is_multi_db():
+                self.delete(using=self.using)
+            else:
+                self.delete()
@@ -2,12 +2,14 @@ import copy
 
 from django.db.models.fields import *
 from django.db.models.fields.related import *
-from django.db import models
+from django.db import models, transaction
 from django.utils.datastructures import SortedDict
 from django.utils.functional import curry
 
 from django_evolution.signature import ATTRIBUTE_DEFAULTS
-from django_evolution import CannotSimulate, SimulationFailure, EvolutionNotImplementedError, is_multi_db
+from django_evolution import CannotSimulate, EvolutionException, \
+                             EvolutionNotImplementedError, SimulationFailure, \
+                             is_multi_db
 from django_evolution.db import EvolutionOperationsMulti
 
 FK_INTEGER_TYPES = [
@@ -302,6 +304,124 @@ class SQLMutation(BaseMutation):
         return True
 
 
+class DataMutation(MonoBaseMutation):
+    """
+    Runs a Python function over each row of a model, a chunk at a time.
+
+    Rows are fetched in order of primary key, chunk_size rows at a time,
+    and the transaction is committed after each chunk, along with a
+    checkpoint of the last primary key processed. If the mutation is
+    interrupted, running it again resumes after the last committed chunk.
+    Any SQL run before the mutation is committed with the first chunk.
+
+    func is called with each row, as an instance of the current model, and
+    is responsible for saving any changes. fields limits the columns that
+    are loaded, for when the model has fields that don't exist in the
+    database yet.
+
+    Data mutations don't change the schema, so they simulate without
+    changes, unless update_func is provided to update the signature (as
+    with SQLMutation).
+    """
+    def __init__(self, tag, model_name, func, chunk_size=1000, fields=None,
+                 update_func=None):
+        MonoBaseMutation.__init__(self, model_name)
+        self.tag = tag
+        self.func = func
+        self.chunk_size = chunk_size
+        self.fields = fields
+        self.update_func = update_func
+
+    def __str__(self):
+        return "DataMutation('%s', '%s')" % (self.tag, self.model_name)
+
+    def simulate(self, app_label, proj_sig, database=None):
+        if callable(self.update_func):
+            self.update_func(app_label, proj_sig)
+
+    def mutate(self, app_label, proj_sig, database=None):
+        "The data is updated when the returned step is executed"
+        return [DataMutationStep(self, app_label, database)]
+
+
+class DataMutationStep(object):
+    """
+    The execution of a DataMutation, in the list of SQL statements for an
+    evolution.
+
+    This is called with the cursor the evolution is executed on, in place
+    of running a statement. If a Throttle is given, it's consulted between
+    chunks of rows.
+
+    Each chunk is committed, so this is a commit boundary: the statements
+    before it are committed, along with a record of the evolution's
+    progress, before the first chunk is processed.
+    """
+    commit_boundary = True
+
+    def __init__(self, mutation, app_label, database):
+        self.mutation = mutation
+        self.app_label = app_label
+        self.database = database
+
+    def __unicode__(self):
+        return u'-- Run data mutation %s on %s.%s in chunks of %d rows' \
+               % (self.mutation.tag, self.app_label,
+                  self.mutation.model_name, self.mutation.chunk_size)
+
+    def __call__(self, cursor, throttle=None):
+        from django_evolution.models import DataMutationCheckpoint
+
+        mutation = self.mutation
+        model = models.get_model(self.app_label, mutation.model_name)
+
+        if model is None:
+            raise EvolutionException(
+                "Cannot run data mutation %s: there's no model named '%s.%s'."
+                % (mutation.tag, self.app_label, mutation.model_name))
+
+        checkpoint = DataMutationCheckpoint.objects.get_checkpoint(
+            self.app_label, mutation.tag, self.database)
+
+        if checkpoint.completed:
+            return
+
+        queryset = model._base_manager.order_by('pk')
+        using_args = {}
+
+        if is_multi_db():
+            queryset = queryset.using(self.database)
+            using_args['using'] = self.database
+
+        if mutation.fields:
+            queryset = queryset.only(*mutation.fields)
+
+        last_pk = checkpoint.get_last_pk(model)
+
+        while True:
+            chunk = queryset
+
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+
+            num_rows = 0
+
+            for row in chunk[:mutation.chunk_size].iterator():
+                mutation.func(row)
+                last_pk = row.pk
+                num_rows += 1
+
+            completed = num_rows < mutation.chunk_size
+            checkpoint.update(last_pk, completed)
+            transaction.commit(**using_args)
+
+            if completed:
+                break
+
+            if throttle is not None:
+                throttle.wait(self.database)
+
+
 class DeleteField(MonoBaseMutation):
     def __init__(self, model_name, field_name):
         MonoBaseMutation.__init__(self, model_name)
@@ -642,24 +762,31 @@ class DeleteModel(MonoBaseMutation):
         # Simulate the deletion of the model.
         del app_sig[self.model_name]
 
-    def mutate(self, app_label, proj_sig, database=None):
-        app_sig = proj_sig[app_label]
-        model_sig = app_sig[self.model_name]
-
-        sql_statements = []
+    def get_table_names(self, app_label, proj_sig):
+        """
+        Returns the names of the model's many to many tables, followed by
+        the name of the model's table.
+        """
+        model_sig = proj_sig[app_label][self.model_name]
         model = MockModel(proj_sig, app_label, self.model_name, model_sig)
+        table_names = []
 
-        # Remove any many to many tables.
         for field_name, field_sig in model_sig['fields'].items():
             if field_sig['field_type'] == models.ManyToManyField:
                 field = model._meta.get_field(field_name)
-                m2m_table = field._get_m2m_db_table(model._meta)
-                sql_statements += self.evolver(model).delete_table(m2m_table)
+                table_names.append(field._get_m2m_db_table(model._meta))
 
-        # Remove the table itself.
-        sql_statements += self.evolver(model).delete_table(model._meta.db_table)
+        table_names.append(model._meta.db_table)
 
-        return sql_statements
+        return table_names
+
+    def mutate(self, app_label, proj_sig, database=None):
+        app_sig = proj_sig[app_label]
+        model_sig = app_sig[self.model_name]
+        model = MockModel(proj_sig, app_label, self.model_name, model_sig)
+
+        return self.evolver(model).delete_tables(
+            self.get_table_names(app_label, proj_sig))
 
 
 class DeleteApplication(BaseMutation):
@@ -684,15 +811,82 @@ class DeleteApplication(BaseMutation):
         # all models at a same time if they aren't owned by the same database
         if database:
             app_sig = proj_sig[app_label]
+            mutations = []
 
             for model_name in app_sig.keys():
                 mutation = DeleteModel(model_name)
 
                 if mutation.is_mutable(app_label, proj_sig, database):
-                    sql_statements.extend(mutation.mutate(app_label, proj_sig))
+                    mutations.append(mutation)
+
+            if mutations:
+                # All the tables are dropped at once. The many to many tables
+                # go first, followed by the models' tables, with each table
+                # before any it references.
+                table_names = []
+                model_tables = []
+
+                for mutation in self._sort_by_references(app_label, app_sig,
+                                                         mutations):
+                    mutation_tables = mutation.get_table_names(app_label,
+                                                               proj_sig)
+                    table_names.extend(mutation_tables[:-1])
+                    model_tables.append(mutation_tables[-1])
+
+                table_names.extend(model_tables)
+                model_sig = app_sig[mutations[0].model_name]
+                model = MockModel(proj_sig, app_label,
+                                  mutations[0].model_name, model_sig)
+                sql_statements = \
+                    mutations[0].evolver(model).delete_tables(table_names)
 
         return sql_statements
 
+    def _sort_by_references(self, app_label, app_sig, mutations):
+        """
+        Sorts DeleteModel mutations so that each model comes before the
+        models it references through foreign keys. Models that reference
+        each other are left in their original order.
+        """
+        references = {}
+
+        for mutation in mutations:
+            model_references = []
+
+            for field_sig in app_sig[mutation.model_name]['fields'].values():
+                related_model = field_sig.get('related_model')
+
+                if (related_model and
+                    field_sig['field_type'] != models.ManyToManyField):
+                    related_app_label, related_model_name = \
+                        related_model.split('.')
+
+                    if (related_app_label == app_label and
+                        related_model_name != mutation.model_name):
+                        model_references.append(related_model_name)
+
+            references[mutation.model_name] = model_references
+
+        remaining = list(mutations)
+        sorted_mutations = []
+
+        while remaining:
+            referenced = set()
+
+            for mutation in remaining:
+                referenced.update(references[mutation.model_name])
+
+            for mutation in remaining:
+                if mutation.model_name not in referenced:
+                    break
+            else:
+                mutation = remaining[0]
+
+            remaining.remove(mutation)
+            sorted_mutations.append(mutation)
+
+        return sorted_mutations
+
     def is_mutable(self, app_label, proj_sig, database):
         # the test is done in the mutate method above. We can return True
         return True
@@ -0,0 +1,76 @@
+"""
+A profiling hook for the evolution pipeline, used by evolve --profile.
+
+The hook listens to the operation signals. It totals the time spent in each
+kind of operation and profiles the code run by operations with cProfile.
+"""
+import cProfile
+import pstats
+import sys
+
+from django_evolution.signals import evolution_operation_started, \
+                                     evolution_operation_finished
+
+
+class EvolutionProfiler(object):
+    """
+    Collects timings and profiling data for evolution operations.
+
+    Operations can be nested (for instance, an application's signature may
+    be built during a diff), so only the outermost operation is profiled,
+    and nested time is counted against each operation it falls within.
+    """
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.timings = {}
+        self.depth = 0
+
+    def connect(self):
+        "Start listening for operations"
+        evolution_operation_started.connect(self._on_started)
+        evolution_operation_finished.connect(self._on_finished)
+
+    def disconnect(self):
+        "Stop listening for operations"
+        evolution_operation_started.disconnect(self._on_started)
+        evolution_operation_finished.disconnect(self._on_finished)
+
+    def _on_started(self, sender, **kwargs):
+        if self.depth == 0:
+            self.profile.enable()
+
+        self.depth += 1
+
+    def _on_finished(self, sender, operation, duration, **kwargs):
+        self.depth -= 1
+
+        if self.depth == 0:
+            self.profile.disable()
+
+        count, total = self.timings.get(operation, (0, 0.0))
+        self.timings[operation] = (count + 1, total + duration)
+
+    def print_report(self, stream=None, limit=25):
+        """
+        Print the time spent in each kind of operation, followed by the
+        functions that took the most time.
+        """
+        if stream is None:
+            stream = sys.stdout
+
+        stream.write('%-20s %8s %12s\n' % ('Operation', 'Calls',
+                                           'Time (ms)'))
+
+        operations = self.timings.keys()
+        operations.sort()
+
+        for operation in operations:
+            count, total = self.timings[operation]
+            stream.write('%-20s %8d %12.2f\n' % (operation, count,
+                                                 total * 1000))
+
+        stream.write('\n')
+
+        if self.timings:
+            stats = pstats.Stats(self.profile, stream=stream)
+            stats.sort_stats('cumulative').print_stats(limit)
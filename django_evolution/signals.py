@@ -0,0 +1,102 @@
+"""
+Signals sent around each stage of the evolution pipeline.
+
+Every operation sends evolution_operation_started before it runs and
+evolution_operation_finished after it runs (even if it fails), with these
+arguments:
+
+    operation:  The name of the operation. One of 'create_signature',
+                'diff', 'is_mutable', 'mutate', 'simulate', 'execute_sql'
+                or 'throttle'.
+    app_label:  The label of the application involved, if any.
+    model_name: The name of the model involved, if any.
+    field_name: The name of the field involved, if any.
+    database:   The database involved, if any.
+    mutation:   The mutation involved, for mutation operations.
+    sql:        The statements being executed, for 'execute_sql'.
+    start_time: The time the operation started, from timer().
+
+evolution_operation_finished also receives:
+
+    end_time:   The time the operation finished, from timer().
+    duration:   The time taken, in seconds.
+    exception:  The exception raised by the operation, or None.
+"""
+import time
+
+from django.dispatch import Signal
+
+
+OPERATION_ARGS = ['operation', 'app_label', 'model_name', 'field_name',
+                  'database', 'mutation', 'sql', 'start_time']
+
+evolution_operation_started = Signal(providing_args=OPERATION_ARGS)
+
+evolution_operation_finished = Signal(
+    providing_args=OPERATION_ARGS + ['end_time', 'duration', 'exception'])
+
+# The clock used for operation timings. This is monotonic where the Python
+# version provides one.
+timer = getattr(time, 'monotonic', time.time)
+
+
+def run_operation(operation, info, func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) as an operation, sending the operation
+    signals around it.
+
+    info is a dictionary of extra signal arguments (app_label, model_name,
+    and so on). Arguments not given are sent as None.
+    """
+    if (not evolution_operation_started.receivers and
+        not evolution_operation_finished.receivers):
+        return func(*args, **kwargs)
+
+    signal_args = {
+        'operation': operation,
+    }
+
+    for arg in OPERATION_ARGS[1:-1]:
+        signal_args[arg] = info.get(arg)
+
+    signal_args['start_time'] = start_time = timer()
+    evolution_operation_started.send(sender=run_operation, **signal_args)
+    exception = None
+
+    try:
+        try:
+            return func(*args, **kwargs)
+        except Exception, e:
+            exception = e
+            raise
+    finally:
+        end_time = timer()
+        evolution_operation_finished.send(sender=run_operation,
+                                          end_time=end_time,
+                                          duration=end_time - start_time,
+                                          exception=exception,
+                                          **signal_args)
+
+
+def get_mutation_info(mutation, app_label, database):
+    "Return the operation info for a mutation"
+    return {
+        'app_label': app_label,
+        'model_name': getattr(mutation, 'model_name', None),
+        'field_name': (getattr(mutation, 'field_name', None) or
+                       getattr(mutation, 'old_field_name', None)),
+        'database': database,
+        'mutation': mutation,
+    }
+
+
+def run_mutation_operation(operation, mutation, app_label, proj_sig,
+                           database):
+    """
+    Call a mutation's is_mutable(), mutate() or simulate() method, sending
+    the operation signals around it.
+    """
+    return run_operation(operation,
+                         get_mutation_info(mutation, app_label, database),
+                         getattr(mutation, operation), app_label, proj_sig,
+                         database)
@@ -1,9 +1,26 @@
+import base64
+import copy
+import zlib
+from UserDict import DictMixin
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle as pickle
+try:
+    # The json module in Python 2.6+ has C speedups, which Django's bundled
+    # copy of simplejson lacks.
+    import json as simplejson
+except ImportError:
+    from django.utils import simplejson
+
 from django.db.models import get_apps, get_models
 from django.db.models.fields.related import *
-from django.conf import global_settings
+from django.conf import global_settings, settings
 from django.contrib.contenttypes import generic
 from django.utils.datastructures import SortedDict
+from django.utils.hashcompat import sha_constructor
 from django_evolution import is_multi_db
+from django_evolution.signals import run_operation
 
 if is_multi_db():
     from django.db import router
@@ -35,31 +52,245 @@ ATTRIBUTE_ALIASES = {
     'unique': '_unique'
 }
 
-def create_field_sig(field):
-    field_sig = {
-        'field_type': field.__class__,
-    }
+# The attributes stored for each field class, built by
+# _get_field_attribute_plan().
+_field_attribute_plans = {}
+
+def _get_field_attribute_plan(field):
+    """
+    Return the (attribute, alias, default) tuples to check for a field.
 
-    for attrib in ATTRIBUTE_DEFAULTS.keys():
-        alias = ATTRIBUTE_ALIASES.get(attrib, attrib)
-        if hasattr(field,alias):
-            value = getattr(field,alias)
-            if isinstance(field, ForeignKey):
-                if attrib == 'db_index':
+    This only depends on the field's class, so it's built once for each
+    class from the first field seen. Attributes that fields of the class
+    don't have are left out.
+    """
+    field_class = field.__class__
+
+    try:
+        return _field_attribute_plans[field_class]
+    except KeyError:
+        plan = []
+
+        for attrib, default in ATTRIBUTE_DEFAULTS.items():
+            alias = ATTRIBUTE_ALIASES.get(attrib, attrib)
+
+            if hasattr(field, alias):
+                if attrib == 'db_index' and isinstance(field, ForeignKey):
                     default = True
-                else:
-                    default = ATTRIBUTE_DEFAULTS[attrib]
+
+                plan.append((attrib, alias, default))
+
+        plan = tuple(plan)
+        _field_attribute_plans[field_class] = plan
+
+        return plan
+
+# The maximum number of attribute tuples kept for sharing between field
+# signatures. The cache is cleared when it fills up. Signatures that were
+# already built keep their tuples.
+FIELD_SIG_CACHE_SIZE = 10000
+
+# The attribute tuples shared by identical field signatures, along with
+# whether their field type is lazy. They're keyed by their attributes, with
+# field types replaced by their class paths.
+_field_sig_items = {}
+
+# The class paths of field classes.
+_field_type_paths = {}
+
+# The attribute tuples shared by signatures created from fields, keyed by
+# their attributes in the order they were checked.
+_created_field_sig_items = {}
+
+def _intern_field_items(items):
+    """
+    Return the shared, sorted tuple for a list of (attribute, value) pairs.
+
+    Field types are compared by their class paths, so lazy field types are
+    never imported. A tuple holding a lazy field type is never shared with
+    a signature holding the field class itself, so signatures created from
+    fields always hold the classes. Values that can't be hashed can't be
+    shared, so signatures containing them get a tuple of their own.
+    """
+    items.sort()
+    key = []
+    lazy = False
+
+    for name, value in items:
+        if name == 'field_type':
+            if isinstance(value, LazyFieldType):
+                value = value.path
+                lazy = True
             else:
-                default = ATTRIBUTE_DEFAULTS[attrib]
-            # only store non-default values
-            if default != value:
-                field_sig[attrib] = value
+                try:
+                    value = _field_type_paths[value]
+                except KeyError:
+                    path = get_field_type_path(value)
+                    _field_type_paths[value] = path
+                    value = path
+
+        key.append((name, value))
+
+    key = tuple(key)
+
+    try:
+        shared_items, shared_lazy = _field_sig_items[key]
+    except KeyError:
+        pass
+    except TypeError:
+        return tuple(items)
+    else:
+        if lazy or not shared_lazy:
+            return shared_items
+
+    if len(_field_sig_items) >= FIELD_SIG_CACHE_SIZE:
+        _field_sig_items.clear()
+
+    items = tuple(items)
+    _field_sig_items[key] = (items, lazy)
+
+    return items
+
+class FieldSignature(DictMixin, object):
+    """
+    The signature of a field.
+
+    This behaves like a dictionary of the field's attributes, but stores
+    them in a sorted tuple of (attribute, value) pairs. Identical
+    signatures share the same tuple, and copies share it until one of them
+    is changed. This is much smaller than a dictionary per field, and
+    copying a signature doesn't copy its attributes.
+    """
+    __slots__ = ('_items',)
+
+    __hash__ = None
+
+    def __init__(self, data=()):
+        if hasattr(data, 'items'):
+            data = data.items()
+
+        self._items = _intern_field_items(list(data))
+
+    def __getitem__(self, key):
+        for name, value in self._items:
+            if name == key:
+                return value
+
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        items = [item for item in self._items if item[0] != key]
+        items.append((key, value))
+        self._items = _intern_field_items(items)
+
+    def __delitem__(self, key):
+        items = [item for item in self._items if item[0] != key]
 
-    rel = field_sig.pop('rel', None)
+        if len(items) == len(self._items):
+            raise KeyError(key)
 
-    if rel:
-        field_sig['related_model'] = '.'.join([rel.to._meta.app_label,
-                                               rel.to._meta.object_name])
+        self._items = _intern_field_items(items)
+
+    def __contains__(self, key):
+        for name, value in self._items:
+            if name == key:
+                return True
+
+        return False
+
+    has_key = __contains__
+
+    def __iter__(self):
+        for name, value in self._items:
+            yield name
+
+    def __len__(self):
+        return len(self._items)
+
+    def keys(self):
+        return [name for name, value in self._items]
+
+    def values(self):
+        return [value for name, value in self._items]
+
+    def items(self):
+        return list(self._items)
+
+    def iteritems(self):
+        return iter(self._items)
+
+    def get(self, key, default=None):
+        for name, value in self._items:
+            if name == key:
+                return value
+
+        return default
+
+    def copy(self):
+        field_sig = FieldSignature.__new__(FieldSignature)
+        field_sig._items = self._items
+
+        return field_sig
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        # The attribute values are never changed in place.
+        return self.copy()
+
+    def __reduce__(self):
+        return (FieldSignature, (dict(self._items),))
+
+    def __eq__(self, other):
+        if isinstance(other, FieldSignature):
+            return (self._items is other._items or
+                    self._items == other._items)
+
+        try:
+            return dict(self._items) == dict(other)
+        except (TypeError, ValueError):
+            return False
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '{%s}' % ', '.join(['%r: %r' % item for item in self._items])
+
+def create_field_sig(field):
+    items = [('field_type', field.__class__)]
+
+    for attrib, alias, default in _get_field_attribute_plan(field):
+        value = getattr(field, alias)
+
+        # only store non-default values
+        if default != value:
+            if attrib == 'rel':
+                items.append(('related_model',
+                              '.'.join([value.to._meta.app_label,
+                                        value.to._meta.object_name])))
+            else:
+                items.append((attrib, value))
+
+    # Fields of the same class list their attributes in the same order, so
+    # the unsorted attributes can be used to find the shared tuple without
+    # building its key.
+    key = tuple(items)
+
+    try:
+        shared_items = _created_field_sig_items[key]
+    except KeyError:
+        shared_items = _intern_field_items(items)
+
+        if len(_created_field_sig_items) >= FIELD_SIG_CACHE_SIZE:
+            _created_field_sig_items.clear()
+
+        _created_field_sig_items[key] = shared_items
+    except TypeError:
+        shared_items = _intern_field_items(items)
+
+    field_sig = FieldSignature.__new__(FieldSignature)
+    field_sig._items = shared_items
 
     return field_sig
 
@@ -87,6 +318,14 @@ def create_app_sig(app, database):
     Only those attributes that are interesting from a schema-evolution
     perspective are included.
     """
+    return run_operation('create_signature', {
+                             'app_label': app.__name__.split('.')[-2],
+                             'database': database,
+                         },
+                         _create_app_sig, app, database)
+
+
+def _create_app_sig(app, database):
     app_sig = SortedDict()
 
     for model in get_models(app):
@@ -108,3 +347,799 @@ def create_project_sig(database):
         proj_sig[app.__name__.split('.')[-2]] = create_app_sig(app, database)
 
     return proj_sig
+
+class LazyProjectSig(DictMixin):
+    """
+    A project signature that only builds each application's signature when
+    it's first accessed.
+
+    This behaves like the dictionary returned by create_project_sig(), so
+    it can be diffed, mutated and simulated. Operations that only touch a
+    few applications only pay for those applications.
+    """
+    def __init__(self, app_labels, load_app_sig, version=1):
+        self._app_labels = list(app_labels)
+        self._load_app_sig = load_app_sig
+        self._app_sigs = {
+            '__version__': version,
+        }
+
+    def __getitem__(self, app_label):
+        try:
+            return self._app_sigs[app_label]
+        except KeyError:
+            if app_label not in self._app_labels:
+                raise
+
+            app_sig = self._load_app_sig(app_label)
+            self._app_sigs[app_label] = app_sig
+
+            return app_sig
+
+    def __setitem__(self, app_label, app_sig):
+        if (app_label != '__version__' and
+            app_label not in self._app_labels):
+            self._app_labels.append(app_label)
+
+        self._app_sigs[app_label] = app_sig
+
+    def __delitem__(self, app_label):
+        if app_label not in self:
+            raise KeyError(app_label)
+
+        if app_label in self._app_labels:
+            self._app_labels.remove(app_label)
+
+        self._app_sigs.pop(app_label, None)
+
+    def __contains__(self, app_label):
+        return app_label == '__version__' or app_label in self._app_labels
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._app_labels) + 1
+
+    def keys(self):
+        return ['__version__'] + self._app_labels
+
+    def is_loaded(self, app_label):
+        "Return whether an application's signature has been built yet"
+        return app_label in self._app_sigs
+
+    def unload(self, app_label):
+        """
+        Forget an application's built signature, freeing its memory.
+
+        The signature is built again the next time it's accessed, so any
+        changes made to it are lost.
+        """
+        if app_label != '__version__' and app_label in self._app_labels:
+            self._app_sigs.pop(app_label, None)
+
+    def copy(self):
+        "Return a fully built dictionary copy of the signature"
+        return dict(self.iteritems())
+
+def create_lazy_project_sig(database):
+    """
+    Create a project signature that builds each application's signature
+    on first access.
+    """
+    apps = {}
+    app_labels = []
+
+    for app in get_apps():
+        app_label = app.__name__.split('.')[-2]
+        apps[app_label] = app
+        app_labels.append(app_label)
+
+    return LazyProjectSig(app_labels,
+                          lambda app_label: create_app_sig(apps[app_label],
+                                                           database))
+
+class _OverlayFieldSignature(FieldSignature):
+    """
+    A field signature looked up through a SignatureOverlay.
+
+    The overlay is told before the signature is changed, so that it can
+    keep the earlier attributes for any branches taken from it.
+    """
+    __slots__ = ('_overlay',)
+
+    def __setitem__(self, key, value):
+        self._overlay._prepare_write()
+        FieldSignature.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._overlay._prepare_write()
+        FieldSignature.__delitem__(self, key)
+
+class SignatureOverlay(DictMixin, object):
+    """
+    A copy-on-write view of a signature.
+
+    The overlay starts out identical to its base signature, and records
+    any changes made through it (for instance, by simulating mutations)
+    without touching the base. Creating an overlay doesn't copy anything.
+    Nested dictionaries (applications, models, fields) are wrapped in
+    overlays of their own when first looked up, and field signatures are
+    copied, which doesn't copy their attributes.
+
+    Branching an overlay doesn't copy anything either. The branch is an
+    overlay of the original's state at that point, which is kept frozen:
+    the original overlay (and each overlay nested in it) copies its own
+    entries the first time it's changed afterwards.
+
+    The base signature must not be changed while overlays of it are in use.
+    """
+    def __init__(self, base, clock=None):
+        self.base = base
+        self._values = {}
+        self._assigned = set()
+        self._deleted = set()
+        self._new_keys = []
+
+        # The clock is shared with the overlays nested in this one, and
+        # moves forward whenever one of them is branched. The state is
+        # frozen once the clock has moved past the time it was started.
+        if clock is None:
+            clock = [0]
+
+        self._clock = clock
+        self._time = clock[0]
+        self._frozen_states = []
+
+    def _own_field_sig(self, field_sig):
+        owned = _OverlayFieldSignature.__new__(_OverlayFieldSignature)
+        owned._items = field_sig._items
+        owned._overlay = self
+
+        return owned
+
+    def _prepare_write(self):
+        """
+        Keep the current state for any branches taken since it was started.
+
+        The entries are copied, along with the field signatures, which
+        could otherwise still be changed by the caller. Nested overlays
+        keep their own states.
+        """
+        if self._time == self._clock[0]:
+            return
+
+        values = {}
+
+        for key, value in self._values.iteritems():
+            if isinstance(value, FieldSignature):
+                value = value.copy()
+
+            values[key] = value
+
+        self._frozen_states.append((self._time, (values, self._assigned,
+                                                 self._deleted,
+                                                 self._new_keys)))
+        self._assigned = set(self._assigned)
+        self._deleted = set(self._deleted)
+        self._new_keys = list(self._new_keys)
+        self._time = self._clock[0]
+
+    def _get_state(self, time):
+        "Return the entries recorded by the overlay at the given time"
+        if self._time <= time:
+            return (self._values, self._assigned, self._deleted,
+                    self._new_keys)
+
+        result = None
+
+        for frozen_time, state in self._frozen_states:
+            if frozen_time <= time:
+                result = state
+            else:
+                break
+
+        return result
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            if key in self._deleted:
+                raise
+
+        base_value = self.base[key]
+
+        if isinstance(base_value, FieldSignature):
+            value = self._own_field_sig(base_value)
+        elif isinstance(base_value, (dict, DictMixin)):
+            value = SignatureOverlay(base_value, self._clock)
+        else:
+            return base_value
+
+        self._prepare_write()
+        self._values[key] = value
+
+        return value
+
+    def __setitem__(self, key, value):
+        self._prepare_write()
+
+        # Keep changes to the value inside this overlay, so that they're
+        # seen by branches only if made before branching.
+        if isinstance(value, FieldSignature):
+            if getattr(value, '_overlay', None) is not self:
+                value = self._own_field_sig(value)
+        elif (isinstance(value, (dict, DictMixin)) and
+              getattr(value, '_clock', None) is not self._clock):
+            value = SignatureOverlay(value, self._clock)
+
+        if key not in self and key not in self.base:
+            self._new_keys.append(key)
+
+        self._values[key] = value
+        self._assigned.add(key)
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+
+        self._prepare_write()
+        self._values.pop(key, None)
+        self._assigned.discard(key)
+
+        if key in self._new_keys:
+            self._new_keys.remove(key)
+        else:
+            self._deleted.add(key)
+
+    def __contains__(self, key):
+        return (key in self._values or
+                (key not in self._deleted and key in self.base))
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        keys = self.base.keys()
+
+        if self._deleted:
+            keys = [key for key in keys if key not in self._deleted]
+
+        return keys + self._new_keys
+
+    def get_changed_keys(self):
+        """
+        Return the keys whose values may differ from the base signature.
+
+        This only looks at the entries that have been looked up or changed
+        through the overlay.
+        """
+        changed = list(self._deleted)
+
+        for key, value in self._values.iteritems():
+            if key not in self.base:
+                changed.append(key)
+            elif key in self._assigned:
+                if value != self.base[key]:
+                    changed.append(key)
+            elif isinstance(value, SignatureOverlay):
+                if value.get_changed_keys():
+                    changed.append(key)
+            elif value != self.base[key]:
+                changed.append(key)
+
+        return changed
+
+    def branch(self):
+        """
+        Return a new overlay, starting out identical to this one.
+
+        Changes made to either overlay afterwards aren't seen by the other,
+        including changes made through entries looked up before branching.
+        Nothing is copied until one of the overlays is changed.
+        """
+        time = self._clock[0]
+        self._clock[0] += 1
+
+        return SignatureOverlay(_FrozenOverlay(self, time))
+
+    copy = branch
+    __copy__ = branch
+
+    def __deepcopy__(self, memo):
+        return self.branch()
+
+class _FrozenOverlay(DictMixin, object):
+    """
+    A read-only view of a SignatureOverlay as it was at a given time.
+
+    This is the base of the overlays returned by SignatureOverlay.branch().
+    """
+    def __init__(self, overlay, time):
+        self.overlay = overlay
+        self.time = time
+
+    def __getitem__(self, key):
+        values, assigned, deleted, new_keys = \
+            self.overlay._get_state(self.time)
+
+        try:
+            value = values[key]
+        except KeyError:
+            if key in deleted:
+                raise
+
+            return self.overlay.base[key]
+
+        if isinstance(value, SignatureOverlay):
+            value = _FrozenOverlay(value, self.time)
+
+        return value
+
+    def __contains__(self, key):
+        values, assigned, deleted, new_keys = \
+            self.overlay._get_state(self.time)
+
+        return (key in values or
+                (key not in deleted and key in self.overlay.base))
+
+    has_key = __contains__
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        values, assigned, deleted, new_keys = \
+            self.overlay._get_state(self.time)
+        keys = self.overlay.base.keys()
+
+        if deleted:
+            keys = [key for key in keys if key not in deleted]
+
+        return keys + new_keys
+
+# Prefixes identifying the format of a stored signature. Signatures without
+# a prefix were stored by older versions using pickle.
+JSON_SIGNATURE_PREFIX = 'json2:'
+COMPRESSED_JSON_SIGNATURE_PREFIX = 'json2z:'
+
+# The prefix for signatures stored as a manifest of the hashes of each
+# application's stored signature.
+MANIFEST_SIGNATURE_PREFIX = 'apps1:'
+
+class LazyFieldType(object):
+    """
+    A field type that's only imported when it's first used.
+
+    Loaded signatures refer to field types by their class path. Comparing
+    against another field type only compares the paths, so most signatures
+    can be loaded and diffed without importing any field classes.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.__name__ = path.split('.')[-1]
+        self._field_type = None
+
+    def resolve(self):
+        "Import and return the field class"
+        if self._field_type is None:
+            module_name, class_name = self.path.rsplit('.', 1)
+            module = __import__(module_name, {}, {}, [class_name])
+            self._field_type = getattr(module, class_name)
+
+        return self._field_type
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        return getattr(self.resolve(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, (type, LazyFieldType)):
+            return self.path == get_field_type_path(other)
+
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, (type, LazyFieldType)):
+            return self.path != get_field_type_path(other)
+
+        return NotImplemented
+
+    def __hash__(self):
+        # This must match the hash of the class itself.
+        return hash(self.resolve())
+
+    def __repr__(self):
+        return "<class '%s'>" % self.path
+
+_lazy_field_types = {}
+
+def get_lazy_field_type(path):
+    "Return the shared LazyFieldType for a class path"
+    try:
+        return _lazy_field_types[path]
+    except KeyError:
+        field_type = LazyFieldType(path)
+        _lazy_field_types[path] = field_type
+        return field_type
+
+def get_field_type_path(field_type):
+    "Return the full class path for a field type"
+    if isinstance(field_type, LazyFieldType):
+        return field_type.path
+
+    return '%s.%s' % (field_type.__module__, field_type.__name__)
+
+def _encode_signature_value(value):
+    """Encodes the values that JSON can't natively represent."""
+    if isinstance(value, (type, LazyFieldType)):
+        # Field types are stored as their full class path.
+        return get_field_type_path(value)
+    elif isinstance(value, FieldSignature):
+        return dict(value.iteritems())
+
+    return repr(value)
+
+class _SortedKeyDict(dict):
+    """
+    A dictionary that iterates over its keys in sorted order.
+
+    JSON encoders write these out in sorted order without needing
+    sort_keys, which would disable the C speedups in the json module.
+    """
+    def __init__(self, data):
+        dict.__init__(self, data)
+        self._keys = data.keys()
+        self._keys.sort()
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def keys(self):
+        return list(self._keys)
+
+    def items(self):
+        return [(key, self[key]) for key in self._keys]
+
+    def iteritems(self):
+        for key in self._keys:
+            yield key, self[key]
+
+def _encode_field_sig(field_sig, field_table, field_indexes):
+    """
+    Returns the index of a field signature in a table of distinct field
+    signatures, adding it to the table if it's new.
+
+    Each entry in the table is a list of the field type's class path,
+    followed by the name and value of each other attribute, in sorted
+    order.
+    """
+    if isinstance(field_sig, FieldSignature):
+        # Identical signatures usually share their attribute tuple.
+        items = field_sig._items
+
+        try:
+            return field_indexes[id(items)]
+        except KeyError:
+            pass
+    else:
+        items = field_sig.items()
+        items.sort()
+
+    entry = []
+    field_type = None
+
+    for name, value in items:
+        if name == 'field_type':
+            field_type = get_field_type_path(value)
+        else:
+            entry.append(name)
+            entry.append(value)
+
+    entry.insert(0, field_type)
+
+    try:
+        key = tuple(entry)
+        index = field_indexes[key]
+    except TypeError:
+        key = repr(entry)
+        index = field_indexes.get(key)
+    except KeyError:
+        index = None
+
+    if index is None:
+        index = len(field_table)
+        field_table.append(entry)
+        field_indexes[key] = index
+
+    if isinstance(field_sig, FieldSignature):
+        field_indexes[id(items)] = index
+
+    return index
+
+def _encode_app_sig(app_sig, field_table, field_indexes):
+    """
+    Prepares an application signature for canonical JSON encoding.
+
+    Each model is stored as a list of its name, its meta attributes and a
+    flat list of its field names, each followed by the index of the
+    field's signature in the shared table of field signatures. Models and
+    fields are sorted by name.
+    """
+    app_data = []
+    model_names = app_sig.keys()
+    model_names.sort()
+
+    for model_name in model_names:
+        model_sig = app_sig[model_name]
+        fields = model_sig['fields']
+        field_names = fields.keys()
+        field_names.sort()
+        fields_data = []
+
+        for field_name in field_names:
+            fields_data.append(field_name)
+            fields_data.append(_encode_field_sig(fields[field_name],
+                                                 field_table, field_indexes))
+
+        app_data.append([model_name, _SortedKeyDict(model_sig['meta']),
+                         fields_data])
+
+    return app_data
+
+def _encode_project_sig(proj_sig):
+    """
+    Prepares a project signature for canonical JSON encoding.
+
+    The result is a list of the project signature's version, the table of
+    distinct field signatures, and a list of application labels, each
+    followed by its encoded application signature.
+    """
+    field_table = []
+    field_indexes = {}
+    apps_data = []
+    app_labels = [
+        app_label
+        for app_label in proj_sig.keys()
+        if app_label != '__version__'
+    ]
+    app_labels.sort()
+
+    for app_label in app_labels:
+        apps_data.append(app_label)
+        apps_data.append(_encode_app_sig(proj_sig[app_label], field_table,
+                                         field_indexes))
+
+    return [proj_sig.get('__version__', 1), field_table, apps_data]
+
+def _make_str_decoder():
+    """
+    Returns a function converting ASCII strings decoded from JSON back into
+    byte strings, as found in signatures created from models.
+
+    JSON strings are always decoded as unicode. The same names appear
+    throughout a signature, so each one is only converted once.
+    """
+    strings = {}
+
+    def decode_str(value):
+        if value.__class__ is not unicode:
+            return value
+
+        try:
+            return strings[value]
+        except KeyError:
+            try:
+                result = value.encode('ascii')
+            except UnicodeEncodeError:
+                result = value
+
+            strings[value] = result
+            return result
+
+    return decode_str
+
+def _decode_meta(meta_data, decode_str):
+    "Rebuilds a model's meta attributes from their decoded JSON"
+    meta = {}
+
+    for key, value in meta_data.iteritems():
+        if key == 'unique_together':
+            value = tuple([
+                tuple([decode_str(field_name)
+                       for field_name in field_names])
+                for field_names in value
+            ])
+        else:
+            value = decode_str(value)
+
+        meta[decode_str(key)] = value
+
+    return meta
+
+def _decode_field_table(field_table, decode_str):
+    """
+    Rebuilds the attribute tuples for a table of field signatures encoded
+    by _encode_field_sig().
+    """
+    items_table = []
+
+    for entry in field_table:
+        items = [('field_type', get_lazy_field_type(decode_str(entry[0])))]
+
+        for i in range(1, len(entry), 2):
+            items.append((decode_str(entry[i]), decode_str(entry[i + 1])))
+
+        items_table.append(_intern_field_items(items))
+
+    return items_table
+
+def _decode_app_sig(app_data, items_table, decode_str):
+    "Rebuilds an application signature encoded by _encode_app_sig()"
+    app_sig = SortedDict()
+
+    for model_name, meta_data, fields_data in app_data:
+        fields = {}
+
+        for i in range(0, len(fields_data), 2):
+            field_sig = FieldSignature.__new__(FieldSignature)
+            field_sig._items = items_table[fields_data[i + 1]]
+            fields[decode_str(fields_data[i])] = field_sig
+
+        app_sig[decode_str(model_name)] = {
+            'meta': _decode_meta(meta_data, decode_str),
+            'fields': fields,
+        }
+
+    return app_sig
+
+def _decode_project_sig(data):
+    "Rebuilds a project signature encoded by _encode_project_sig()"
+    decode_str = _make_str_decoder()
+    version, field_table, apps_data = data
+    items_table = _decode_field_table(field_table, decode_str)
+    proj_sig = {
+        '__version__': version,
+    }
+
+    for i in range(0, len(apps_data), 2):
+        proj_sig[decode_str(apps_data[i])] = \
+            _decode_app_sig(apps_data[i + 1], items_table, decode_str)
+
+    return proj_sig
+
+def _dump_json(data):
+    "Encodes data as compact JSON"
+    return simplejson.dumps(data, separators=(',', ':'))
+
+def _prefix_json(data, compress):
+    "Prefixes JSON data with its format, compressing it if requested"
+    if compress is None:
+        compress = getattr(settings, 'DJANGO_EVOLUTION_COMPRESS_SIGNATURES',
+                           True)
+
+    if compress:
+        return COMPRESSED_JSON_SIGNATURE_PREFIX + \
+               base64.b64encode(zlib.compress(data))
+
+    return JSON_SIGNATURE_PREFIX + data
+
+def _load_json(data):
+    """
+    Decodes data stored by _prefix_json(), or returns None if the data
+    isn't in the JSON format.
+    """
+    if data.startswith(JSON_SIGNATURE_PREFIX):
+        data = data[len(JSON_SIGNATURE_PREFIX):]
+    elif data.startswith(COMPRESSED_JSON_SIGNATURE_PREFIX):
+        data = zlib.decompress(base64.b64decode(
+            str(data[len(COMPRESSED_JSON_SIGNATURE_PREFIX):])))
+    else:
+        return None
+
+    return simplejson.loads(data)
+
+def serialize_signature(proj_sig, compress=None):
+    """
+    Serialize a project signature for storage.
+
+    Signatures are stored as canonical JSON lists, with field types stored
+    as their class paths. Each distinct field signature is only stored
+    once. If compress is True, the JSON is compressed and base64-encoded.
+    By default, this is controlled by the
+    DJANGO_EVOLUTION_COMPRESS_SIGNATURES setting.
+    """
+    return _prefix_json(_dump_json(_encode_project_sig(proj_sig)), compress)
+
+def deserialize_signature(data):
+    """
+    Load a project signature stored by serialize_signature().
+
+    Signatures pickled by older versions of Django Evolution are loaded as
+    well. Field types in JSON signatures aren't imported until needed.
+    """
+    decoded = _load_json(data)
+
+    if decoded is None:
+        return pickle.loads(str(data))
+
+    return _decode_project_sig(decoded)
+
+def serialize_app_signature(app_sig, compress=None):
+    """
+    Serialize an application signature for storage.
+
+    Returns a tuple of the signature's hash and the serialized data. The
+    hash only depends on the contents of the signature, so it can be used
+    to store each distinct signature once.
+    """
+    field_table = []
+    app_data = _encode_app_sig(app_sig, field_table, {})
+    data = _dump_json([field_table, app_data])
+
+    return sha_constructor(data).hexdigest(), _prefix_json(data, compress)
+
+def deserialize_app_signature(data):
+    "Load an application signature stored by serialize_app_signature()"
+    decode_str = _make_str_decoder()
+    field_table, app_data = _load_json(data)
+
+    return _decode_app_sig(app_data,
+                           _decode_field_table(field_table, decode_str),
+                           decode_str)
+
+def serialize_manifest(manifest):
+    """
+    Serialize a manifest mapping application labels to the hashes of their
+    stored signatures.
+    """
+    return MANIFEST_SIGNATURE_PREFIX + _dump_json(_SortedKeyDict(manifest))
+
+def deserialize_manifest(data):
+    """
+    Load a manifest stored by serialize_manifest(). Returns None if the
+    data is a complete project signature instead.
+    """
+    if not data.startswith(MANIFEST_SIGNATURE_PREFIX):
+        return None
+
+    decode_str = _make_str_decoder()
+    manifest = {}
+
+    for key, value in simplejson.loads(
+        data[len(MANIFEST_SIGNATURE_PREFIX):]).iteritems():
+        manifest[decode_str(key)] = decode_str(value)
+
+    return manifest
+
+def create_signature_hash(proj_sig):
+    """
+    Create a canonical hash of a project signature.
+
+    Two signatures containing the same information produce the same hash,
+    regardless of dictionary ordering or the container types used.
+    """
+    if isinstance(proj_sig, LazyProjectSig):
+        proj_sig = proj_sig.copy()
+
+    data = simplejson.dumps(proj_sig, sort_keys=True, separators=(',', ':'),
+                            default=_encode_signature_value)
+
+    return sha_constructor(data).hexdigest()
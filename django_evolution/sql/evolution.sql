@@ -0,0 +1,4 @@
+-- Index used to look up the applied evolutions for an application.
+-- Existing databases receive this through the
+-- evolution_app_label_label_index evolution.
+CREATE INDEX django_evolution_app_label_label ON django_evolution (app_label, label);
@@ -0,0 +1,246 @@
+"""
+Squashes a sequence of evolutions into one equivalent evolution.
+
+The mutations are replayed through their simulate() methods against a
+signature that knows nothing about the models beforehand. Models and fields
+that the mutations refer to are created on first use and tracked, so that
+once the replay is done, the net change to each of them can be written out
+as a short list of mutations.
+"""
+from django_evolution import CannotSimulate, EvolutionException, \
+                             SimulationFailure
+from django_evolution.mutations import AddField, ChangeField, DeleteField, \
+                                       DeleteModel, RenameField
+
+
+# The signature of a field that existed before the squashed evolutions.
+# Nothing is known about it beyond its name.
+UNKNOWN_FIELD_SIG = {
+    'field_type': None,
+}
+
+
+class _ExistingFieldSig(dict):
+    "The signature of a field that existed before the squashed evolutions"
+    def __init__(self, field_name):
+        dict.__init__(self, UNKNOWN_FIELD_SIG)
+        self.field_name = field_name
+
+
+class _ExistingFieldDict(dict):
+    """
+    The fields of a model that existed before the squashed evolutions.
+
+    Fields are created when first looked up by name, and every field created
+    is remembered, so that deleted fields can be found after the replay.
+    """
+    def __init__(self):
+        dict.__init__(self)
+        self.existing_fields = []
+        self._seen = set()
+
+    def __getitem__(self, field_name):
+        if not dict.__contains__(self, field_name):
+            if field_name in self._seen:
+                # The field was deleted or renamed, and can't come back.
+                raise KeyError(field_name)
+
+            field_sig = _ExistingFieldSig(field_name)
+            self.existing_fields.append(field_sig)
+            self._seen.add(field_name)
+            dict.__setitem__(self, field_name, field_sig)
+
+        return dict.__getitem__(self, field_name)
+
+    def __setitem__(self, field_name, field_sig):
+        # A field added under a new name can't have existed beforehand.
+        self._seen.add(field_name)
+        dict.__setitem__(self, field_name, field_sig)
+
+    def pop(self, field_name, *args):
+        if not args:
+            self[field_name]
+
+        return dict.pop(self, field_name, *args)
+
+
+class _ExistingModelDict(dict):
+    "The models of the application, created when first looked up by name"
+    def __getitem__(self, model_name):
+        if not dict.__contains__(self, model_name):
+            dict.__setitem__(self, model_name, {
+                'meta': {
+                    'unique_together': (),
+                },
+                'fields': _ExistingFieldDict(),
+            })
+
+        return dict.__getitem__(self, model_name)
+
+    def __delitem__(self, model_name):
+        self[model_name]
+        dict.__delitem__(self, model_name)
+
+
+class _Replay(object):
+    "The state of the models after replaying a list of mutations"
+    def __init__(self, app_label, mutations):
+        self.app_label = app_label
+        self.app_sig = _ExistingModelDict()
+        self.model_names = []
+        self.deleted_models = []
+        self.initials = {}
+        self.renames = {}
+
+        proj_sig = {
+            '__version__': 1,
+            app_label: self.app_sig,
+        }
+
+        for i, mutation in enumerate(mutations):
+            if not isinstance(mutation, (AddField, ChangeField, DeleteField,
+                                         DeleteModel, RenameField)):
+                raise EvolutionException(
+                    'Evolutions containing %s mutations cannot be squashed.'
+                    % mutation.__class__.__name__)
+
+            model_name = mutation.model_name
+
+            if model_name not in self.model_names:
+                self.model_names.append(model_name)
+
+            if model_name in self.deleted_models:
+                raise EvolutionException(
+                    "Model '%s.%s' is used after it was deleted."
+                    % (app_label, model_name))
+
+            try:
+                mutation.simulate(app_label, proj_sig)
+            except (CannotSimulate, SimulationFailure, KeyError), e:
+                raise EvolutionException(
+                    'Unable to replay %s while squashing: %s'
+                    % (mutation, e))
+
+            if isinstance(mutation, DeleteModel):
+                self.deleted_models.append(model_name)
+                continue
+
+            fields = self.app_sig[model_name]['fields']
+
+            if isinstance(mutation, (AddField, ChangeField)):
+                field_sig = fields[mutation.field_name]
+
+                if (isinstance(mutation, AddField) or
+                    mutation.initial is not None):
+                    self.initials[id(field_sig)] = (field_sig,
+                                                    mutation.initial)
+            elif isinstance(mutation, RenameField):
+                field_sig = fields[mutation.new_field_name]
+                self.renames[id(field_sig)] = i
+
+                if (field_sig['field_type'] is None and
+                    mutation.db_table):
+                    # The field's type isn't known, so it may be a
+                    # ManyToManyField, whose table is being renamed.
+                    field_sig['db_table'] = mutation.db_table
+
+    def get_model_fields(self, model_name):
+        """
+        Return the final state of a model's fields, as (name, sig) pairs.
+
+        Fields that existed beforehand and were never changed are left out.
+        """
+        if (model_name in self.deleted_models or
+            not dict.__contains__(self.app_sig, model_name)):
+            return []
+
+        fields = []
+
+        for field_name, field_sig in \
+            self.app_sig[model_name]['fields'].items():
+            if (not isinstance(field_sig, _ExistingFieldSig) or
+                field_sig.field_name != field_name or
+                field_sig != UNKNOWN_FIELD_SIG):
+                fields.append((field_name, dict(field_sig)))
+
+        fields.sort()
+
+        return fields
+
+    def get_initial(self, field_sig):
+        "Return the latest initial value given for a field"
+        return self.initials.get(id(field_sig), (None, None))[1]
+
+
+def squash_mutations(app_label, mutations):
+    """
+    Return a list of mutations equivalent to the given list.
+
+    Only AddField, ChangeField, DeleteField, DeleteModel and RenameField
+    mutations can be squashed. An EvolutionException is raised if the
+    mutations can't be replayed, or if no equivalent list can be found.
+    """
+    replay = _Replay(app_label, mutations)
+    squashed = []
+
+    for model_name in replay.model_names:
+        if model_name in replay.deleted_models:
+            squashed.append(DeleteModel(model_name))
+            continue
+
+        fields = replay.app_sig[model_name]['fields']
+        current_fields = dict([
+            (id(field_sig), field_name)
+            for field_name, field_sig in fields.items()
+        ])
+        deletes = []
+        renames = []
+        changes = []
+        adds = []
+
+        for field_sig in fields.existing_fields:
+            if id(field_sig) not in current_fields:
+                deletes.append(DeleteField(model_name, field_sig.field_name))
+                continue
+
+            field_name = current_fields[id(field_sig)]
+            field_attrs = dict(field_sig)
+            del field_attrs['field_type']
+
+            if field_name != field_sig.field_name:
+                renames.append((replay.renames[id(field_sig)],
+                                RenameField(model_name, field_sig.field_name,
+                                            field_name,
+                                            field_attrs.pop('db_column', None),
+                                            field_attrs.pop('db_table', None))))
+
+            if field_attrs:
+                changes.append(ChangeField(model_name, field_name,
+                                           replay.get_initial(field_sig),
+                                           **field_attrs))
+
+        for field_name, field_sig in fields.items():
+            if not isinstance(field_sig, _ExistingFieldSig):
+                field_attrs = dict(field_sig)
+                field_type = field_attrs.pop('field_type')
+                adds.append(AddField(model_name, field_name, field_type,
+                                     replay.get_initial(field_sig),
+                                     **field_attrs))
+
+        renames.sort()
+        squashed.extend(deletes)
+        squashed.extend([rename for i, rename in renames])
+        squashed.extend(changes)
+        squashed.extend(adds)
+
+    # Make sure the squashed mutations have the same effect as the originals.
+    squashed_replay = _Replay(app_label, squashed)
+
+    for model_name in replay.model_names:
+        if (replay.get_model_fields(model_name) !=
+            squashed_replay.get_model_fields(model_name)):
+            raise EvolutionException(
+                "The changes to '%s.%s' cannot be squashed automatically."
+                % (app_label, model_name))
+
+    return squashed
@@ -9,6 +9,14 @@ from sql_mutation import tests as sql_mutation_tests
 from ordering import tests as ordering_tests
 from generics import tests as generics_tests
 from inheritance import tests as inheritance_tests
+from compact_history import tests as compact_history_tests
+from introspection import tests as introspection_tests
+from write_hints import tests as write_hints_tests
+from squash import tests as squash_tests
+from signals import tests as signals_tests
+from data_mutation import tests as data_mutation_tests
+from django.conf import settings
+
 from django_evolution import is_multi_db
 # Define doctests
 __test__ = {
@@ -22,9 +30,24 @@ __test__ = {
     'sql_mutation': sql_mutation_tests,
     'ordering': ordering_tests,
     'generics': generics_tests,
-    'inheritance': inheritance_tests
+    'inheritance': inheritance_tests,
+    'compact_history': compact_history_tests,
+    'introspection': introspection_tests,
+    'write_hints': write_hints_tests,
+    'squash': squash_tests,
+    'signals': signals_tests,
+    'data_mutation': data_mutation_tests,
 }
 
 if is_multi_db():
     from multi_db import tests as multi_db_tests
     __test__['multi_db'] = multi_db_tests
+
+if is_multi_db():
+    engine = settings.DATABASES['default']['ENGINE'].split('.')[-1]
+else:
+    engine = settings.DATABASE_ENGINE
+
+if engine == 'mysql':
+    from shadow_table import tests as shadow_table_tests
+    __test__['shadow_table'] = shadow_table_tests
@@ -470,6 +470,31 @@ True
 >>> execute_test_sql(start, end, test_sql) #AddForeignKeyModel
 %(AddForeignKeyModel)s
 
+# Non-null Foreign Key field with an initial value.
+>>> class AddForeignKeyWithInitialModel(models.Model):
+...     char_field = models.CharField(max_length=20)
+...     int_field = models.IntegerField()
+...     added_field = models.ForeignKey(AddAnchor1)
+
+>>> end = register_models(('TestModel',AddForeignKeyWithInitialModel), *anchors)
+>>> end_sig = test_proj_sig(('TestModel',AddForeignKeyWithInitialModel), *anchors)
+>>> d = Diff(start_sig, end_sig)
+>>> print [str(e) for e in d.evolution()['tests']]
+["AddField('TestModel', 'added_field', models.ForeignKey, initial=<<USER VALUE REQUIRED>>, related_model='tests.AddAnchor1')"]
+
+>>> evolution = [AddField('TestModel', 'added_field', models.ForeignKey, initial=1, related_model='tests.AddAnchor1')]
+>>> test_sig = copy.deepcopy(start_sig)
+>>> test_sql = []
+>>> for mutation in evolution:
+...     test_sql.extend(mutation.mutate('tests', test_sig))
+...     mutation.simulate('tests', test_sig)
+
+>>> Diff(test_sig, end_sig).is_empty()
+True
+
+>>> execute_test_sql(start, end, test_sql) #AddForeignKeyWithInitialModel
+%(AddForeignKeyWithInitialModel)s
+
 # M2M field between models with default table names.
 >>> class AddM2MDatabaseTableModel(models.Model):
 ...     char_field = models.CharField(max_length=20)
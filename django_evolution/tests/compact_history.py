@@ -0,0 +1,41 @@
+tests = r"""
+>>> from datetime import datetime
+
+>>> from django.core.management import call_command
+
+>>> from django_evolution import EvolutionException
+>>> from django_evolution.models import Version
+
+# Store a few old versions behind the baseline version.
+>>> old_versions = []
+>>> for day in range(1, 4):
+...     version = Version(signature='old signature %s' % day,
+...                       when=datetime(2010, 1, day))
+...     version.save()
+...     old_versions.append(version)
+
+>>> call_command('compact_evolution_history', keep=2, interactive=False,
+...              verbosity=0)
+
+# Only the most recent versions keep their signatures.
+>>> [Version.objects.get(pk=version.pk).is_stub()
+...  for version in old_versions]
+[True, True, False]
+>>> Version.objects.latest('when').is_stub()
+False
+
+# Stubs no longer have a signature to load.
+>>> try:
+...     Version.objects.get(pk=old_versions[0].pk).get_signature()
+... except EvolutionException, e:
+...     print e
+The signature for the version stored on 2010-01-01 00:00:00 has been removed by compact_evolution_history.
+
+# Compacting again has nothing left to do.
+>>> call_command('compact_evolution_history', keep=2, interactive=False)
+There are no versions to compact.
+
+# Clean up after the test.
+>>> Version.objects.filter(pk__in=[version.pk
+...                                for version in old_versions]).delete()
+"""
@@ -0,0 +1,149 @@
+tests = r"""
+>>> from django.core.management.color import no_style
+>>> from django.db import connection, models
+
+>>> from django_evolution.diff import Diff
+>>> from django_evolution.models import DataMutationCheckpoint
+>>> from django_evolution.mutations import AddField, DataMutation
+>>> from django_evolution.signature import SignatureOverlay
+>>> from django_evolution.tests.utils import test_proj_sig, execute_transaction, register_models, deregister_models, set_app_test_models, sql_create, sql_delete
+>>> from django_evolution.tests import models as evo_test
+
+>>> class DataBaseModel(models.Model):
+...     name = models.CharField(max_length=20)
+
+>>> class DataModel(models.Model):
+...     name = models.CharField(max_length=20)
+...     length = models.IntegerField(null=True)
+
+>>> start = register_models(('TestModel', DataBaseModel))
+>>> start_sig = test_proj_sig(('TestModel', DataBaseModel))
+>>> end = register_models(('TestModel', DataModel))
+>>> end_sig = test_proj_sig(('TestModel', DataModel))
+
+# Data mutations don't change the signature, so they simulate cleanly
+>>> sequence = [
+...     AddField('TestModel', 'length', models.IntegerField, null=True),
+... ]
+>>> def set_length(row):
+...     row.length = len(row.name)
+...     row.save()
+>>> sequence.append(DataMutation('set-length', 'TestModel', set_length,
+...                              chunk_size=3))
+>>> test_sig = SignatureOverlay(start_sig)
+>>> for mutation in sequence:
+...     mutation.simulate('tests', test_sig)
+>>> Diff(test_sig, end_sig).is_empty()
+True
+>>> print sequence[1]
+DataMutation('set-length', 'TestModel')
+
+# The data is updated when the evolution's SQL is executed
+>>> test_sql = []
+>>> for mutation in sequence:
+...     test_sql.extend(mutation.mutate('tests', start_sig, 'default'))
+>>> print unicode(test_sql[-1])
+-- Run data mutation set-length on tests.TestModel in chunks of 3 rows
+
+>>> set_app_test_models(start, app_label='tests')
+>>> execute_transaction(sql_create(evo_test, no_style(), 'default'))
+>>> for i in range(7):
+...     row = DataBaseModel.objects.create(name='x' * i)
+>>> set_app_test_models(end, app_label='tests')
+
+# Rows are processed a chunk at a time, and progress is checkpointed
+>>> processed = []
+>>> def fail_on_sixth(row):
+...     processed.append(row.pk)
+...     if len(processed) == 6:
+...         raise ValueError('Interrupted')
+...     set_length(row)
+>>> sequence[1].func = fail_on_sixth
+>>> execute_transaction(test_sql)
+Traceback (most recent call last):
+...
+ValueError: Interrupted
+>>> [row.length for row in DataModel.objects.order_by('pk')]
+[0, 1, 2, None, None, None, None]
+>>> checkpoint = DataMutationCheckpoint.objects.get(tag='set-length')
+>>> checkpoint.last_pk == unicode(DataModel.objects.order_by('pk')[2].pk), checkpoint.completed
+(True, False)
+
+# Running it again resumes after the last committed chunk
+>>> processed = []
+>>> sequence[1].func = set_length
+>>> execute_transaction(test_sql[-1:])
+>>> [row.length for row in DataModel.objects.order_by('pk')]
+[0, 1, 2, 3, 4, 5, 6]
+>>> DataMutationCheckpoint.objects.get(tag='set-length').completed
+True
+
+# Completed mutations aren't run again
+>>> num_rows = DataModel.objects.update(length=None)
+>>> execute_transaction(test_sql[-1:])
+>>> DataModel.objects.filter(length__isnull=False).count()
+0
+
+# Data mutations are commit boundaries. The statements before them are
+# committed first, and the progress is reported at each commit, so that an
+# evolution can resume after the statements that were committed.
+>>> from django_evolution.models import EvolutionProgress
+>>> from django_evolution.utils import execute_sql
+>>> DataMutationCheckpoint.objects.all().delete()
+>>> commits = []
+>>> execute_sql(connection.cursor(), test_sql, start=len(test_sql) - 1,
+...             on_commit=commits.append)
+>>> commits == [len(test_sql) - 1, len(test_sql)]
+True
+>>> DataModel.objects.filter(length__isnull=True).count()
+0
+
+>>> progress = EvolutionProgress.objects.get_progress('abc123', 'default')
+>>> progress.completed_steps
+0
+>>> progress.update(2)
+>>> EvolutionProgress.objects.get_progress('abc123', 'default').completed_steps
+2
+
+# The progress is deleted once the evolution is recorded
+>>> progress.finish()
+>>> EvolutionProgress.objects.count()
+0
+
+# A throttle is consulted between chunks, once each chunk is committed
+>>> from django_evolution.throttle import FileBackPressure, QueryBackPressure, Throttle
+>>> pressure = [2, 0, 1, 0]
+>>> def back_pressure(database):
+...     return pressure.pop(0)
+>>> sleeps = []
+>>> throttle = Throttle(back_pressure, sleep=sleeps.append)
+>>> DataMutationCheckpoint.objects.all().delete()
+>>> test_sql[-1](connection.cursor(), throttle)
+>>> sleeps, throttle.num_pauses, pressure
+([2, 1], 2, [])
+
+# Back-pressure can be read from a file
+>>> import os
+>>> import tempfile
+>>> fd, pause_file = tempfile.mkstemp()
+>>> os.write(fd, '0.5')
+3
+>>> os.close(fd)
+>>> file_pressure = FileBackPressure(pause_file)
+>>> file_pressure('default')
+0.5
+>>> os.unlink(pause_file)
+>>> file_pressure('default')
+0
+
+# Or from a probe query
+>>> QueryBackPressure('SELECT COUNT(*) FROM tests_testmodel', 5)('default')
+5
+>>> QueryBackPressure('SELECT COUNT(*) FROM tests_testmodel', 7)('default')
+0
+
+# Clean up after the test
+>>> DataMutationCheckpoint.objects.all().delete()
+>>> execute_transaction(sql_delete(evo_test, no_style(), 'default'))
+>>> deregister_models()
+"""
@@ -77,6 +77,12 @@ add_field = {
             'CREATE INDEX `%s` ON `tests_testmodel` (`added_field_id`);'
             % generate_index_name('tests_testmodel', 'added_field_id')
         ]),
+    'AddForeignKeyWithInitialModel':
+        '\n'.join([
+            'ALTER TABLE `tests_testmodel` ADD COLUMN `added_field_id` integer NOT NULL REFERENCES `tests_addanchor1` (`id`) ;',
+            'CREATE INDEX `%s` ON `tests_testmodel` (`added_field_id`);'
+            % generate_index_name('tests_testmodel', 'added_field_id')
+        ]),
     'AddManyToManyDatabaseTableModel':
         '\n'.join([
             'CREATE TABLE `tests_testmodel_added_field` (',
@@ -147,13 +153,12 @@ change_field = {
     "NoOpChangeModel": '',
     'IncreasingMaxLengthChangeModel':
             '\n'.join([
-                'UPDATE `tests_testmodel` SET `char_field`=LEFT(`char_field`,45);',
-                'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(45);',
+                'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(45) NOT NULL;',
             ]),
     'DecreasingMaxLengthChangeModel':
             '\n'.join([
-                'UPDATE `tests_testmodel` SET `char_field`=LEFT(`char_field`,1);',
-                'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(1);',
+                'UPDATE `tests_testmodel` SET `char_field`=LEFT(`char_field`,1) WHERE CHAR_LENGTH(`char_field`) > 1;',
+                'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(1) NOT NULL;',
             ]),
     "DBColumnChangeModel": 'ALTER TABLE `tests_testmodel` CHANGE COLUMN `custom_db_column` `customised_db_column` integer NOT NULL;',
     "M2MDBTableChangeModel": 'RENAME TABLE `change_field_non-default_m2m_table` TO `custom_m2m_db_table_name`;',
@@ -167,21 +172,18 @@ change_field = {
         '\n'.join([
             'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field2` varchar(30) DEFAULT NULL;',
             'ALTER TABLE `tests_testmodel` CHANGE COLUMN `custom_db_column` `custom_db_column2` integer NOT NULL;',
-            'UPDATE `tests_testmodel` SET `char_field`=LEFT(`char_field`,35);',
-            'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(35);',
+            'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(35) NOT NULL;',
         ]),
     "MultiAttrSingleFieldChangeModel":
         '\n'.join([
-            'UPDATE `tests_testmodel` SET `char_field2`=LEFT(`char_field2`,35);',
-            'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field2` varchar(35);',
+            'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field2` varchar(35) NOT NULL;',
             'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field2` varchar(35) DEFAULT NULL;',
         ]),
     "RedundantAttrsChangeModel":
         '\n'.join([
             'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field2` varchar(30) DEFAULT NULL;',
             'ALTER TABLE `tests_testmodel` CHANGE COLUMN `custom_db_column` `custom_db_column3` integer NOT NULL;',
-            'UPDATE `tests_testmodel` SET `char_field`=LEFT(`char_field`,35);',
-            'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(35);',
+            'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(35) NOT NULL;',
         ]),
 }
 
@@ -189,28 +191,16 @@ delete_model = {
     'BasicModel':
         'DROP TABLE `tests_basicmodel`;',
     'BasicWithM2MModel':
-        '\n'.join([
-            'DROP TABLE `tests_basicwithm2mmodel_m2m`;',
-            'DROP TABLE `tests_basicwithm2mmodel`;'
-        ]),
+        'DROP TABLE `tests_basicwithm2mmodel_m2m`, `tests_basicwithm2mmodel`;',
     'CustomTableModel':
         'DROP TABLE `custom_table_name`;',
     'CustomTableWithM2MModel':
-        '\n'.join([
-            'DROP TABLE `another_custom_table_name_m2m`;',
-            'DROP TABLE `another_custom_table_name`;'
-        ]),
+        'DROP TABLE `another_custom_table_name_m2m`, `another_custom_table_name`;',
 }
 
 delete_application = {
     'DeleteApplication':
-        '\n'.join([
-            'DROP TABLE `tests_appdeleteanchor1`;',
-            'DROP TABLE `app_delete_custom_add_anchor_table`;',
-            'DROP TABLE `tests_testmodel_anchor_m2m`;',
-            'DROP TABLE `tests_testmodel`;',
-            'DROP TABLE `app_delete_custom_table_name`;',
-        ]),
+        'DROP TABLE `tests_testmodel_anchor_m2m`, `app_delete_custom_add_anchor_table`, `tests_testmodel`, `tests_appdeleteanchor1`, `app_delete_custom_table_name`;',
 }
 
 rename_field = {
@@ -271,3 +261,11 @@ inheritance = {
     'DeleteFromChildModel':
         'ALTER TABLE `tests_childmodel` DROP COLUMN `int_field` CASCADE;',
 }
+
+shadow_table = {
+    "ShadowTableChangeModel":
+        '\n'.join([
+            '-- Copied through a shadow table if the change would block writes',
+            'ALTER TABLE `tests_testmodel` MODIFY COLUMN `char_field` varchar(45) NOT NULL;',
+        ]),
+}
@@ -1,21 +1,55 @@
+from django.db import connection
 from django.db.models.options import Options
 
 autocreate_through_tables = hasattr(Options({}), 'auto_created')
 
+try:
+    postgres_version = connection.ops.postgres_version[:2]
+except AttributeError:
+    # The tests aren't running against PostgreSQL, so this isn't used.
+    postgres_version = None
+
+
+def set_not_null_sql(table_name, column):
+    """Returns the SQL expected for making a column NOT NULL.
+
+    On PostgreSQL 12 and higher, the column is checked by a separately
+    validated check constraint first.
+    """
+    if postgres_version >= (12, 0):
+        constraint_name = '%s_%s_notnull' % (table_name, column)
+
+        return [
+            'ALTER TABLE "%s" DROP CONSTRAINT IF EXISTS %s;'
+            % (table_name, constraint_name),
+            'ALTER TABLE "%s" ADD CONSTRAINT %s CHECK ("%s" IS NOT NULL) NOT VALID;'
+            % (table_name, constraint_name, column),
+            '-- Commit the changes made so far',
+            'ALTER TABLE "%s" VALIDATE CONSTRAINT %s;'
+            % (table_name, constraint_name),
+            'ALTER TABLE "%s" ALTER COLUMN "%s" SET NOT NULL;'
+            % (table_name, column),
+            'ALTER TABLE "%s" DROP CONSTRAINT %s;'
+            % (table_name, constraint_name),
+        ]
+    else:
+        return [
+            'ALTER TABLE "%s" ALTER COLUMN "%s" SET NOT NULL;'
+            % (table_name, column),
+        ]
+
 
 add_field = {
     'AddNonNullNonCallableColumnModel':
         '\n'.join([
             'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field" integer ;',
             'UPDATE "tests_testmodel" SET "added_field" = 1 WHERE "added_field" IS NULL;',
-            'ALTER TABLE "tests_testmodel" ALTER COLUMN "added_field" SET NOT NULL;',
-        ]),
+        ] + set_not_null_sql('tests_testmodel', 'added_field')),
     'AddNonNullCallableColumnModel':
         '\n'.join([
             'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field" integer ;',
             'UPDATE "tests_testmodel" SET "added_field" = "int_field" WHERE "added_field" IS NULL;',
-            'ALTER TABLE "tests_testmodel" ALTER COLUMN "added_field" SET NOT NULL;',
-        ]),
+        ] + set_not_null_sql('tests_testmodel', 'added_field')),
     'AddNullColumnWithInitialColumnModel':
         '\n'.join([
             'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field" integer ;',
@@ -25,26 +59,22 @@ add_field = {
         '\n'.join([
             'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field" varchar(10) ;',
             'UPDATE "tests_testmodel" SET "added_field" = \'abc\\\'s xyz\' WHERE "added_field" IS NULL;',
-            'ALTER TABLE "tests_testmodel" ALTER COLUMN "added_field" SET NOT NULL;',
-        ]),
+        ] + set_not_null_sql('tests_testmodel', 'added_field')),
     'AddDateColumnModel':
         '\n'.join([
             'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field" timestamp with time zone ;',
             'UPDATE "tests_testmodel" SET "added_field" = 2007-12-13 16:42:00 WHERE "added_field" IS NULL;',
-            'ALTER TABLE "tests_testmodel" ALTER COLUMN "added_field" SET NOT NULL;',
-        ]),
+        ] + set_not_null_sql('tests_testmodel', 'added_field')),
     'AddDefaultColumnModel':
         '\n'.join([
             'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field" integer ;',
             'UPDATE "tests_testmodel" SET "added_field" = 42 WHERE "added_field" IS NULL;',
-            'ALTER TABLE "tests_testmodel" ALTER COLUMN "added_field" SET NOT NULL;',
-        ]),
+        ] + set_not_null_sql('tests_testmodel', 'added_field')),
     'AddEmptyStringDefaultColumnModel':
         '\n'.join([
             'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field" varchar(20) ;',
             'UPDATE "tests_testmodel" SET "added_field" = \'\' WHERE "added_field" IS NULL;',
-            'ALTER TABLE "tests_testmodel" ALTER COLUMN "added_field" SET NOT NULL;',
-        ]),
+        ] + set_not_null_sql('tests_testmodel', 'added_field')),
     'AddNullColumnModel':
         'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field" integer NULL ;',
     'NonDefaultColumnModel':
@@ -67,6 +97,32 @@ add_field = {
         ]),
 }
 
+if postgres_version >= (9, 1):
+    # The foreign key is added once the column has been backfilled, and
+    # validated separately.
+    add_field.update({
+        'AddForeignKeyWithInitialModel':
+            '\n'.join([
+                'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field_id" integer ;',
+                'UPDATE "tests_testmodel" SET "added_field_id" = 1 WHERE "added_field_id" IS NULL;',
+                'ALTER TABLE "tests_testmodel" ADD CONSTRAINT "added_field_id_refs_id_%s" FOREIGN KEY ("added_field_id") REFERENCES "tests_addanchor1" ("id") DEFERRABLE INITIALLY DEFERRED NOT VALID;'
+                % connection.creation._digest('tests_testmodel', 'tests_addanchor1'),
+                '-- Commit the changes made so far',
+                'ALTER TABLE "tests_testmodel" VALIDATE CONSTRAINT "added_field_id_refs_id_%s";'
+                % connection.creation._digest('tests_testmodel', 'tests_addanchor1'),
+            ] + set_not_null_sql('tests_testmodel', 'added_field_id') + [
+                'CREATE INDEX "tests_testmodel_added_field_id" ON "tests_testmodel" ("added_field_id");',
+            ]),
+    })
+else:
+    add_field.update({
+        'AddForeignKeyWithInitialModel':
+            '\n'.join([
+                'ALTER TABLE "tests_testmodel" ADD COLUMN "added_field_id" integer NOT NULL REFERENCES "tests_addanchor1" ("id")  DEFERRABLE INITIALLY DEFERRED;',
+                'CREATE INDEX "tests_testmodel_added_field_id" ON "tests_testmodel" ("added_field_id");',
+            ]),
+    })
+
 if autocreate_through_tables:
     add_field.update({
         'AddManyToManyDatabaseTableModel':
@@ -161,13 +217,11 @@ change_field = {
     "SetNotNullChangeModelWithConstant":
         '\n'.join([
             'UPDATE "tests_testmodel" SET "char_field1" = \'abc\\\'s xyz\' WHERE "char_field1" IS NULL;',
-            'ALTER TABLE "tests_testmodel" ALTER COLUMN "char_field1" SET NOT NULL;',
-        ]),
+        ] + set_not_null_sql('tests_testmodel', 'char_field1')),
     "SetNotNullChangeModelWithCallable":
             '\n'.join([
                 'UPDATE "tests_testmodel" SET "char_field1" = "char_field" WHERE "char_field1" IS NULL;',
-                'ALTER TABLE "tests_testmodel" ALTER COLUMN "char_field1" SET NOT NULL;',
-            ]),
+            ] + set_not_null_sql('tests_testmodel', 'char_field1')),
     "SetNullChangeModel": 'ALTER TABLE "tests_testmodel" ALTER COLUMN "char_field2" DROP NOT NULL;',
     "NoOpChangeModel": '',
     "IncreasingMaxLengthChangeModel": 'ALTER TABLE "tests_testmodel" ALTER COLUMN "char_field" TYPE varchar(45) USING CAST("char_field" as varchar(45));',
@@ -175,7 +229,6 @@ change_field = {
     "DBColumnChangeModel": 'ALTER TABLE "tests_testmodel" RENAME COLUMN "custom_db_column" TO "customised_db_column";',
     "AddDBIndexChangeModel": 'CREATE INDEX "tests_testmodel_int_field2" ON "tests_testmodel" ("int_field2");',
     "RemoveDBIndexChangeModel": 'DROP INDEX "tests_testmodel_int_field1";',
-    "AddUniqueChangeModel": 'ALTER TABLE "tests_testmodel" ADD CONSTRAINT tests_testmodel_int_field4_key UNIQUE("int_field4");',
     "RemoveUniqueChangeModel": 'ALTER TABLE "tests_testmodel" DROP CONSTRAINT tests_testmodel_int_field3_key;',
     "MultiAttrChangeModel":
         '\n'.join([
@@ -196,6 +249,20 @@ change_field = {
         ]),
 }
 
+if postgres_version >= (9, 1):
+    change_field.update({
+        "AddUniqueChangeModel":
+            '\n'.join([
+                '-- Run outside of a transaction, once the changes made so far are committed',
+                'CREATE UNIQUE INDEX CONCURRENTLY tests_testmodel_int_field4_key ON "tests_testmodel" ("int_field4");',
+                'ALTER TABLE "tests_testmodel" ADD CONSTRAINT tests_testmodel_int_field4_key UNIQUE USING INDEX tests_testmodel_int_field4_key;',
+            ]),
+    })
+else:
+    change_field.update({
+        "AddUniqueChangeModel": 'ALTER TABLE "tests_testmodel" ADD CONSTRAINT tests_testmodel_int_field4_key UNIQUE("int_field4");',
+    })
+
 if autocreate_through_tables:
     change_field.update({
         "M2MDBTableChangeModel":
@@ -212,30 +279,18 @@ else:
 
 delete_model = {
     'BasicModel':
-        'DROP TABLE "tests_basicmodel";',
+        'DROP TABLE "tests_basicmodel" CASCADE;',
     'BasicWithM2MModel':
-        '\n'.join([
-            'DROP TABLE "tests_basicwithm2mmodel_m2m";',
-            'DROP TABLE "tests_basicwithm2mmodel";'
-        ]),
+        'DROP TABLE "tests_basicwithm2mmodel_m2m", "tests_basicwithm2mmodel" CASCADE;',
     'CustomTableModel':
-        'DROP TABLE "custom_table_name";',
+        'DROP TABLE "custom_table_name" CASCADE;',
     'CustomTableWithM2MModel':
-        '\n'.join([
-            'DROP TABLE "another_custom_table_name_m2m";',
-            'DROP TABLE "another_custom_table_name";'
-        ]),
+        'DROP TABLE "another_custom_table_name_m2m", "another_custom_table_name" CASCADE;',
 }
 
 delete_application = {
     'DeleteApplication':
-        '\n'.join([
-            'DROP TABLE "tests_appdeleteanchor1";',
-            'DROP TABLE "app_delete_custom_add_anchor_table";',
-            'DROP TABLE "tests_testmodel_anchor_m2m";',
-            'DROP TABLE "tests_testmodel";',
-            'DROP TABLE "app_delete_custom_table_name";',
-        ]),
+        'DROP TABLE "tests_testmodel_anchor_m2m", "app_delete_custom_add_anchor_table", "tests_testmodel", "tests_appdeleteanchor1", "app_delete_custom_table_name" CASCADE;',
 }
 
 rename_field = {
@@ -317,8 +372,7 @@ inheritance = {
         '\n'.join([
             'ALTER TABLE "tests_childmodel" ADD COLUMN "added_field" integer ;',
             'UPDATE "tests_childmodel" SET "added_field" = 42 WHERE "added_field" IS NULL;',
-            'ALTER TABLE "tests_childmodel" ALTER COLUMN "added_field" SET NOT NULL;',
-        ]),
+        ] + set_not_null_sql('tests_childmodel', 'added_field')),
     'DeleteFromChildModel':
         'ALTER TABLE "tests_childmodel" DROP COLUMN "int_field" CASCADE;',
 }
@@ -154,6 +154,18 @@ add_field = {
             'CREATE INDEX "%s" ON "tests_testmodel" ("added_field_id");'
             % generate_index_name('tests_testmodel', 'added_field_id'),
         ]),
+    'AddForeignKeyWithInitialModel':
+        '\n'.join([
+            'CREATE TEMPORARY TABLE "TEMP_TABLE"("int_field" integer NULL, "id" integer NULL UNIQUE PRIMARY KEY, "char_field" varchar(20) NULL, "added_field_id" integer NULL);',
+            'INSERT INTO "TEMP_TABLE" ("int_field", "id", "char_field") SELECT "int_field", "id", "char_field" FROM "tests_testmodel";',
+            'UPDATE "TEMP_TABLE" SET "added_field_id" = 1;',
+            'DROP TABLE "tests_testmodel";',
+            'CREATE TABLE "tests_testmodel"("int_field" integer NOT NULL, "id" integer NOT NULL UNIQUE PRIMARY KEY, "char_field" varchar(20) NOT NULL, "added_field_id" integer NOT NULL);',
+            'INSERT INTO "tests_testmodel" ("int_field", "id", "char_field", "added_field_id") SELECT "int_field", "id", "char_field", "added_field_id" FROM "TEMP_TABLE";',
+            'DROP TABLE "TEMP_TABLE";',
+            'CREATE INDEX "%s" ON "tests_testmodel" ("added_field_id");'
+            % generate_index_name('tests_testmodel', 'added_field_id'),
+        ]),
 }
 
 
@@ -594,10 +606,10 @@ delete_model = {
 delete_application = {
     'DeleteApplication':
         '\n'.join([
-            'DROP TABLE "tests_appdeleteanchor1";',
-            'DROP TABLE "app_delete_custom_add_anchor_table";',
             'DROP TABLE "tests_testmodel_anchor_m2m";',
+            'DROP TABLE "app_delete_custom_add_anchor_table";',
             'DROP TABLE "tests_testmodel";',
+            'DROP TABLE "tests_appdeleteanchor1";',
             'DROP TABLE "app_delete_custom_table_name";',
         ]),
     'DeleteApplicationWithoutDatabase': "",
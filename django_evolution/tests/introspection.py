@@ -0,0 +1,124 @@
+tests = r"""
+>>> from pprint import pprint
+
+>>> from django.core.management import call_command
+>>> from django.db import connection, models
+
+>>> from django_evolution.diff import Diff
+>>> from django_evolution.introspection import introspect_project_sig
+>>> from django_evolution.signature import create_project_sig
+>>> from django_evolution.tests.utils import execute_transaction
+
+# The live schema of freshly synced apps matches their models.
+>>> current_sig = create_project_sig('default')
+>>> live_sig = introspect_project_sig('default', current_sig)
+>>> Diff(current_sig, live_sig).is_empty()
+True
+
+>>> version_sig = live_sig['django_evolution']['Version']
+>>> version_sig['fields']['signature_hash']['max_length']
+40
+>>> version_sig['fields']['when'].get('db_index')
+True
+>>> version_sig['fields']['id'].get('primary_key')
+True
+
+# So the evolve command finds no drift.
+>>> call_command('evolve', check_drift=True)
+No schema drift found.
+
+# Changes made outside of Django Evolution show up as differences.
+>>> qn = connection.ops.quote_name
+>>> execute_transaction([
+...     'CREATE INDEX %s ON %s (%s);' % (qn('evolution_app_label'),
+...                                      qn('django_evolution'),
+...                                      qn('app_label')),
+... ])
+
+>>> live_sig = introspect_project_sig('default', current_sig)
+>>> live_sig['django_evolution']['Evolution']['fields']['app_label']['db_index']
+True
+>>> print Diff(current_sig, live_sig)
+In model django_evolution.Evolution:
+    In field 'app_label':
+        Property 'db_index' has changed
+
+# The evolve command reports the drift from the stored signature and the
+# current models, and exits with an error status. The error is written to
+# stderr, so it's captured along with the rest.
+>>> import sys
+>>> old_stderr = sys.stderr
+>>> sys.stderr = sys.stdout
+>>> try:
+...     try:
+...         call_command('evolve', check_drift=True)
+...     except SystemExit, e:
+...         print 'Exit status: %s' % e.code
+... finally:
+...     sys.stderr = old_stderr
+Schema drift in the 'default' database:
+    The live schema differs from the stored signature:
+        In model django_evolution.Evolution:
+            In field 'app_label':
+                Property 'db_index' has changed
+    The live schema differs from the current models:
+        In model django_evolution.Evolution:
+            In field 'app_label':
+                Property 'db_index' has changed
+Error: The live schema has drifted in the following database(s): default
+Exit status: 1
+
+# Missing tables are left out of the signature.
+>>> missing_sig = {
+...     '__version__': 1,
+...     'tests': {
+...         'MissingModel': {
+...             'meta': {
+...                 'db_table': 'tests_missingmodel',
+...                 'db_tablespace': '',
+...                 'pk_column': 'id',
+...                 'unique_together': [],
+...             },
+...             'fields': {
+...                 'id': {
+...                     'field_type': models.AutoField,
+...                     'primary_key': True,
+...                 },
+...             },
+...         },
+...     },
+... }
+>>> pprint(introspect_project_sig('default', missing_sig))
+{'__version__': 1, 'tests': {}}
+
+# Introspection workers stop and close their connections if the consumer
+# stops early.
+>>> import threading, time
+>>> from django_evolution.introspection import _fetch_schemas
+>>> class FakeConnection(object):
+...     closed = []
+...     def cursor(self):
+...         return None
+...     def close(self):
+...         self.closed.append(threading.currentThread())
+>>> class FakeEvolver(object):
+...     connection = FakeConnection()
+...     def introspect_tables(self, cursor, table_names):
+...         return table_names
+>>> batches = [(i, ['table%d' % i]) for i in range(20)]
+>>> schemas = _fetch_schemas(FakeEvolver(), batches, 4)
+>>> schemas.next()
+(0, ['table0'])
+>>> schemas.close()
+>>> for attempt in range(100):
+...     if len(FakeConnection.closed) == 4:
+...         break
+...     time.sleep(0.05)
+>>> len(FakeConnection.closed)
+4
+
+# Clean up after the test.
+>>> execute_transaction([
+...     'DROP INDEX %s;' % qn('evolution_app_label'),
+... ])
+"""
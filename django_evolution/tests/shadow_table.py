@@ -0,0 +1,206 @@
+# These tests are only run on MySQL, so the SQL is always MySQL's.
+from django_evolution.tests.db import mysql as mysql_sql
+
+tests = r"""
+>>> from django.db import connection
+
+>>> from django_evolution.db.mysql import ONLINE_DDL_LEVELS, OnlineDDLSQL, ShadowTableCopy
+>>> from django_evolution.tests.utils import execute_transaction
+>>> from django_evolution.throttle import Throttle
+
+>>> def fetch(sql):
+...     cursor = connection.cursor()
+...     num_rows = cursor.execute(sql)
+...     return cursor.fetchall()
+
+>>> def print_rows():
+...     for row in fetch('SELECT * FROM `tests_shadowmodel` ORDER BY `id`'):
+...         print ' '.join([str(value) for value in row])
+
+>>> def print_leftovers():
+...     print len(fetch("SELECT table_name FROM information_schema.tables"
+...                     " WHERE table_schema = DATABASE()"
+...                     "   AND table_name LIKE '\\_tests\\_shadowmodel%%'"))
+...     print len(fetch("SELECT trigger_name FROM information_schema.triggers"
+...                     " WHERE event_object_schema = DATABASE()"))
+
+>>> execute_transaction([
+...     'CREATE TABLE `tests_shadowmodel` ('
+...     '    `id` integer AUTO_INCREMENT NOT NULL PRIMARY KEY,'
+...     '    `name` varchar(10) NOT NULL,'
+...     '    `value` integer NOT NULL'
+...     ') ENGINE=InnoDB;',
+... ] + [
+...     "INSERT INTO `tests_shadowmodel` (`name`, `value`)"
+...     " VALUES ('row%%d', %%d);" %% (i, i)
+...     for i in range(1, 11)
+... ])
+
+# Rows are copied to the shadow table a chunk at a time, and writes made
+# between chunks are mirrored by the triggers. Each chunk is committed, so
+# copies are run under transaction management.
+>>> writes = [
+...     ["UPDATE `tests_shadowmodel` SET `value` = 100 WHERE `id` = 1",
+...      "DELETE FROM `tests_shadowmodel` WHERE `id` = 2"],
+...     ["INSERT INTO `tests_shadowmodel` (`name`, `value`)"
+...      " VALUES ('row11', 11)",
+...      "UPDATE `tests_shadowmodel` SET `value` = 800 WHERE `id` = 8"],
+...     ["DELETE FROM `tests_shadowmodel` WHERE `id` = 9"],
+... ]
+>>> def write_between_chunks(database):
+...     cursor = connection.cursor()
+...     for sql in writes.pop(0):
+...         num_rows = cursor.execute(sql)
+...     return 0
+
+>>> shadow_table_copy = ShadowTableCopy(
+...     'tests_shadowmodel',
+...     'CHANGE COLUMN `name` `title` varchar(20) NOT NULL,'
+...     ' MODIFY COLUMN `value` bigint NOT NULL',
+...     connection, chunk_size=3)
+>>> execute_transaction([shadow_table_copy],
+...                     throttle=Throttle(write_between_chunks))
+>>> writes
+[]
+>>> print_rows()
+1 row1 100
+3 row3 3
+4 row4 4
+5 row5 5
+6 row6 6
+7 row7 7
+8 row8 800
+10 row10 10
+11 row11 11
+>>> for row in fetch("SELECT column_name, data_type"
+...                "  FROM information_schema.columns"
+...                " WHERE table_schema = DATABASE()"
+...                "   AND table_name = 'tests_shadowmodel'"
+...                " ORDER BY ordinal_position"):
+...     print ' '.join(row)
+id int
+title varchar
+value bigint
+>>> print_leftovers()
+0
+0
+
+# A failed change leaves the table as it was
+>>> try:
+...     execute_transaction([
+...         ShadowTableCopy('tests_shadowmodel',
+...                         'MODIFY COLUMN `missing` integer', connection),
+...     ])
+... except Exception, e:
+...     print e.args[0]
+1054
+>>> print_leftovers()
+0
+0
+
+# Changes that would block writes fall back on a shadow table
+>>> step = OnlineDDLSQL(
+...     'ALTER TABLE `tests_shadowmodel` MODIFY COLUMN `value` integer NOT NULL;',
+...     ONLINE_DDL_LEVELS[1:],
+...     ShadowTableCopy('tests_shadowmodel',
+...                     'MODIFY COLUMN `value` integer NOT NULL', connection))
+>>> step.levels
+['ALGORITHM=INPLACE, LOCK=NONE']
+>>> execute_transaction([step])
+>>> print step.execution_note
+ALTER TABLE `tests_shadowmodel` MODIFY COLUMN `value` integer NOT NULL; -- copied through a shadow table
+>>> print_rows()
+1 row1 100
+3 row3 3
+4 row4 4
+5 row5 5
+6 row6 6
+7 row7 7
+8 row8 800
+10 row10 10
+11 row11 11
+
+# Foreign keys copied to the shadow table get their names back after the swap
+>>> execute_transaction([
+...     'CREATE TABLE `tests_shadowref` ('
+...     '    `id` integer AUTO_INCREMENT NOT NULL PRIMARY KEY,'
+...     '    `shadow_id` integer NOT NULL,'
+...     '    CONSTRAINT `tests_shadowref_shadow_id_fk` FOREIGN KEY (`shadow_id`)'
+...     '        REFERENCES `tests_shadowmodel` (`id`)'
+...     ') ENGINE=InnoDB;',
+...     'INSERT INTO `tests_shadowref` (`shadow_id`) VALUES (1);',
+... ])
+>>> def print_foreign_keys():
+...     for row in fetch("SELECT constraint_name"
+...                      "  FROM information_schema.referential_constraints"
+...                      " WHERE constraint_schema = DATABASE()"
+...                      "   AND table_name = 'tests_shadowref'"):
+...         print row[0]
+>>> for i in range(2):
+...     execute_transaction([
+...         ShadowTableCopy('tests_shadowref',
+...                         'MODIFY COLUMN `shadow_id` integer NOT NULL',
+...                         connection),
+...     ])
+>>> print_foreign_keys()
+tests_shadowref_shadow_id_fk
+
+# Tables referenced by foreign keys can't be copied, so their changes use the
+# hints that block writes instead. This is checked when the change runs, so
+# nothing is read from the database when the SQL is generated.
+>>> from django.conf import settings
+>>> from django_evolution.db.mysql import EvolutionOperations
+>>> settings.DJANGO_EVOLUTION_MYSQL_SHADOW_TABLES = True
+>>> sql = EvolutionOperations(connection).get_online_ddl_sql([
+...     'ALTER TABLE `tests_shadowmodel` MODIFY COLUMN `value` bigint NOT NULL;',
+... ])
+>>> settings.DJANGO_EVOLUTION_MYSQL_SHADOW_TABLES = False
+>>> sql[0].shadow_table_copy is not None
+True
+>>> execute_transaction(sql)
+>>> sql[0].execution_note.endswith(
+...     '(not copied through a shadow table: foreign keys reference the '
+...     'table)')
+True
+
+# Clean up the tables
+>>> execute_transaction(['DROP TABLE `tests_shadowref`;',
+...                      'DROP TABLE `tests_shadowmodel`;'])
+
+# Changes made by mutations that may be copied are marked in the SQL
+>>> import copy
+>>> from django.db import models
+>>> from django_evolution.diff import Diff
+>>> from django_evolution.tests.utils import test_proj_sig, execute_test_sql, register_models, deregister_models
+
+>>> class ShadowBaseModel(models.Model):
+...     value = models.IntegerField()
+...     char_field = models.CharField(max_length=20)
+
+>>> start = register_models(('TestModel', ShadowBaseModel))
+>>> start_sig = test_proj_sig(('TestModel', ShadowBaseModel))
+
+>>> class ShadowTableChangeModel(models.Model):
+...     value = models.IntegerField()
+...     char_field = models.CharField(max_length=45)
+
+>>> end = register_models(('TestModel', ShadowTableChangeModel))
+>>> end_sig = test_proj_sig(('TestModel', ShadowTableChangeModel))
+
+>>> settings.DJANGO_EVOLUTION_MYSQL_SHADOW_TABLES = True
+>>> test_sig = copy.deepcopy(start_sig)
+>>> test_sql = []
+>>> for mutation in Diff(start_sig, end_sig).evolution()['tests']:
+...     test_sql.extend(mutation.mutate('tests', test_sig))
+...     mutation.simulate('tests', test_sig)
+>>> settings.DJANGO_EVOLUTION_MYSQL_SHADOW_TABLES = False
+
+>>> Diff(test_sig, end_sig).is_empty()
+True
+
+>>> execute_test_sql(start, end, test_sql) # ShadowTableChangeModel
+%(ShadowTableChangeModel)s
+
+# Clean up after the applications that were installed
+>>> deregister_models()
+""" % mysql_sql.shadow_table
@@ -0,0 +1,64 @@
+tests = r"""
+>>> from django.db import models
+
+>>> from django_evolution.diff import Diff
+>>> from django_evolution.mutations import AddField
+>>> from django_evolution.signals import evolution_operation_started, \
+...                                     evolution_operation_finished, \
+...                                     run_mutation_operation
+>>> from django_evolution.tests.utils import test_proj_sig, \
+...                                         register_models, \
+...                                         deregister_models
+
+>>> class SignalsBaseModel(models.Model):
+...     char_field = models.CharField(max_length=20)
+
+>>> class SignalsModel(models.Model):
+...     char_field = models.CharField(max_length=20)
+...     int_field = models.IntegerField(null=True)
+
+>>> start = register_models(('TestModel', SignalsBaseModel))
+>>> start_sig = test_proj_sig(('TestModel', SignalsBaseModel))
+>>> end = register_models(('TestModel', SignalsModel))
+>>> end_sig = test_proj_sig(('TestModel', SignalsModel))
+
+>>> operations = []
+>>> def on_started(sender, operation, app_label, model_name, field_name,
+...                start_time, **kwargs):
+...     operations.append(('started', operation, app_label, model_name,
+...                        field_name))
+>>> def on_finished(sender, operation, start_time, end_time, duration,
+...                 exception, **kwargs):
+...     assert duration == end_time - start_time >= 0
+...     operations.append(('finished', operation, exception))
+>>> evolution_operation_started.connect(on_started)
+>>> evolution_operation_finished.connect(on_finished)
+
+# Diffs and mutations are reported, along with what they operate on.
+>>> d = Diff(start_sig, end_sig)
+>>> mutation = AddField('TestModel', 'int_field', models.IntegerField,
+...                     null=True)
+>>> run_mutation_operation('simulate', mutation, 'tests', start_sig,
+...                        'default')
+>>> for operation in operations:
+...     print operation
+('started', 'diff', None, None, None)
+('finished', 'diff', None)
+('started', 'simulate', 'tests', 'TestModel', 'int_field')
+('finished', 'simulate', None)
+
+# Operations that fail are still reported as finished.
+>>> operations = []
+>>> run_mutation_operation('simulate', mutation, 'tests', start_sig,
+...                        'default')
+Traceback (most recent call last):
+...
+SimulationFailure: Model 'tests.TestModel' already has a field named 'int_field'
+>>> operations[-1]
+('finished', 'simulate', SimulationFailure())
+
+# Clean up after the test.
+>>> evolution_operation_started.disconnect(on_started)
+>>> evolution_operation_finished.disconnect(on_finished)
+>>> deregister_models()
+"""
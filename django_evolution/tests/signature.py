@@ -4,7 +4,7 @@ tests = r"""
 >>> from django_evolution import signature
 >>> from django_evolution.diff import Diff
 >>> from django_evolution.tests.utils import test_proj_sig, register_models, deregister_models
->>> from pprint import pprint
+>>> from django_evolution.tests.utils import pprint
 >>> from django.contrib.contenttypes import generic
 >>> from django.contrib.contenttypes.models import ContentType
 
@@ -103,6 +103,28 @@ tests = r"""
           'pk_column': 'parentmodel_ptr_id',
           'unique_together': []}}
 
+# Field signatures act like dictionaries, but identical signatures share
+# their attributes, and copies share them until they're changed.
+>>> char_sig = signature.create_model_sig(SigModel)['fields']['char_field']
+>>> char_sig == {'field_type': models.CharField, 'max_length': 20}
+True
+>>> sorted(char_sig.keys())
+['field_type', 'max_length']
+>>> char_sig._items is signature.create_field_sig(
+...     SigModel._meta.get_field('char_field'))._items
+True
+>>> import copy
+>>> char_copy = copy.deepcopy(char_sig)
+>>> char_copy._items is char_sig._items
+True
+>>> char_copy['null'] = True
+>>> char_copy['null'], 'null' in char_sig
+(True, False)
+>>> char_copy.pop('null')
+True
+>>> char_copy._items is char_sig._items
+True
+
 # Now, a useful test model we can use for evaluating diffs
 >>> class BaseModel(models.Model):
 ...     name = models.CharField(max_length=20)
@@ -241,6 +263,241 @@ False
 >>> print [str(e) for e in d.evolution()['tests']] # Change Field - change property
 ["ChangeField('TestModel', 'ref', initial=None, related_model='tests.Anchor2')"]
 
+# Signature hashes are stable across copies and container types
+>>> import copy
+>>> from django.utils.datastructures import SortedDict
+>>> hash_sig = signature.create_signature_hash(start_sig)
+>>> hash_sig == signature.create_signature_hash(copy.deepcopy(start_sig))
+True
+>>> reordered_sig = {'__version__': 1, 'tests': SortedDict()}
+>>> for model_name in reversed(start_sig['tests'].keys()):
+...     reordered_sig['tests'][model_name] = start_sig['tests'][model_name]
+>>> hash_sig == signature.create_signature_hash(reordered_sig)
+True
+
+# ... but change along with the signature
+>>> hash_sig == signature.create_signature_hash(test_sig)
+False
+
+# Signatures are stored as canonical JSON, with field types stored by path
+>>> data = signature.serialize_signature(start_sig, compress=False)
+>>> data.startswith('json2:')
+True
+>>> '"django.db.models.fields.CharField"' in data
+True
+>>> data == signature.serialize_signature(reordered_sig, compress=False)
+True
+
+# Loaded signatures are equivalent to the original
+>>> loaded_sig = signature.deserialize_signature(data)
+>>> Diff(start_sig, loaded_sig).is_empty()
+True
+>>> Diff(loaded_sig, test_sig).is_empty()
+False
+>>> signature.create_signature_hash(loaded_sig) == hash_sig
+True
+
+# Field types are only imported when needed, but compare equal to the
+# classes they name
+>>> field_type = loaded_sig['tests']['TestModel']['fields']['name']['field_type']
+>>> field_type
+<class 'django.db.models.fields.CharField'>
+>>> field_type == models.CharField, field_type != models.CharField
+(True, False)
+>>> models.IntegerField == field_type
+False
+>>> field_type().get_internal_type()
+'CharField'
+
+# Signatures from models hold the field classes, even when loaded signatures
+# have identical fields
+>>> signature.create_field_sig(models.CharField(max_length=20))['field_type'] is models.CharField
+True
+
+# Loading a signature never imports its field classes, so classes that no
+# longer exist don't prevent it from loading
+>>> removed_sig = signature.deserialize_signature(
+...     data.replace('django.db.models.fields.CharField',
+...                  'removed.fields.RemovedField'))
+>>> removed_sig['tests']['TestModel']['fields']['name']['field_type']
+<class 'removed.fields.RemovedField'>
+>>> Diff(removed_sig, removed_sig).is_empty()
+True
+
+# Diffs look up the internal types of field classes once
+>>> from django_evolution.diff import get_field_internal_type
+>>> get_field_internal_type(field_type), get_field_internal_type(models.CharField)
+('CharField', 'CharField')
+>>> get_field_internal_type(models.ForeignKey) is None
+True
+
+# Signatures can be compressed
+>>> compressed = signature.serialize_signature(start_sig, compress=True)
+>>> compressed.startswith('json2z:')
+True
+>>> len(compressed) < len(data)
+True
+>>> Diff(start_sig, signature.deserialize_signature(compressed)).is_empty()
+True
+
+# Signatures pickled by older versions can still be loaded
+>>> import cPickle as pickle
+>>> pickled_sig = signature.deserialize_signature(pickle.dumps(start_sig))
+>>> pickled_sig['tests']['TestModel']['fields']['name']['field_type']
+<class 'django.db.models.fields.CharField'>
+>>> Diff(start_sig, pickled_sig).is_empty()
+True
+
+# The stored baseline matches the current project signature
+>>> from django_evolution.evolve import is_evolution_required
+>>> is_evolution_required()
+False
+
+# Project signatures can be built lazily, one application at a time
+>>> full_sig = signature.create_project_sig('default')
+>>> lazy_sig = signature.create_lazy_project_sig('default')
+>>> sorted(lazy_sig.keys()) == sorted(full_sig.keys())
+True
+>>> lazy_sig.is_loaded('contenttypes')
+False
+
+# Diffs restricted to some applications only build those signatures
+>>> Diff(full_sig, lazy_sig, ['contenttypes']).is_empty()
+True
+>>> lazy_sig.is_loaded('contenttypes'), lazy_sig.is_loaded('auth')
+(True, False)
+>>> Diff(full_sig, lazy_sig).is_empty()
+True
+>>> signature.create_signature_hash(lazy_sig) == signature.create_signature_hash(full_sig)
+True
+
+# Built application signatures can be unloaded, and are rebuilt on access
+>>> lazy_sig.unload('contenttypes')
+>>> lazy_sig.is_loaded('contenttypes')
+False
+>>> Diff(full_sig, lazy_sig, ['contenttypes']).is_empty()
+True
+
+# Versions store each application's signature once, in a separate blob
+>>> from datetime import datetime
+>>> from django_evolution.models import SignatureBlob, Version
+>>> blob_count = SignatureBlob.objects.count()
+>>> versions = []
+>>> for proj_sig in (start_sig, test_sig, start_sig):
+...     version = Version(when=datetime(2000, 1, len(versions) + 1))
+...     version.set_signature(proj_sig)
+...     version.save()
+...     versions.append(version)
+>>> versions[0].signature.startswith('apps1:')
+True
+>>> versions[0].signature == versions[2].signature
+True
+>>> SignatureBlob.objects.count() - blob_count
+2
+
+# The blobs are only loaded from the database once
+>>> SignatureBlob.objects._data_cache.clear()
+>>> loaded_sig = Version.objects.get(pk=versions[0].pk).get_signature()
+>>> Diff(start_sig, loaded_sig).is_empty()
+True
+>>> signature.create_signature_hash(loaded_sig) == versions[0].signature_hash
+True
+>>> Diff(test_sig, Version.objects.get(pk=versions[1].pk).get_signature()).is_empty()
+True
+
+# Blobs that are no longer referenced can be deleted
+>>> Version.objects.filter(pk__in=[version.pk for version in versions]).delete()
+>>> SignatureBlob.objects.delete_unreferenced()
+2
+
+# Mutations can be simulated against an overlay, leaving the base untouched
+>>> from django_evolution.mutations import AddField, ChangeField, DeleteField, RenameField
+>>> base_sig = copy.deepcopy(start_sig)
+>>> overlay = signature.SignatureOverlay(base_sig)
+>>> Diff(base_sig, overlay).is_empty()
+True
+>>> for mutation in [AddField('TestModel', 'added', models.IntegerField, null=True),
+...                  ChangeField('TestModel', 'name', max_length=30),
+...                  RenameField('TestModel', 'age', 'years')]:
+...     mutation.simulate('tests', overlay)
+>>> Diff(start_sig, base_sig).is_empty()
+True
+>>> sorted(overlay['tests']['TestModel']['fields'].keys())
+['added', 'id', 'name', 'ref', 'years']
+>>> sorted(base_sig['tests']['TestModel']['fields'].keys())
+['age', 'id', 'name', 'ref']
+
+# Diffing an overlay against its base only compares what has changed
+>>> overlay.get_changed_keys()
+['tests']
+>>> sorted(overlay['tests']['TestModel']['fields'].get_changed_keys())
+['added', 'age', 'name', 'years']
+>>> print Diff(base_sig, overlay)
+In model tests.TestModel:
+    Field 'added' has been added
+    Field 'years' has been added
+    Field 'age' has been deleted
+    In field 'name':
+        Property 'max_length' has changed
+>>> print Diff(overlay, base_sig)
+In model tests.TestModel:
+    Field 'age' has been added
+    Field 'added' has been deleted
+    Field 'years' has been deleted
+    In field 'name':
+        Property 'max_length' has changed
+
+# Looking up entries, or changing them back, isn't counted as a change
+>>> overlay = signature.SignatureOverlay(base_sig)
+>>> name_sig = overlay['tests']['TestModel']['fields']['name']
+>>> name_sig['max_length'] = 30
+>>> name_sig['max_length'] = 20
+>>> overlay['tests']['Anchor1']['fields'].keys()
+['id', 'value']
+>>> overlay.get_changed_keys()
+[]
+
+# Branching an overlay gives independent copies
+>>> DeleteField('TestModel', 'ref').simulate('tests', overlay)
+>>> branch = overlay.branch()
+>>> DeleteField('TestModel', 'name').simulate('tests', branch)
+>>> AddField('TestModel', 'other', models.IntegerField, null=True).simulate('tests', overlay)
+>>> sorted(overlay['tests']['TestModel']['fields'].keys())
+['age', 'id', 'name', 'other']
+>>> sorted(branch['tests']['TestModel']['fields'].keys())
+['age', 'id']
+>>> sorted(copy.deepcopy(branch)['tests']['TestModel']['fields'].keys())
+['age', 'id']
+>>> print Diff(overlay, branch)
+In model tests.TestModel:
+    Field 'name' has been deleted
+    Field 'other' has been deleted
+>>> Diff(start_sig, base_sig).is_empty()
+True
+
+# Entries looked up before branching belong only to the original overlay
+>>> fields = overlay['tests']['TestModel']['fields']
+>>> name_sig = fields['name']
+>>> branch = overlay.branch()
+>>> del fields['age']
+>>> name_sig['max_length'] = 40
+>>> sorted(overlay['tests']['TestModel']['fields'].keys())
+['id', 'name', 'other']
+>>> sorted(branch['tests']['TestModel']['fields'].keys())
+['age', 'id', 'name', 'other']
+>>> branch['tests']['TestModel']['fields']['name']['max_length']
+20
+
+# Branches can be branched again
+>>> branch2 = branch.branch()
+>>> del branch['tests']['TestModel']['fields']['id']
+>>> sorted(branch2['tests']['TestModel']['fields'].keys())
+['age', 'id', 'name', 'other']
+>>> sorted(branch['tests']['TestModel']['fields'].keys())
+['age', 'name', 'other']
+>>> sorted(overlay['tests']['TestModel']['fields'].keys())
+['id', 'name', 'other']
+
 # Clean up after the applications that were installed
 >>> deregister_models()
 
@@ -0,0 +1,129 @@
+tests = r"""
+>>> import os
+>>> import shutil
+>>> import sys
+>>> import tempfile
+
+>>> from django.db import models
+
+>>> from django_evolution.evolve import get_evolution_sequence, \
+...                                    get_unapplied_evolutions, \
+...                                    write_squashed_evolution
+>>> from django_evolution.models import Evolution, Version
+>>> from django_evolution.mutations import AddField, ChangeField, \
+...                                        DeleteField, DeleteModel, \
+...                                        RenameField
+>>> from django_evolution.squash import squash_mutations
+
+>>> def print_mutations(mutations):
+...     for mutation in mutations:
+...         print mutation
+
+# Fields that are added and then changed are added in their final state.
+>>> print_mutations(squash_mutations('tests', [
+...     AddField('Author', 'age', models.IntegerField, null=True),
+...     ChangeField('Author', 'age', initial=0, null=False),
+...     RenameField('Author', 'age', 'years'),
+... ]))
+AddField('Author', 'years', models.IntegerField, initial=0, null=False)
+
+# Fields that are added and then deleted disappear.
+>>> print_mutations(squash_mutations('tests', [
+...     AddField('Author', 'age', models.IntegerField, null=True),
+...     AddField('Author', 'height', models.IntegerField, null=True),
+...     DeleteField('Author', 'age'),
+... ]))
+AddField('Author', 'height', models.IntegerField, null=True)
+
+# Changes to existing fields are combined.
+>>> print_mutations(squash_mutations('tests', [
+...     ChangeField('Author', 'name', max_length=50),
+...     RenameField('Author', 'name', 'full_name', db_column='name'),
+...     ChangeField('Author', 'full_name', null=True),
+...     ChangeField('Author', 'full_name', max_length=100),
+...     RenameField('Book', 'title', 'name'),
+...     RenameField('Book', 'name', 'title'),
+...     DeleteField('Book', 'isbn'),
+...     AddField('Book', 'isbn', models.CharField, max_length=13, null=True),
+... ]))
+RenameField('Author', 'name', 'full_name', db_column='name')
+ChangeField('Author', 'full_name', initial=None, max_length=100, null=True)
+DeleteField('Book', 'isbn')
+AddField('Book', 'isbn', models.CharField, max_length=13, null=True)
+
+# Deleted models only need to be deleted.
+>>> print_mutations(squash_mutations('tests', [
+...     AddField('Author', 'age', models.IntegerField, null=True),
+...     DeleteField('Author', 'name'),
+...     DeleteModel('Author'),
+... ]))
+DeleteModel('Author')
+
+# Mutations that can't be replayed can't be squashed.
+>>> squash_mutations('tests', [
+...     AddField('Author', 'age', models.IntegerField, null=True),
+...     AddField('Author', 'age', models.IntegerField, null=True),
+... ])
+Traceback (most recent call last):
+...
+EvolutionException: Unable to replay AddField('Author', 'age', models.IntegerField, null=True) while squashing: Model 'tests.Author' already has a field named 'age'
+
+# Create an app package with a few evolutions.
+>>> temp_dir = tempfile.mkdtemp()
+>>> app_dir = os.path.join(temp_dir, 'squashapp')
+>>> os.makedirs(os.path.join(app_dir, 'evolutions'))
+>>> open(os.path.join(app_dir, '__init__.py'), 'w').close()
+>>> open(os.path.join(app_dir, 'models.py'), 'w').close()
+>>> for label in ('first', 'second', 'third'):
+...     f = open(os.path.join(app_dir, 'evolutions', label + '.py'), 'w')
+...     f.write('MUTATIONS = []\n')
+...     f.close()
+>>> f = open(os.path.join(app_dir, 'evolutions', '__init__.py'), 'w')
+>>> f.write("SEQUENCE = ['first', 'second', 'third']\n")
+>>> f.close()
+>>> sys.path.insert(0, temp_dir)
+>>> from squashapp import models as squashapp
+
+# Squash the first two evolutions.
+>>> filename = write_squashed_evolution(squashapp, 'squashed', [
+...     AddField('Author', 'age', models.IntegerField, null=True),
+... ], ['first', 'second'])
+>>> print open(filename).read()
+from django_evolution.mutations import *
+from django.db import models
+<BLANKLINE>
+REPLACES = [
+    'first',
+    'second',
+]
+<BLANKLINE>
+MUTATIONS = [
+    AddField('Author', 'age', models.IntegerField, null=True)
+]
+<BLANKLINE>
+>>> del sys.modules['squashapp.evolutions']
+>>> get_evolution_sequence(squashapp)
+['squashed', 'third']
+
+# New databases apply the squashed evolution, while databases that applied
+# all or some of the replaced evolutions carry on where they left off.
+>>> get_unapplied_evolutions(squashapp, 'default')
+['squashed', 'third']
+>>> version = Version.objects.current_version()
+>>> evolution = Evolution.objects.create(app_label='squashapp',
+...                                      label='first', version=version)
+>>> get_unapplied_evolutions(squashapp, 'default')
+['second', 'third']
+>>> evolution = Evolution.objects.create(app_label='squashapp',
+...                                      label='second', version=version)
+>>> get_unapplied_evolutions(squashapp, 'default')
+['third']
+
+# Clean up after the test.
+>>> Evolution.objects.filter(app_label='squashapp').delete()
+>>> sys.path.remove(temp_dir)
+>>> for name in sys.modules.keys():
+...     if name.startswith('squashapp'):
+...         del sys.modules[name]
+>>> shutil.rmtree(temp_dir)
+"""
@@ -1,4 +1,5 @@
 from datetime import datetime
+from pprint import pprint as _pprint
 from django.core.management import sql
 from django.core.management.color import no_style
 from django.db import connection, transaction, settings, models
@@ -6,6 +7,7 @@ from django.db.backends.util import truncate_name
 from django.db.models.loading import cache
 from django.utils.datastructures import SortedDict
 from django.utils.functional import curry
+from django.utils.hashcompat import sha_constructor
 from django_evolution import signature, is_multi_db
 from django_evolution.tests import models as evo_test
 from django_evolution.utils import write_sql, execute_sql
@@ -24,6 +26,35 @@ DEFAULT_TEST_ATTRIBUTE_VALUES = {
     models.PositiveIntegerField: '42'
 }
 
+# Whether execute_test_sql() restores start states from snapshots, rather
+# than generating their tables and test data each time. Restoring a
+# snapshot still runs the DDL and inserts the rows, which is where most of
+# the time goes, so this mostly skips SQL generation and the ORM.
+USE_SNAPSHOTS = True
+
+# Snapshots of the tables and test data for each start state, keyed by the
+# database and the hash of the start state's signature.
+_snapshots = {}
+
+
+def pprint(value):
+    """
+    Pretty-print a value, showing field signatures as dictionaries so that
+    they're wrapped like the rest of a signature.
+    """
+    def to_dicts(value):
+        if isinstance(value, signature.FieldSignature):
+            return dict(value.iteritems())
+        elif isinstance(value, dict):
+            return dict([
+                (key, to_dicts(item))
+                for key, item in value.iteritems()
+            ])
+
+        return value
+
+    _pprint(to_dicts(value))
+
 
 def wrap_sql_func(func, evo_test, style, db_name=None):
     if is_multi_db():
@@ -167,7 +198,8 @@ def test_proj_sig_multi(app_label, *models, **kwargs):
     return _test_proj_sig(app_label, *models, **kwargs)
 
 
-def execute_transaction(sql, output=False, database='default'):
+def execute_transaction(sql, output=False, database='default',
+                        throttle=None):
     "A transaction wrapper for executing a list of SQL statements"
     my_connection = connection
     using_args = {}
@@ -190,7 +222,7 @@ def execute_transaction(sql, output=False, database='default'):
         if output:
             write_sql(sql, database)
 
-        execute_sql(cursor, sql)
+        execute_sql(cursor, sql, throttle)
 
         transaction.commit(**using_args)
         transaction.leave_transaction_management(**using_args)
@@ -223,11 +255,15 @@ def execute_test_sql(start, end, sql, debug=False, app_label='tests',
 
     # Install the initial tables and indicies
     style = no_style()
-    execute_transaction(sql_create(evo_test, style, database),
-                        output=debug, database=database)
-    execute_transaction(sql_indexes(evo_test, style, database),
-                        output=debug, database=database)
-    create_test_data(models.get_models(evo_test), database)
+
+    if USE_SNAPSHOTS and not debug:
+        restore_snapshot(app_label, database)
+    else:
+        execute_transaction(sql_create(evo_test, style, database),
+                            output=debug, database=database)
+        execute_transaction(sql_indexes(evo_test, style, database),
+                            output=debug, database=database)
+        create_test_data(models.get_models(evo_test), database)
 
     # Set the app cache to the end state
     set_app_test_models(copy.deepcopy(end), app_label=app_label)
@@ -246,6 +282,106 @@ def execute_test_sql(start, end, sql, debug=False, app_label='tests',
             execute_transaction(sql_delete(evo_test, style, database),
                                 output=debug, database=database)
 
+def restore_snapshot(app_label, database):
+    """
+    Create the tables and test data for the current start state.
+
+    The first time a start state is seen, its tables and test data are
+    generated as usual, and a snapshot of the SQL and the rows is kept.
+    Later tests with the same start state replay the snapshot instead.
+
+    The tables are recreated by running the SQL again, rather than by
+    copying a pre-built database, since the test tables share the database
+    with the state kept by earlier tests.
+    """
+    app_models = models.get_models(evo_test, include_auto_created=True)
+    key = (database, sha_constructor(signature.serialize_signature(
+        _test_proj_sig(app_label, *[(model._meta.object_name, model)
+                                    for model in app_models]),
+        compress=False)).hexdigest())
+
+    if key in _snapshots:
+        setup_sql, table_rows = _snapshots[key]
+        execute_transaction(setup_sql, database=database)
+        insert_rows(table_rows, database)
+
+        # The rows are inserted with their IDs, so sequences (on databases
+        # that use them) must be moved past them.
+        my_connection = connection
+
+        if is_multi_db():
+            my_connection = connections[database or DEFAULT_DB_ALIAS]
+
+        execute_transaction(
+            my_connection.ops.sequence_reset_sql(no_style(), app_models),
+            database=database)
+        return
+
+    style = no_style()
+    setup_sql = (sql_create(evo_test, style, database) +
+                 sql_indexes(evo_test, style, database))
+    execute_transaction(setup_sql, database=database)
+    create_test_data(models.get_models(evo_test), database)
+
+    _snapshots[key] = (setup_sql,
+                       fetch_rows([model._meta.db_table
+                                   for model in app_models], database))
+
+
+def fetch_rows(table_names, database):
+    "Return (table_name, column_names, rows) for each of the given tables"
+    my_connection = connection
+
+    if is_multi_db():
+        my_connection = connections[database or DEFAULT_DB_ALIAS]
+
+    qn = my_connection.ops.quote_name
+    cursor = my_connection.cursor()
+    table_rows = []
+
+    for table_name in table_names:
+        cursor.execute('SELECT * FROM %s' % qn(table_name))
+        table_rows.append((table_name,
+                           [desc[0] for desc in cursor.description],
+                           cursor.fetchall()))
+
+    return table_rows
+
+
+def insert_rows(table_rows, database):
+    "Insert rows returned by fetch_rows() back into their tables"
+    my_connection = connection
+    using_args = {}
+
+    if is_multi_db():
+        database = database or DEFAULT_DB_ALIAS
+        my_connection = connections[database]
+        using_args['using'] = database
+
+    qn = my_connection.ops.quote_name
+
+    transaction.enter_transaction_management(**using_args)
+    transaction.managed(True, **using_args)
+
+    try:
+        cursor = my_connection.cursor()
+
+        for table_name, column_names, rows in table_rows:
+            if rows:
+                cursor.executemany(
+                    'INSERT INTO %s (%s) VALUES (%s)'
+                    % (qn(table_name),
+                       ', '.join([qn(name) for name in column_names]),
+                       ', '.join(['%s'] * len(column_names))),
+                    rows)
+
+        transaction.commit(**using_args)
+        transaction.leave_transaction_management(**using_args)
+    except Exception:
+        transaction.rollback(**using_args)
+        raise
+
+
 def create_test_data(app_models, database):
     deferred_models = []
     deferred_fields = {}
@@ -0,0 +1,113 @@
+tests = r"""
+>>> import os
+>>> import shutil
+>>> import sys
+>>> import tempfile
+
+>>> from django.db import models
+
+>>> from django_evolution.evolve import add_to_sequence, \
+...                                    get_evolution_sequence, \
+...                                    write_hinted_evolution
+>>> from django_evolution.mutations import AddField, DeleteField
+
+# Labels are appended to SEQUENCE lists of any layout.
+>>> print add_to_sequence("SEQUENCE = []\n", 'new')
+SEQUENCE = [
+    'new',
+]
+<BLANKLINE>
+>>> print add_to_sequence("SEQUENCE = ['first', 'second']\n", 'new')
+SEQUENCE = ['first', 'second', 'new']
+<BLANKLINE>
+>>> print add_to_sequence("SEQUENCE = [\n    'first',\n    'second'\n]\n",
+...                       'new')
+SEQUENCE = [
+    'first',
+    'second',
+    'new',
+]
+<BLANKLINE>
+>>> print add_to_sequence("SEQUENCE = get_sequence()\n", 'new')
+None
+
+# Create an app package with no evolutions.
+>>> temp_dir = tempfile.mkdtemp()
+>>> app_dir = os.path.join(temp_dir, 'hintapp')
+>>> os.mkdir(app_dir)
+>>> open(os.path.join(app_dir, '__init__.py'), 'w').close()
+>>> open(os.path.join(app_dir, 'models.py'), 'w').close()
+>>> sys.path.insert(0, temp_dir)
+>>> from hintapp import models as hintapp
+
+# The first evolution creates the evolutions package.
+>>> label, filename = write_hinted_evolution(hintapp, [
+...     AddField('Author', 'age', models.IntegerField, null=True),
+... ])
+>>> label
+'add_field_author_age'
+>>> filename == os.path.join(app_dir, 'evolutions', label + '.py')
+True
+>>> print open(filename).read()
+from django_evolution.mutations import *
+from django.db import models
+<BLANKLINE>
+MUTATIONS = [
+    AddField('Author', 'age', models.IntegerField, null=True)
+]
+<BLANKLINE>
+>>> get_evolution_sequence(hintapp)
+['add_field_author_age']
+
+# Later evolutions are appended, with unique labels.
+>>> write_hinted_evolution(hintapp, [
+...     AddField('Author', 'age', models.IntegerField, null=True),
+... ])[0]
+'add_field_author_age_2'
+>>> write_hinted_evolution(hintapp, [
+...     AddField('Author', 'age', models.IntegerField, null=True),
+...     DeleteField('Author', 'name'),
+...     DeleteField('Author', 'email'),
+... ])[0]
+'add_field_author_age_delete_field_author_name_and_more'
+>>> del sys.modules['hintapp.evolutions']
+>>> get_evolution_sequence(hintapp)
+['add_field_author_age', 'add_field_author_age_2', 'add_field_author_age_delete_field_author_name_and_more']
+>>> sorted([name for name in os.listdir(os.path.join(app_dir, 'evolutions'))
+...         if name.endswith('.py')])
+['__init__.py', 'add_field_author_age.py', 'add_field_author_age_2.py', 'add_field_author_age_delete_field_author_name_and_more.py']
+
+# Rewritten files keep their permissions, and new files follow the umask.
+>>> import stat
+>>> evolutions_dir = os.path.join(app_dir, 'evolutions')
+>>> init_filename = os.path.join(evolutions_dir, '__init__.py')
+>>> os.chmod(init_filename, 0640)
+>>> old_umask = os.umask(022)
+>>> label = write_hinted_evolution(hintapp, [
+...     DeleteField('Author', 'age'),
+... ])[0]
+>>> umask = os.umask(old_umask)
+>>> oct(stat.S_IMODE(os.stat(init_filename).st_mode))
+'0640'
+>>> oct(stat.S_IMODE(os.stat(os.path.join(evolutions_dir,
+...                                       label + '.py')).st_mode))
+'0644'
+
+# Evolutions needing a user-specified value aren't written.
+>>> from django_evolution.diff import NullFieldInitialCallback
+>>> write_hinted_evolution(hintapp, [
+...     AddField('Author', 'height', models.IntegerField,
+...              initial=NullFieldInitialCallback('hintapp', 'Author',
+...                                               'height')),
+... ])
+Traceback (most recent call last):
+...
+EvolutionException: The evolution for hintapp requires a user-specified initial value, and must be written by hand.
+
+# Clean up after the test.
+>>> sys.path.remove(temp_dir)
+>>> for name in sys.modules.keys():
+...     if name.startswith('hintapp'):
+...         del sys.modules[name]
+>>> shutil.rmtree(temp_dir)
+"""
@@ -0,0 +1,143 @@
+"""
+Back-pressure for long-running evolutions.
+
+A back-pressure callback is called with the name of the database being
+evolved, and returns the number of seconds to wait before doing more work
+(or 0 or None to carry on). Returning a short delay slows an evolution down,
+and returning a delay until the pressure goes away pauses it.
+
+Data mutations consult the callback between chunks of rows, after each chunk
+has been committed, so no locks are held while waiting.
+"""
+import os
+import time
+
+from django.db import connection
+
+from django_evolution import EvolutionException, is_multi_db
+from django_evolution.signals import run_operation, timer
+
+
+# The number of seconds to wait before checking the pressure again.
+DEFAULT_DELAY = 5
+
+
+class FileBackPressure(object):
+    """
+    Reports pressure while a file exists.
+
+    If the file contains a number, that's the number of seconds to wait.
+    Otherwise, the default delay is used. This makes it easy to pause or
+    slow down an evolution from a shell or a monitoring script.
+    """
+    def __init__(self, path, delay=DEFAULT_DELAY):
+        self.path = path
+        self.delay = delay
+
+    def __call__(self, database):
+        try:
+            f = open(self.path, 'r')
+        except IOError:
+            return 0
+
+        try:
+            contents = f.read().strip()
+        finally:
+            f.close()
+
+        try:
+            return float(contents)
+        except ValueError:
+            return self.delay
+
+
+class QueryBackPressure(object):
+    """
+    Reports pressure while a probe query returns more than a threshold.
+
+    The query is run against the database being evolved, and must return
+    a single number, such as the replication lag in seconds or the number
+    of active connections.
+    """
+    def __init__(self, sql, threshold, delay=DEFAULT_DELAY):
+        self.sql = sql
+        self.threshold = threshold
+        self.delay = delay
+
+    def __call__(self, database):
+        if is_multi_db():
+            from django.db import connections
+            cursor = connections[database].cursor()
+        else:
+            cursor = connection.cursor()
+
+        try:
+            cursor.execute(self.sql)
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+
+        if row is None or row[0] is None:
+            return 0
+
+        if float(row[0]) > self.threshold:
+            return self.delay
+
+        return 0
+
+
+def load_back_pressure(path):
+    "Import a back-pressure callback, given its full Python path"
+    try:
+        module_name, attr_name = path.rsplit('.', 1)
+        module = __import__(module_name, {}, {}, [attr_name])
+        return getattr(module, attr_name)
+    except (ImportError, AttributeError, ValueError), e:
+        raise EvolutionException(
+            'Unable to load the back-pressure callback %s: %s' % (path, e))
+
+
+class CombinedBackPressure(object):
+    "Reports the longest delay reported by any of several callbacks"
+    def __init__(self, callbacks):
+        self.callbacks = callbacks
+
+    def __call__(self, database):
+        return max([0] + [
+            callback(database) or 0
+            for callback in self.callbacks
+        ])
+
+
+class Throttle(object):
+    """
+    Pauses execution while a back-pressure callback reports pressure.
+
+    The time spent waiting is totalled for the execution report, and each
+    pause is sent as a 'throttle' operation.
+    """
+    def __init__(self, back_pressure, sleep=time.sleep):
+        self.back_pressure = back_pressure
+        self.sleep = sleep
+        self.total_time = 0.0
+        self.num_pauses = 0
+
+    def wait(self, database=None):
+        "Wait until there's no pressure, returning the time spent waiting"
+        waited = 0.0
+
+        while True:
+            delay = self.back_pressure(database)
+
+            if not delay or delay < 0:
+                break
+
+            start_time = timer()
+            run_operation('throttle', {'database': database}, self.sleep,
+                          delay)
+            waited += timer() - start_time
+            self.num_pauses += 1
+
+        self.total_time += waited
+
+        return waited
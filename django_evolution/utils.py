@@ -11,13 +11,40 @@ def write_sql(sql, database):
             print unicode(statement)
 
 
-def execute_sql(cursor, sql):
+def execute_sql(cursor, sql, throttle=None, start=0, on_commit=None):
     """
     Execute a list of SQL statements on the provided cursor, unrolling
-    parameters as required
+    parameters as required. Steps that aren't SQL (such as data mutations)
+    are called with the cursor and the throttle, if any. A step can set an
+    execution_note describing how it ran, which evolve reports.
+
+    Steps that set commit_boundary (such as CommitSQL and data mutations)
+    commit the statements executed before them, and are committed once
+    they've run. At each commit, on_commit is called with the number of
+    statements completed so far, so that the progress can be recorded
+    along with the changes. It's then responsible for committing. Without
+    it, the cursor's connection is committed. Statements before start
+    are skipped, to resume a list that was partly committed before.
     """
-    for statement in sql:
-        if isinstance(statement, tuple):
+    if on_commit is None:
+        def on_commit(num_completed):
+            cursor.connection.commit()
+
+    for i, statement in enumerate(sql):
+        if i < start:
+            continue
+
+        if callable(statement):
+            commit_boundary = getattr(statement, 'commit_boundary', False)
+
+            if commit_boundary:
+                on_commit(i)
+
+            statement(cursor, throttle)
+
+            if commit_boundary:
+                on_commit(i + 1)
+        elif isinstance(statement, tuple):
             if not statement[0].startswith('--'):
                 cursor.execute(*statement)
         else:
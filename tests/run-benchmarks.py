@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+#
+# Utility script to benchmark the parts of Django Evolution that scale with
+# the size of a project.
+#
+# Usage: ./tests/run-benchmarks.py [benchmark_name ...]
+
+import os
+import sys
+import time
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle as pickle
+
+
+# The size of the synthetic project used by the benchmarks.
+NUM_APPS = 40
+NUM_MODELS = 20
+NUM_FIELDS = 15
+
+# The number of times each operation is repeated.
+NUM_RUNS = 5
+
+# The number of rows in the table changed by the shadow_table benchmark.
+NUM_SHADOW_TABLE_ROWS = 200000
+
+# Writes taking longer than this many seconds are counted as blocked.
+BLOCKED_WRITE_THRESHOLD = 0.1
+
+
+def create_large_project_sig():
+    "Create a synthetic project signature with a realistic mix of fields"
+    from django.db import models
+    from django.utils.datastructures import SortedDict
+
+    field_sigs = [
+        {'field_type': models.CharField, 'max_length': 100},
+        {'field_type': models.IntegerField},
+        {'field_type': models.TextField, 'null': True},
+        {'field_type': models.BooleanField},
+        {'field_type': models.DateTimeField, 'db_index': True},
+        {'field_type': models.DecimalField, 'max_digits': 10,
+         'decimal_places': 2},
+        {'field_type': models.ForeignKey, 'related_model': 'app0.Model0'},
+        {'field_type': models.ManyToManyField, 'related_model': 'app0.Model1'},
+    ]
+
+    proj_sig = {
+        '__version__': 1,
+    }
+
+    for app_num in range(NUM_APPS):
+        app_label = 'app%d' % app_num
+        app_sig = SortedDict()
+
+        for model_num in range(NUM_MODELS):
+            fields = {
+                'id': {
+                    'field_type': models.AutoField,
+                    'primary_key': True,
+                },
+            }
+
+            for field_num in range(NUM_FIELDS):
+                fields['field%d' % field_num] = \
+                    field_sigs[field_num % len(field_sigs)].copy()
+
+            app_sig['Model%d' % model_num] = {
+                'meta': {
+                    'db_table': '%s_model%d' % (app_label, model_num),
+                    'db_tablespace': '',
+                    'pk_column': 'id',
+                    'unique_together': [],
+                },
+                'fields': fields,
+            }
+
+        proj_sig[app_label] = app_sig
+
+    return proj_sig
+
+
+def time_call(func, *args, **kwargs):
+    "Return the best time, in milliseconds, of several runs of a function"
+    best = None
+
+    for i in range(NUM_RUNS):
+        start = time.time()
+        func(*args, **kwargs)
+        elapsed = (time.time() - start) * 1000
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def benchmark_signature_serialization():
+    "Compare the stored signature formats"
+    from django_evolution.signature import serialize_signature, \
+                                           deserialize_signature
+
+    proj_sig = create_large_project_sig()
+
+    print 'Project: %d apps, %d models per app, %d fields per model' \
+          % (NUM_APPS, NUM_MODELS, NUM_FIELDS)
+    print
+
+    formats = [
+        ('pickle (protocol 0)',
+         lambda sig: pickle.dumps(sig)),
+        ('json',
+         lambda sig: serialize_signature(sig, compress=False)),
+        ('json, compressed',
+         lambda sig: serialize_signature(sig, compress=True)),
+    ]
+
+    print '%-24s %12s %12s %12s' % ('Format', 'Size (KB)', 'Dump (ms)',
+                                    'Load (ms)')
+
+    for name, dump in formats:
+        data = dump(proj_sig)
+
+        if name.startswith('pickle'):
+            load = pickle.loads
+        else:
+            load = deserialize_signature
+
+        print '%-24s %12.1f %12.2f %12.2f' % (name, len(data) / 1024.0,
+                                              time_call(dump, proj_sig),
+                                              time_call(load, data))
+
+
+def create_benchmark_models(num_fields=5000, fields_per_model=20):
+    "Create models with the given number of fields in total"
+    from django.db import models
+
+    class Meta:
+        app_label = 'benchmarks'
+
+    anchor = type('Anchor', (models.Model,), {
+        '__module__': __name__,
+        'Meta': Meta,
+    })
+
+    field_factories = [
+        lambda: models.CharField(max_length=100),
+        lambda: models.IntegerField(db_index=True),
+        lambda: models.TextField(null=True),
+        lambda: models.BooleanField(default=False),
+        lambda: models.DateTimeField(auto_now_add=True),
+        lambda: models.DecimalField(max_digits=10, decimal_places=2),
+        lambda: models.ForeignKey(anchor, related_name='+'),
+        lambda: models.ManyToManyField(anchor, related_name='+'),
+    ]
+
+    model_list = []
+
+    for model_num in range(num_fields / fields_per_model):
+        attrs = {
+            '__module__': __name__,
+            'Meta': Meta,
+        }
+
+        for field_num in range(fields_per_model):
+            attrs['field%d' % field_num] = \
+                field_factories[field_num % len(field_factories)]()
+
+        model_list.append(type('Model%d' % model_num, (models.Model,),
+                               attrs))
+
+    return model_list
+
+
+def benchmark_field_signatures():
+    "Generate field signatures for a 5,000 field project"
+    from django.db.models.fields.related import ForeignKey
+    from django_evolution.signature import ATTRIBUTE_ALIASES, \
+                                           ATTRIBUTE_DEFAULTS, \
+                                           create_field_sig
+
+    def create_field_sig_unplanned(field):
+        # The original implementation, which checks every attribute for
+        # every field.
+        field_sig = {
+            'field_type': field.__class__,
+        }
+
+        for attrib in ATTRIBUTE_DEFAULTS.keys():
+            alias = ATTRIBUTE_ALIASES.get(attrib, attrib)
+
+            if hasattr(field, alias):
+                value = getattr(field, alias)
+
+                if isinstance(field, ForeignKey) and attrib == 'db_index':
+                    default = True
+                else:
+                    default = ATTRIBUTE_DEFAULTS[attrib]
+
+                if default != value:
+                    field_sig[attrib] = value
+
+        rel = field_sig.pop('rel', None)
+
+        if rel:
+            field_sig['related_model'] = \
+                '.'.join([rel.to._meta.app_label, rel.to._meta.object_name])
+
+        return field_sig
+
+    fields = []
+
+    for model in create_benchmark_models():
+        fields.extend(model._meta.local_fields +
+                      model._meta.local_many_to_many)
+
+    def run(func):
+        for field in fields:
+            func(field)
+
+    print '%-24s %12s' % ('Implementation', 'Time (ms)')
+    print '%-24s %12.2f' % ('per-attribute checks',
+                            time_call(run, create_field_sig_unplanned))
+    print '%-24s %12.2f' % ('per-class plan', time_call(run, create_field_sig))
+
+
+def get_field_sigs_size(proj_sig):
+    """
+    Return the memory, in bytes, used by the field signatures of a project
+    signature. Attribute tuples shared by several signatures are only
+    counted once.
+    """
+    from django_evolution.signature import FieldSignature
+
+    size = 0
+    seen = set()
+
+    for app_label, app_sig in proj_sig.items():
+        if app_label == '__version__':
+            continue
+
+        for model_sig in app_sig.values():
+            for field_sig in model_sig['fields'].values():
+                size += sys.getsizeof(field_sig)
+
+                if isinstance(field_sig, FieldSignature):
+                    items = field_sig._items
+
+                    if id(items) not in seen:
+                        seen.add(id(items))
+                        size += sys.getsizeof(items)
+                        size += sum([sys.getsizeof(item) for item in items])
+
+    return size
+
+
+def benchmark_signature_memory():
+    "Compare dictionaries and FieldSignatures for storing field signatures"
+    import copy
+
+    from django_evolution.signature import FieldSignature
+
+    dict_sig = create_large_project_sig()
+    slotted_sig = copy.deepcopy(dict_sig)
+
+    for app_label, app_sig in slotted_sig.items():
+        if app_label != '__version__':
+            for model_sig in app_sig.values():
+                fields = model_sig['fields']
+
+                for field_name, field_sig in fields.items():
+                    fields[field_name] = FieldSignature(field_sig)
+
+    print 'Project: %d apps, %d models per app, %d fields per model' \
+          % (NUM_APPS, NUM_MODELS, NUM_FIELDS)
+    print
+
+    print '%-24s %12s %12s' % ('Field signatures', 'Size (KB)',
+                               'Copy (ms)')
+
+    for name, proj_sig in (('dict', dict_sig),
+                           ('FieldSignature', slotted_sig)):
+        print '%-24s %12.1f %12.2f' % (name,
+                                       get_field_sigs_size(proj_sig) / 1024.0,
+                                       time_call(copy.deepcopy, proj_sig))
+
+
+def benchmark_signature_overlay():
+    "Compare deep copies and overlays for simulating a few mutations"
+    import copy
+
+    from django.db import models
+    from django_evolution.diff import Diff
+    from django_evolution.mutations import AddField, ChangeField, \
+                                           DeleteField
+    from django_evolution.signature import SignatureOverlay
+
+    proj_sig = create_large_project_sig()
+    mutations = [
+        AddField('Model0', 'added', models.IntegerField, null=True),
+        ChangeField('Model1', 'field0', max_length=200),
+        DeleteField('Model2', 'field1'),
+    ]
+
+    def simulate(copy_sig):
+        test_sig = copy_sig(proj_sig)
+
+        for mutation in mutations:
+            mutation.simulate('app0', test_sig)
+
+        return test_sig
+
+    print 'Project: %d apps, %d models per app, %d fields per model' \
+          % (NUM_APPS, NUM_MODELS, NUM_FIELDS)
+    print
+
+    print '%-24s %14s %12s' % ('Signature copy', 'Simulate (ms)',
+                               'Diff (ms)')
+
+    for name, copy_sig in (('copy.deepcopy', copy.deepcopy),
+                           ('SignatureOverlay', SignatureOverlay)):
+        test_sig = simulate(copy_sig)
+        print '%-24s %14.2f %12.2f' % (name,
+                                       time_call(simulate, copy_sig),
+                                       time_call(Diff, proj_sig, test_sig))
+
+
+def get_mysql_settings():
+    """
+    Return the settings for the MySQL database used by the shadow_table
+    benchmark. These come from the MYSQL_HOST, MYSQL_PORT, MYSQL_USER,
+    MYSQL_PASSWORD and MYSQL_DATABASE environment variables. The database
+    must already exist.
+    """
+    return {
+        'ENGINE': 'django.db.backends.mysql',
+        'NAME': os.environ.get('MYSQL_DATABASE',
+                               'django_evolution_benchmark'),
+        'HOST': os.environ.get('MYSQL_HOST', ''),
+        'PORT': os.environ.get('MYSQL_PORT', ''),
+        'USER': os.environ.get('MYSQL_USER', 'root'),
+        'PASSWORD': os.environ.get('MYSQL_PASSWORD', ''),
+        'OPTIONS': {},
+    }
+
+
+def time_blocked_writes(db_connection, change_table, table_name):
+    """
+    Change a table while another connection updates random rows in it.
+    Returns the time taken by the change, and the timings of the writes.
+    """
+    import random
+    import threading
+
+    write_timings = []
+    stopped = []
+
+    def write():
+        cursor = db_connection.cursor()
+
+        while not stopped:
+            start = time.time()
+            cursor.execute('UPDATE `%s` SET `name` = `name`'
+                           ' WHERE `id` = %%s' % table_name,
+                           [random.randint(1, NUM_SHADOW_TABLE_ROWS)])
+            cursor.connection.commit()
+            write_timings.append(time.time() - start)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+
+    try:
+        time.sleep(0.5)
+        start = time.time()
+        change_table()
+        change_time = time.time() - start
+        time.sleep(0.5)
+    finally:
+        stopped.append(True)
+        writer.join()
+
+    return change_time, write_timings
+
+
+def benchmark_shadow_table():
+    "Compare the time writes are blocked by a table copy and a shadow table"
+    from django.core.exceptions import ImproperlyConfigured
+
+    try:
+        from django.db.backends.mysql.base import DatabaseWrapper
+    except ImproperlyConfigured, e:
+        print 'Skipped: %s' % e
+        return
+
+    from django.db import connections, transaction
+    from django_evolution.db.mysql import ShadowTableCopy
+
+    # ShadowTableCopy commits through Django's transaction management, so
+    # the connection it uses is added to the configured databases.
+    db_settings = get_mysql_settings()
+    connections.databases['benchmark'] = db_settings
+    db_connection = connections['benchmark']
+    writer_connection = DatabaseWrapper(db_settings, 'benchmark_writer')
+    table_name = 'benchmark_shadow_table'
+
+    cursor = db_connection.cursor()
+    cursor.execute('DROP TABLE IF EXISTS `%s`' % table_name)
+    cursor.execute('CREATE TABLE `%s` ('
+                   '    `id` integer AUTO_INCREMENT NOT NULL PRIMARY KEY,'
+                   '    `name` varchar(20) NOT NULL,'
+                   '    `value` integer NOT NULL'
+                   ') ENGINE=InnoDB' % table_name)
+    cursor.execute("INSERT INTO `%s` (`name`, `value`) VALUES ('row', 1)"
+                   % table_name)
+    num_rows = 1
+
+    while num_rows < NUM_SHADOW_TABLE_ROWS:
+        cursor.execute('INSERT INTO `%s` (`name`, `value`)'
+                       ' SELECT `name`, `value` FROM `%s` LIMIT %d'
+                       % (table_name, table_name,
+                          NUM_SHADOW_TABLE_ROWS - num_rows))
+        num_rows += cursor.rowcount
+
+    cursor.connection.commit()
+
+    def copy_table():
+        cursor.execute('ALTER TABLE `%s` MODIFY COLUMN `value` bigint'
+                       ' NOT NULL, ALGORITHM=COPY, LOCK=SHARED'
+                       % table_name)
+
+    shadow_table_copy = ShadowTableCopy(
+        table_name, 'MODIFY COLUMN `value` integer NOT NULL', db_connection)
+
+    def shadow_copy_table():
+        transaction.enter_transaction_management(using='benchmark')
+        transaction.managed(True, using='benchmark')
+
+        try:
+            shadow_table_copy(cursor)
+            transaction.commit(using='benchmark')
+        finally:
+            transaction.leave_transaction_management(using='benchmark')
+
+    print 'Table: %d rows. Writes over %d ms are counted as blocked.' \
+          % (NUM_SHADOW_TABLE_ROWS, BLOCKED_WRITE_THRESHOLD * 1000)
+    print
+
+    print '%-24s %10s %8s %16s %12s' % ('Method', 'Time (s)', 'Writes',
+                                        'Longest (ms)', 'Blocked (s)')
+
+    try:
+        for name, change_table in (
+            ('ALTER TABLE (COPY)', copy_table),
+            ('ShadowTableCopy', shadow_copy_table)):
+            change_time, write_timings = \
+                time_blocked_writes(writer_connection, change_table,
+                                    table_name)
+            blocked_time = sum([
+                timing
+                for timing in write_timings
+                if timing > BLOCKED_WRITE_THRESHOLD
+            ])
+
+            print '%-24s %10.2f %8d %16.2f %12.2f' % (
+                name, change_time, len(write_timings),
+                max(write_timings) * 1000, blocked_time)
+    finally:
+        cursor.execute('DROP TABLE IF EXISTS `%s`' % table_name)
+
+
+BENCHMARKS = [
+    ('signature_serialization', benchmark_signature_serialization),
+    ('field_signatures', benchmark_field_signatures),
+    ('signature_memory', benchmark_signature_memory),
+    ('signature_overlay', benchmark_signature_overlay),
+    ('shadow_table', benchmark_shadow_table),
+]
+
+
+def main():
+    os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+    sys.path.insert(0, os.getcwd())
+    os.environ['DJANGO_SETTINGS_MODULE'] = "tests.settings"
+
+    names = sys.argv[1:]
+
+    for name, func in BENCHMARKS:
+        if not names or name in names:
+            print '== %s: %s' % (name, func.__doc__)
+            func()
+            print
+
+
+if __name__ == "__main__":
+    main()
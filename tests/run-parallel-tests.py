@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+#
+# Utility script to run the test suite against several database backends at
+# once, sharding the test modules across worker processes.
+#
+# Usage: ./tests/run-parallel-tests.py [options] [test_module ...]
+#
+# Each worker gets its own test databases. The PostgreSQL backend connects
+# using the standard PGHOST/PGPORT/PGUSER/PGPASSWORD environment variables,
+# and the MySQL backend uses MYSQL_HOST/MYSQL_PORT/MYSQL_USER/MYSQL_PASSWORD.
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+
+try:
+    import json as simplejson
+except ImportError:
+    simplejson = None
+
+
+BACKENDS = {
+    'sqlite3': {
+        'ENGINE': 'django.db.backends.sqlite3',
+    },
+    'postgresql': {
+        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'HOST': os.environ.get('PGHOST', ''),
+        'PORT': os.environ.get('PGPORT', ''),
+        'USER': os.environ.get('PGUSER', ''),
+        'PASSWORD': os.environ.get('PGPASSWORD', ''),
+    },
+    'mysql': {
+        'ENGINE': 'django.db.backends.mysql',
+        'HOST': os.environ.get('MYSQL_HOST', ''),
+        'PORT': os.environ.get('MYSQL_PORT', ''),
+        'USER': os.environ.get('MYSQL_USER', 'root'),
+        'PASSWORD': os.environ.get('MYSQL_PASSWORD', ''),
+    },
+}
+
+
+def setup_environment():
+    os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+    sys.path.insert(0, os.getcwd())
+    os.environ['DJANGO_SETTINGS_MODULE'] = "tests.settings"
+
+
+def get_json():
+    global simplejson
+
+    if simplejson is None:
+        from django.utils import simplejson
+
+    return simplejson
+
+
+def configure_databases(backend, worker_id):
+    """
+    Point the test settings at a backend, with database names that are
+    unique to this worker.
+    """
+    from django.conf import settings
+
+    for alias, db_settings in settings.DATABASES.items():
+        db_settings.update(BACKENDS[backend])
+
+        if backend != 'sqlite3':
+            name = 'django_evolution_test_%s_%d' % (alias, worker_id)
+            db_settings['NAME'] = name
+            db_settings['TEST_NAME'] = 'test_%s' % name
+
+    default = settings.DATABASES['default']
+    settings.DATABASE_ENGINE = default['ENGINE'].split('.')[-1]
+    settings.DATABASE_NAME = default['NAME']
+
+
+def run_worker(backend, worker_id, test_modules, results_filename):
+    """
+    Run the given test modules against a backend, writing the results to
+    a file.
+    """
+    configure_databases(backend, worker_id)
+
+    import doctest
+    import unittest
+
+    from django.core import management
+    from django.db import connections
+    from django.test.utils import setup_test_environment, \
+                                  teardown_test_environment
+
+    setup_test_environment()
+
+    start = time.time()
+    old_db_names = []
+
+    for alias in connections:
+        connection = connections[alias]
+        old_db_names.append((connection, connection.settings_dict['NAME']))
+        connection.creation.create_test_db(0, autoclobber=True)
+
+    management.call_command('syncdb', verbosity=0, interactive=False)
+    setup_time = time.time() - start
+
+    from django_evolution import tests
+
+    suite = doctest.DocTestSuite(tests)
+    test_cases = {}
+
+    for test_case in suite:
+        test_cases[test_case.id().split('.')[-1]] = test_case
+
+    results = []
+
+    for test_module in test_modules:
+        result = unittest.TestResult()
+        start = time.time()
+        test_cases[test_module].run(result)
+
+        results.append({
+            'module': test_module,
+            'time': time.time() - start,
+            'failures': [
+                text
+                for test_case, text in result.failures + result.errors
+            ],
+        })
+
+    for connection, name in old_db_names:
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+    teardown_test_environment()
+
+    f = open(results_filename, 'w')
+
+    try:
+        f.write(get_json().dumps({
+            'backend': backend,
+            'worker': worker_id,
+            'setup_time': setup_time,
+            'results': results,
+        }))
+    finally:
+        f.close()
+
+
+def get_test_modules():
+    "Return the names of the test modules for the configured backends"
+    from django_evolution import tests
+
+    return sorted(tests.__test__.keys())
+
+
+def run_parallel(backends, num_workers, test_modules):
+    """
+    Shard the test modules across workers for each backend, and print a
+    merged report. Returns whether all tests passed.
+    """
+    workers = []
+    start = time.time()
+
+    for backend in backends:
+        for worker_id in range(min(num_workers, len(test_modules))):
+            fd, results_filename = tempfile.mkstemp(prefix='evolution-tests-')
+            os.close(fd)
+
+            # Worker output goes to a file, so that a chatty worker can't
+            # block on a full pipe.
+            output_file = tempfile.TemporaryFile()
+            shard = test_modules[worker_id::num_workers]
+
+            p = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__),
+                 '--worker', str(worker_id), '--backends', backend,
+                 '--results', results_filename] + shard,
+                stdout=output_file,
+                stderr=subprocess.STDOUT)
+
+            workers.append((backend, worker_id, p, output_file,
+                            results_filename))
+
+    reports = []
+    all_passed = True
+
+    for backend, worker_id, p, output_file, results_filename in workers:
+        p.wait()
+        output_file.seek(0)
+        output = output_file.read()
+        output_file.close()
+
+        try:
+            f = open(results_filename, 'r')
+
+            try:
+                data = f.read()
+            finally:
+                f.close()
+        finally:
+            os.unlink(results_filename)
+
+        if p.returncode != 0 or not data:
+            all_passed = False
+            print '== %s worker %d failed to run (exit status %s):' \
+                  % (backend, worker_id, p.returncode)
+            print output
+            continue
+
+        reports.append(get_json().loads(data))
+
+    elapsed = time.time() - start
+    total_time = 0
+    failures = []
+
+    print '%-12s %-20s %6s %10s  %s' % ('Backend', 'Module', 'Worker',
+                                        'Time (s)', 'Result')
+
+    for report in reports:
+        total_time += report['setup_time']
+
+        for result in report['results']:
+            total_time += result['time']
+
+            if result['failures']:
+                status = 'FAILED'
+                failures.append((report['backend'], result))
+            else:
+                status = 'ok'
+
+            print '%-12s %-20s %6d %10.2f  %s' % (report['backend'],
+                                                  result['module'],
+                                                  report['worker'],
+                                                  result['time'], status)
+
+    for backend, result in failures:
+        all_passed = False
+
+        for text in result['failures']:
+            print
+            print '== %s: %s' % (backend, result['module'])
+            print text
+
+    print
+    print 'Ran %d test module(s) on %d backend(s) in %.2fs (%.2fs in ' \
+          'workers, including database setup).' \
+          % (len(test_modules), len(backends), elapsed, total_time)
+
+    if all_passed:
+        print 'OK'
+    else:
+        print 'FAILED'
+
+    return all_passed
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] [test_module ...]')
+    parser.add_option('--backends', dest='backends', default='sqlite3',
+                      help='Comma-separated list of backends to test '
+                           '(%s). Defaults to sqlite3.'
+                           % ', '.join(sorted(BACKENDS.keys())))
+    parser.add_option('-j', '--workers', dest='workers', type='int',
+                      default=4,
+                      help='The number of worker processes per backend.')
+    parser.add_option('--worker', dest='worker_id', type='int',
+                      help='Run as a worker with the given ID (internal).')
+    parser.add_option('--results', dest='results',
+                      help='The file a worker writes its results to '
+                           '(internal).')
+    options, test_modules = parser.parse_args()
+
+    backends = options.backends.split(',')
+
+    for backend in backends:
+        if backend not in BACKENDS:
+            parser.error('Unknown backend "%s"' % backend)
+
+    setup_environment()
+
+    if options.worker_id is not None:
+        run_worker(backends[0], options.worker_id, test_modules,
+                   options.results)
+        return
+
+    all_test_modules = get_test_modules()
+
+    for test_module in test_modules:
+        if test_module not in all_test_modules:
+            parser.error('Unknown test module "%s"' % test_module)
+
+    if not test_modules:
+        test_modules = all_test_modules
+
+    if not run_parallel(backends, max(options.workers, 1), test_modules):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()